@@ -1,2 +1,8 @@
 from .controllers import *
 from .train_analysis import *
+from .inference_server import ActorInferenceServer, ActorClient, parallel_rollouts
+from .replay_buffer import MemmapReplayBuffer, memmap_replay_buffer
+from .ddpg import train_ddpg
+from .training_index import TrainingLogIndex, parse_run_name
+from .codegen import export_actor, check_actor, KernelHarness
+from .quantization import QuantizedActor, quantization_report
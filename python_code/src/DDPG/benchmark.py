@@ -0,0 +1,173 @@
+"""
+Benchmark of the trained controllers: every pyt_save/model.pt under a root directory is loaded once and replayed with
+the simulate method of its environement on a fixed set of target trajectories, in a pool of worker processes. The
+results are ranked by mean loss.
+
+    python -m src.DDPG.benchmark --root src/data --workers 4 --output src/data/results/benchmark_results.csv
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .training_index import RESULTS_DIR, parse_run_name
+from ..ball_balancer.environement import BBEnv, BBEnvPid, BBEnv1D, BBEnvPid1D, BBEnvNoIntegral, BBEnvPidNoIntegral
+from ..ball_balancer.trajectories import mixed_trajectory_batch
+
+# Controller directory -> environement of its controllers
+CONTROLLER_ENVIRONEMENTS: Dict[str, type] = {
+    'black_box_controller': BBEnv,
+    'dyn_pid_controller': BBEnvPid,
+    'black_box_controller_1d': BBEnv1D,
+    'dyn_pid_controller_1d': BBEnvPid1D,
+    'black_box_controller_no_integral': BBEnvNoIntegral,
+    'dyn_pid_controller_no_integral': BBEnvPidNoIntegral,
+}
+ONE_D_ENVIRONEMENTS = (BBEnv1D, BBEnvPid1D)
+
+# Trajectories and environements of a worker process, set by the pool initializer
+_worker_trajectories: Optional[np.ndarray] = None
+_worker_environements: Dict[str, object] = {}
+
+
+def find_checkpoints(root: str = 'src/data', pattern: str = '**') -> List[str]:
+    """
+    :param pattern: Glob of the run directories relative to root, 'black_box_controller/e_r/*'
+    :return: Sorted paths of the pyt_save/model.pt of the runs
+    """
+    return sorted(glob.glob(os.path.join(glob.escape(root), pattern, 'pyt_save', 'model.pt'), recursive=True))
+
+
+def controller_type(path: str, root: str) -> str:
+    return os.path.relpath(path, root).replace(os.sep, '/').split('/')[0]
+
+
+def benchmark_trajectories(n_trajectories: int = 16, duration: float = 30., seed: int = 0,
+                           benchmark_path: str = 'src/data/benchmark_trajectory.json') -> np.ndarray:
+    """
+    Target trajectories of the benchmark: the one of benchmark_trajectory.json (cut to duration) and a mixed batch
+    :return: (N, 2, T) trajectories
+    """
+    trajectories = mixed_trajectory_batch(n_trajectories, duration, seed)
+    if benchmark_path and os.path.exists(benchmark_path):
+        with open(benchmark_path) as json_file:
+            target = np.array(json.load(json_file)['target'])[:, :trajectories.shape[2]]
+        trajectories = np.concatenate([np.pad(target, ((0, 0), (0, trajectories.shape[2] - target.shape[1])),
+                                              mode='edge')[None], trajectories])
+    return trajectories
+
+
+def rollout_metrics(env, model, target_trajectory: np.ndarray) -> Dict[str, float]:
+    """
+    Loss, RMS error, control effort (RMS angle command and mean command variation) and wall time of one rollout
+    """
+    if isinstance(env, ONE_D_ENVIRONEMENTS):
+        target_trajectory = target_trajectory[0]
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = env.simulate(model, target_trajectory)
+    wall_time = time.perf_counter() - start
+    error, u, grade = outputs[1], outputs[2], outputs[4]
+    return {'loss': float(grade), 'rms_error': float(np.sqrt(np.mean(np.square(error)))),
+            'control_effort': float(np.sqrt(np.mean(np.square(u)))),
+            'control_variation': float(np.mean(np.abs(np.diff(u, axis=-1)))), 'rollout_time': wall_time}
+
+
+def _init_worker(trajectories: np.ndarray):
+    global _worker_trajectories
+    torch.set_num_threads(1)
+    _worker_trajectories = trajectories
+
+
+def error_result(exception: Exception) -> Dict[str, str]:
+    return {'error': '{}: {}'.format(type(exception).__name__, exception)}
+
+
+def _worker_evaluate(path: str, kind: str) -> Dict[str, float]:
+    if kind not in _worker_environements:
+        try:
+            _worker_environements[kind] = CONTROLLER_ENVIRONEMENTS[kind]()
+        except Exception as exception:
+            return error_result(exception)
+    return evaluate_checkpoint(path, _worker_environements[kind], _worker_trajectories)
+
+
+def evaluate_checkpoint(path: str, env, trajectories: np.ndarray) -> Dict[str, float]:
+    """
+    Mean metrics of a checkpoint over the trajectories, the error message if it cannot be loaded or replayed
+    """
+    try:
+        model = torch.load(path, weights_only=False)
+        metrics = pd.DataFrame([rollout_metrics(env, model, trajectory) for trajectory in trajectories])
+    except Exception as exception:
+        return error_result(exception)
+    result = metrics.mean().to_dict()
+    result['worst_loss'] = float(metrics['loss'].min())
+    return result
+
+
+def run_benchmark(root: str = 'src/data', pattern: str = '**', trajectories: np.ndarray = None, n_workers: int = 1,
+                  output_path: str = None) -> pd.DataFrame:
+    """
+    Evaluate all the checkpoints of root whose controller type has an environement
+    :param trajectories: (N, 2, T) targets, benchmark_trajectories() if None
+    :param n_workers: Number of worker processes, one per core if None, evaluated in this process if 1
+    :param output_path: CSV of the ranked table, its directory is created
+    :return: Metadata and mean metrics of the runs, best mean loss first
+    """
+    trajectories = benchmark_trajectories() if trajectories is None else trajectories
+    paths = [path for path in find_checkpoints(root, pattern) if controller_type(path, root) in
+             CONTROLLER_ENVIRONEMENTS]
+    kinds = [controller_type(path, root) for path in paths]
+
+    if n_workers == 1:
+        _init_worker(trajectories)
+        results = [_worker_evaluate(path, kind) for path, kind in zip(paths, kinds)]
+    else:
+        with ProcessPoolExecutor(n_workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(trajectories,)) as pool:
+            results = list(pool.map(_worker_evaluate, paths, kinds))
+
+    rows = []
+    for path, kind, result in zip(paths, kinds, results):
+        run_dir = os.path.dirname(os.path.dirname(path))
+        group = os.path.relpath(os.path.dirname(run_dir), root).replace(os.sep, '/')
+        rows.append(dict(parse_run_name(os.path.basename(run_dir)), controller=kind, group=group, path=path,
+                         **result))
+    table = pd.DataFrame(rows)
+    if 'loss' in table:
+        table = table.sort_values('loss', ascending=False, na_position='last').reset_index(drop=True)
+    table.index.name = 'rank'
+    if output_path is not None:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        table.to_csv(output_path)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the trained controllers')
+    parser.add_argument('--root', default='src/data')
+    parser.add_argument('--pattern', default='**', help='Glob of the run directories relative to root')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, one per core by default')
+    parser.add_argument('--trajectories', type=int, default=16, help='Number of generated trajectories')
+    parser.add_argument('--duration', type=float, default=30., help='Duration of the trajectories in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'benchmark_results.csv'))
+    args = parser.parse_args()
+
+    trajectories = benchmark_trajectories(args.trajectories, args.duration, args.seed)
+    table = run_benchmark(args.root, args.pattern, trajectories, args.workers, args.output)
+    columns = [column for column in ('name', 'group', 'loss', 'rms_error', 'control_effort', 'rollout_time', 'error')
+               if column in table]
+    print(table[columns].to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Export of the trained actors to the C++ kernels of cpp_code (blackbox.cpp, dyn_pid.cpp). The header holds the layer
+sizes and the weights (pi_w1, pi_b1, ... as in blackbox.h) for any depth, the kernel computes the actor output without
+act_limit, as get_act of the hand written kernels. Two kernel variants are generated:
+    - reference: the loops of blackbox.cpp, long double exp / tanh
+    - float32: float only, bias, weights and activation fused in one pass over every neuron
+KernelHarness compiles a kernel, checks it against the torch actor and measures the latency of a control step.
+"""
+import ctypes
+import os
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from ..constants import DT
+
+# Activation modules of the actors -> name used by the code generator
+ACTIVATIONS: Dict[type, str] = {
+    torch.nn.ReLU: 'relu',
+    torch.nn.Tanh: 'tanh',
+    torch.nn.Sigmoid: 'sigmoid',
+    torch.nn.Identity: 'identity',
+}
+REFERENCE_ACTIVATIONS: Dict[str, str] = {
+    'relu': '{0} = std::max({0}, (float) 0); // relu',
+    'tanh': '{0} = std::tanh((long double) {0}); // tanh',
+    'sigmoid': '{0} = 1 / (1 + std::exp((long double) -{0})); // sigmoid',
+    'identity': '',
+}
+FLOAT_ACTIVATIONS: Dict[str, str] = {
+    'relu': 'sum > 0.f ? sum : 0.f',
+    'tanh': 'std::tanh(sum)',
+    'sigmoid': '1.f / (1.f + std::exp(-sum))',
+    'identity': 'sum',
+}
+
+
+def activate(x: np.ndarray, activation: str) -> np.ndarray:
+    if activation == 'relu':
+        return np.maximum(x, 0.)
+    if activation == 'tanh':
+        return np.tanh(x)
+    if activation == 'sigmoid':
+        # exp overflows to inf for the saturated neurons, the output is then 0
+        with np.errstate(over='ignore'):
+            return 1. / (1. + np.exp(-x))
+    return x
+
+
+# Weight types of the header, float16 and int8 for the quantized actors
+C_TYPES: Dict[type, str] = {
+    np.float32: 'float',
+    np.float16: 'half_t',
+    np.int8: 'signed char',
+}
+
+
+class Layer:
+    def __init__(self, weight: np.ndarray, bias: Optional[np.ndarray], activation: str, scale: float = None):
+        """
+        :param weight: (out, in) weights, float32, float16 or int8 (quantized, see scale)
+        :param scale: Scale of the int8 weights, weight * scale are the real weights
+        """
+        weight = np.asarray(weight)
+        self.weight: np.ndarray = weight if weight.dtype.type in C_TYPES else weight.astype(np.float32)
+        # The kernels always add a bias, zeros for the layers without one (output of BlackBoxActor)
+        self.bias: np.ndarray = np.zeros(len(weight), dtype=np.float32) if bias is None else np.asarray(
+            bias, dtype=np.float32)
+        self.activation: str = activation
+        self.scale: Optional[float] = scale
+
+    def dequantized(self) -> np.ndarray:
+        """
+        Real weights in float64
+        """
+        weight = self.weight.astype(np.float64)
+        return weight if self.scale is None else weight * self.scale
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        return activate(x @ self.dequantized().T + self.bias, self.activation)
+
+
+def actor_layers(model: torch.nn.Module) -> Tuple[List[Layer], float]:
+    """
+    Layers of a BlackBoxActor, PidActor or spinup MLPActor, or of the pi of an actor critic
+    :return: Layers and act_limit of the actor
+    """
+    if isinstance(getattr(model, 'layers', None), list):
+        # Quantized actor
+        return model.layers, model.act_limit
+    actor = model.pi if isinstance(getattr(model, 'pi', None), torch.nn.Module) and hasattr(model, 'q') else model
+    act_limit = float(getattr(actor, 'act_limit', 1.))
+    modules = list(actor.pi) if isinstance(actor.pi, torch.nn.Sequential) else list(actor.modules())
+    layers: List[Layer] = []
+    for module in modules:
+        if isinstance(module, torch.nn.Linear):
+            layers.append(Layer(module.weight.detach().cpu().numpy(),
+                                None if module.bias is None else module.bias.detach().cpu().numpy(), 'identity'))
+        elif type(module) in ACTIVATIONS and layers:
+            layers[-1].activation = ACTIVATIONS[type(module)]
+        elif not isinstance(module, torch.nn.Sequential) and layers:
+            raise ValueError('Unsupported module {}'.format(type(module).__name__))
+    return layers, act_limit
+
+
+def size_name(i: int, n_layers: int) -> str:
+    """
+    Size macro of the output of layer i, sz_hid_<i + 1> or sz_act
+    """
+    return 'sz_act' if i == n_layers - 1 else 'sz_hid_{}'.format(i + 1)
+
+
+def input_names(i: int, n_layers: int) -> Tuple[str, str]:
+    """
+    Size macro and buffer of the input of layer i
+    """
+    return ('sz_obs', 'input') if i == 0 else (size_name(i - 1, n_layers), 'h{}'.format(i))
+
+
+def output_buffer(i: int, n_layers: int) -> str:
+    return 'a' if i == n_layers - 1 else 'h{}'.format(i + 1)
+
+
+def float_literal(value: float) -> str:
+    return repr(float(value))
+
+
+def weight_literal(value) -> str:
+    return str(int(value)) if isinstance(value, np.integer) else float_literal(value)
+
+
+def generate_header(layers: List[Layer], act_limit: float = 1., description: str = '') -> str:
+    """
+    Header of the pi_nn class with the weights of the layers, as cpp_code/blackbox.h
+    """
+    n_layers = len(layers)
+    lines = ['#ifndef PI_NN', '#define PI_NN', '', '// store the parameters for pi network']
+    if description:
+        lines.append('// ' + description)
+    lines.append('// activations: ' + ', '.join(layer.activation for layer in layers))
+    lines += ['', '#define sz_obs {}'.format(layers[0].weight.shape[1])]
+    lines += ['#define {} {}'.format(size_name(i, n_layers), len(layer.weight)) for i, layer in enumerate(layers)]
+    lines.append('#define act_limit {}'.format(float_literal(act_limit)))
+    if any(layer.weight.dtype == np.float16 for layer in layers):
+        # __fp16 on the ARM targets without _Float16
+        lines += ['#ifndef half_t', '#define half_t _Float16', '#endif']
+    lines += ['', 'class pi_nn', '{', 'public:', '    float* o;']
+    lines += ['    float {}[{}];'.format(output_buffer(i, n_layers), size_name(i, n_layers)) for i in range(n_layers)]
+    lines += ['', '    pi_nn();', '', '    void act(float* input);', '']
+    for i, layer in enumerate(layers):
+        rows = ',\n'.join('        {' + ', '.join(weight_literal(value) for value in row) + '}' for row in layer.weight)
+        lines.append('    const {} pi_w{}[{}][{}] = {{\n{}\n    }};\n'.format(
+            C_TYPES[layer.weight.dtype.type], i + 1, size_name(i, n_layers), input_names(i, n_layers)[0], rows))
+        if layer.scale is not None:
+            lines.append('    const float pi_s{} = {};\n'.format(i + 1, float_literal(layer.scale)))
+        lines.append('    const float pi_b{}[{}] = {{{}}};\n'.format(
+            i + 1, size_name(i, n_layers), ', '.join(float_literal(value) for value in layer.bias)))
+    lines += ['};', '', '#endif', '']
+    return '\n'.join(lines)
+
+
+def kernel_layer(i: int, layers: List[Layer], fused: bool) -> str:
+    n_layers = len(layers)
+    in_size, in_buffer = input_names(i, n_layers)
+    out_size, out_buffer = size_name(i, n_layers), output_buffer(i, n_layers)
+    activation = layers[i].activation
+    c_type = C_TYPES[layers[i].weight.dtype.type]
+    scaled: bool = layers[i].scale is not None
+    if fused:
+        # The int8 sums are scaled once per neuron, then biased
+        return ('    // layer {n} with {act}\n'
+                '    for (int i = 0; i < {out_size}; ++i) {{\n'
+                '        const {c_type}* w = pi_w{n}[i];\n'
+                '        float sum = {init};\n'
+                '        for (int j = 0; j < {in_size}; ++j) {{\n'
+                '            sum += {weight} * {in_buffer}[j];\n'
+                '        }}\n'
+                '{scale}'
+                '        {out_buffer}[i] = {value};\n'
+                '    }}\n').format(n=i + 1, act=activation, c_type=c_type, out_size=out_size, in_size=in_size,
+                                   in_buffer=in_buffer, out_buffer=out_buffer, value=FLOAT_ACTIVATIONS[activation],
+                                   init='0.f' if scaled else 'pi_b{}[i]'.format(i + 1),
+                                   weight='w[j]' if c_type == 'float' else '(float) w[j]',
+                                   scale='        sum = sum * pi_s{0} + pi_b{0}[i];\n'.format(i + 1) if scaled else '')
+    activation_line = REFERENCE_ACTIVATIONS[activation].format(out_buffer + '[i]')
+    return ('    // layer {n} with {act}\n'
+            '    for (int i = 0; i < {out_size}; ++i) {{\n'
+            '        {out_buffer}[i] = 0;\n'
+            '        for (int j = 0; j < {in_size}; ++j) {{ // weight\n'
+            '            {out_buffer}[i] += {weight} * {in_buffer}[j];\n'
+            '        }}\n'
+            '{scale}'
+            '        {out_buffer}[i] += pi_b{n}[i]; // bias\n'
+            '{activation}'
+            '    }}\n').format(n=i + 1, act=activation, out_size=out_size, in_size=in_size, in_buffer=in_buffer,
+                               out_buffer=out_buffer,
+                               weight=('pi_w{}[i][j]' if c_type == 'float' else '(float) pi_w{}[i][j]').format(i + 1),
+                               scale='        {}[i] *= pi_s{}; // scale\n'.format(out_buffer, i + 1) if scaled else '',
+                               activation='        ' + activation_line + '\n' if activation_line else '')
+
+
+def generate_kernel(layers: List[Layer], header_name: str, fused: bool = False) -> str:
+    """
+    Kernel of the header: pi_nn::act, get_act(input, output) and bench_act(input, n_calls), the mean duration of act
+    in nanoseconds
+    :param fused: float32 only variant, loops fused, instead of the long double reference
+    """
+    body = '\n'.join(kernel_layer(i, layers, fused) for i in range(len(layers)))
+    return ('#include "{header}"\n'
+            '#include <algorithm>\n'
+            '#include <chrono>\n'
+            '#include <cmath>\n'
+            'class pi_nn p;\n'
+            '\n'
+            'void pi_nn::act(float* input) {{\n'
+            '{body}'
+            '    return;\n'
+            '}};\n'
+            '\n'
+            'pi_nn::pi_nn() {{\n'
+            '\n'
+            '}}\n'
+            '\n'
+            'extern "C" {{\n'
+            '\n'
+            '    void get_act(float* input, float* output) {{\n'
+            '        p.act(input);\n'
+            '        for (int i = 0; i < sz_act; ++i) {{\n'
+            '            output[i] = p.a[i];\n'
+            '        }}\n'
+            '        return;\n'
+            '    }}\n'
+            '\n'
+            '    double bench_act(float* input, int n_calls) {{\n'
+            '        auto start = std::chrono::steady_clock::now();\n'
+            '        for (int k = 0; k < n_calls; ++k) {{\n'
+            '            p.act(input);\n'
+            '        }}\n'
+            '        std::chrono::duration<double, std::nano> elapsed = std::chrono::steady_clock::now() - start;\n'
+            '        return elapsed.count() / n_calls;\n'
+            '    }}\n'
+            '}}\n').format(header=header_name, body=body)
+
+
+def export_actor(model, output_dir: str, name: str = 'pi_nn') -> Dict[str, str]:
+    """
+    Generate the header and the two kernels of an actor
+    :param model: Actor, actor critic or path of a pyt_save/model.pt
+    :param output_dir: Directory of the generated files
+    :param name: Base name, <name>.h, <name>.cpp (reference) and <name>_f32.cpp (float32)
+    :return: Paths of the header, reference and float32 kernels
+    """
+    description = ''
+    if isinstance(model, str):
+        description = 'exported from ' + model
+        model = torch.load(model, weights_only=False)
+    layers, act_limit = actor_layers(model)
+    return export_layers(layers, output_dir, name, act_limit, description)
+
+
+def export_layers(layers: List[Layer], output_dir: str, name: str = 'pi_nn', act_limit: float = 1.,
+                  description: str = '') -> Dict[str, str]:
+    """
+    export_actor of the layers of an actor
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {'header': os.path.join(output_dir, name + '.h'), 'reference': os.path.join(output_dir, name + '.cpp'),
+             'float32': os.path.join(output_dir, name + '_f32.cpp')}
+    sources = {'header': generate_header(layers, act_limit, description),
+               'reference': generate_kernel(layers, name + '.h'),
+               'float32': generate_kernel(layers, name + '.h', fused=True)}
+    for key, path in paths.items():
+        with open(path, 'w') as source_file:
+            source_file.write(sources[key])
+    return paths
+
+
+def compile_kernel(source_path: str, library_path: str = None, flags: Tuple[str, ...] = ('-O2',),
+                   compiler: str = 'g++') -> str:
+    """
+    Compile a kernel as a shared library
+    :return: Path of the library
+    """
+    library_path = library_path or os.path.splitext(source_path)[0] + '.so'
+    subprocess.run([compiler, *flags, '-shared', '-fPIC', '-o', library_path, source_path], check=True)
+    return library_path
+
+
+class KernelHarness:
+    """
+    Compiled kernel called through ctypes: numerical parity with the actor and latency of a control step
+    """
+
+    def __init__(self, library_path: str, n_obs: int, n_act: int):
+        self.library = ctypes.CDLL(os.path.abspath(library_path))
+        self.library.get_act.argtypes = [ctypes.POINTER(ctypes.c_float), ctypes.POINTER(ctypes.c_float)]
+        self.library.get_act.restype = None
+        self.library.bench_act.argtypes = [ctypes.POINTER(ctypes.c_float), ctypes.c_int]
+        self.library.bench_act.restype = ctypes.c_double
+        self.n_obs: int = n_obs
+        self.n_act: int = n_act
+
+    @classmethod
+    def from_source(cls, source_path: str, layers: List[Layer], flags: Tuple[str, ...] = ('-O2',)) -> 'KernelHarness':
+        return cls(compile_kernel(source_path, flags=flags), layers[0].weight.shape[1], len(layers[-1].weight))
+
+    def act(self, observation: np.ndarray) -> np.ndarray:
+        observation = np.ascontiguousarray(observation, dtype=np.float32)
+        output = np.zeros(self.n_act, dtype=np.float32)
+        self.library.get_act(observation.ctypes.data_as(ctypes.POINTER(ctypes.c_float)),
+                             output.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+        return output
+
+    def parity(self, layers: List[Layer], observations: np.ndarray) -> Dict[str, float]:
+        """
+        :param observations: (N, n_obs) observations
+        :return: Largest absolute and relative errors of the kernel against the float64 forward of the layers
+        """
+        expected = np.asarray(observations, dtype=np.float32).astype(np.float64)
+        for layer in layers:
+            expected = layer.forward(expected)
+        outputs = np.array([self.act(observation) for observation in observations], dtype=np.float64)
+        error = np.abs(outputs - expected)
+        return {'max_abs_error': float(error.max()),
+                'max_rel_error': float((error / np.maximum(np.abs(expected), 1e-6)).max())}
+
+    def latency(self, observation: np.ndarray, n_calls: int = 10000, n_repeats: int = 5) -> Dict[str, float]:
+        """
+        Duration of a control step in microseconds: act timed inside the library (kernel only) and get_act timed from
+        Python (ctypes call included), and the fraction of the DT budget (50 Hz loop) used by the kernel
+        """
+        observation = np.ascontiguousarray(observation, dtype=np.float32)
+        pointer = observation.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        kernel = min(self.library.bench_act(pointer, n_calls) for _ in range(n_repeats)) / 1000.
+        calls = []
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            for _ in range(n_calls // 10):
+                self.act(observation)
+            calls.append((time.perf_counter() - start) * 1e6 / (n_calls // 10))
+        return {'kernel_us': kernel, 'call_us': min(calls), 'budget_fraction': kernel * 1e-6 / DT}
+
+
+def check_actor(model, output_dir: str, name: str = 'pi_nn', n_samples: int = 1000, obs_scale: float = 1.,
+                seed: int = 0, flags: Tuple[str, ...] = ('-O2',)) -> Dict[str, Dict[str, float]]:
+    """
+    Export an actor, compile both kernels, and report their parity with the actor on uniform observations in
+    [-obs_scale, obs_scale] and their latency
+    :return: Errors (KernelHarness.parity) and latencies (KernelHarness.latency) of the reference and float32 kernels
+    """
+    paths = export_actor(model, output_dir, name)
+    if isinstance(model, str):
+        model = torch.load(model, weights_only=False)
+    layers, _ = actor_layers(model)
+    observations = np.random.default_rng(seed).uniform(-obs_scale, obs_scale, (n_samples, layers[0].weight.shape[1]))
+    report = {}
+    for variant in ('reference', 'float32'):
+        harness = KernelHarness.from_source(paths[variant], layers, flags)
+        report[variant] = dict(harness.parity(layers, observations), **harness.latency(observations[0]))
+    return report
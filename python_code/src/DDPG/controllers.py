@@ -1,11 +1,13 @@
 import numpy as np
 import torch
 
+from typing import Dict
 from ..constants import BALL_ERROR_SCALING, BALL_D_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, MAX_ANGLE
+from ..inference import NumpyInference, numpy_linear, population_linear
 from spinup.algos.pytorch.ddpg.core import mlp
 
 
-class BallController(torch.nn.Module):
+class BallController(NumpyInference, torch.nn.Module):
 
     def __init__(self):
         super(BallController, self).__init__()
@@ -15,6 +17,9 @@ class BallController(torch.nn.Module):
         d_error = d_error * BALL_D_ERROR_SCALING
         integral_error = integral_error * BALL_INTEGRAL_ERROR_SCALING
 
+        weights = self.inference_weights()
+        if weights is not None:
+            return self.numpy_forward(weights, np.array([error, d_error, integral_error]))[0].item()
         x = torch.tensor([[
             error,
             d_error,
@@ -22,6 +27,18 @@ class BallController(torch.nn.Module):
         ]])
         return self.forward(x)[0].item()
 
+    def step_many(self, error: np.ndarray, d_error: np.ndarray, integral_error: np.ndarray) -> np.ndarray:
+        """
+        step of N samples at once, in numpy
+        :return: (N,) motor angles
+        """
+        x = np.stack([
+            np.asarray(error) * BALL_ERROR_SCALING,
+            np.asarray(d_error) * BALL_D_ERROR_SCALING,
+            np.asarray(integral_error) * BALL_INTEGRAL_ERROR_SCALING,
+        ], axis=1).astype(np.float64)
+        return self.numpy_forward(self.batch_weights(), x)[:, 0]
+
 
 class PidController(BallController):
     def __init__(self, n_inputs: int, n_output: int):
@@ -35,6 +52,10 @@ class PidController(BallController):
         x = MAX_ANGLE * torch.tanh(self.predict(x))
         return x
 
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        return MAX_ANGLE * np.tanh(numpy_linear(x, weights['predict.weight']))
+
 
 class GeneticController(torch.nn.Module):
     def __init__(self, n_inputs: int, n_hidden: int, n_output: int):
@@ -44,15 +65,33 @@ class GeneticController(torch.nn.Module):
         #for p in self.parameters():
             #p.data.fill_(-0.)
 
-    def act(self, observation: np.ndarray) -> float:
+    def act(self, observation: np.ndarray) -> np.ndarray:
         x = torch.as_tensor(observation, dtype=torch.float32)
-        return self.forward(x)[0].detach().numpy()
+        return self.forward(x).detach().numpy()
 
     def forward(self, x):
         x = torch.tanh(self.h1(x))
         x = torch.tanh(self.predict(x))
         return x
 
+    @staticmethod
+    def population_forward(weights: Dict[str, torch.Tensor], x: torch.Tensor) -> torch.Tensor:
+        """
+        Forward of P controllers at once
+        :param weights: Stacked state dicts, see fitness.population_weights_as_dict
+        :param x: (P, n_inputs) one observation per controller
+        :return: (P, n_output)
+        """
+        x = torch.tanh(population_linear(x, weights['h1.weight'], weights['h1.bias']))
+        x = torch.tanh(population_linear(x, weights['predict.weight']))
+        return x
+
+    @staticmethod
+    def population_act(weights: Dict[str, torch.Tensor], observations: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            x = torch.as_tensor(observations, dtype=torch.float32)
+            return GeneticController.population_forward(weights, x).numpy()
+
 
 class BlackBoxActorCritic(torch.nn.Module):
 
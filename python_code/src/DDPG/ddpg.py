@@ -0,0 +1,223 @@
+import os
+import time
+from contextlib import nullcontext
+from copy import deepcopy
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+
+from .replay_buffer import MemmapReplayBuffer
+from ..checkpoint import atomic_save, load_checkpoint, rng_states, set_rng_states
+from ..profiling import Profiler
+
+
+class ProgressLogger:
+    """
+    Tab separated progress.txt with the columns of the spinup logger read by analyse_training
+    """
+
+    COLUMNS = ('Epoch', 'AverageEpRet', 'StdEpRet', 'MaxEpRet', 'MinEpRet', 'AverageTestEpRet', 'StdTestEpRet',
+               'MaxTestEpRet', 'MinTestEpRet', 'EpLen', 'TestEpLen', 'TotalEnvInteracts', 'AverageQVals', 'StdQVals',
+               'MaxQVals', 'MinQVals', 'LossPi', 'LossQ', 'Time')
+
+    def __init__(self, output_dir: str, n_epochs_done: int = 0, verbose: bool = True):
+        """
+        :param n_epochs_done: Epochs of the resumed run, the lines of the later epochs are dropped
+        :param verbose: Print a summary line at every epoch
+        """
+        self.path: str = os.path.join(output_dir, 'progress.txt')
+        self.verbose: bool = verbose
+        os.makedirs(output_dir, exist_ok=True)
+        lines: List[str] = []
+        if n_epochs_done and os.path.exists(self.path):
+            with open(self.path) as progress_file:
+                lines = progress_file.readlines()[:n_epochs_done + 1]
+        with open(self.path, 'w') as progress_file:
+            progress_file.writelines(lines or ['\t'.join(self.COLUMNS) + '\n'])
+        self.epoch_values: Dict[str, List[float]] = {}
+
+    def store(self, **kwargs):
+        for key, value in kwargs.items():
+            self.epoch_values.setdefault(key, []).append(value)
+
+    def dump(self, epoch: int, total_steps: int, start_time: float):
+        row: Dict[str, float] = {'Epoch': epoch, 'TotalEnvInteracts': total_steps, 'Time': time.time() - start_time}
+        for key in ('EpRet', 'TestEpRet', 'QVals'):
+            values = np.array(self.epoch_values.get(key, [np.nan]))
+            row.update({'Average' + key: values.mean(), 'Std' + key: values.std(),
+                        'Max' + key: values.max(), 'Min' + key: values.min()})
+        for key in ('EpLen', 'TestEpLen', 'LossPi', 'LossQ'):
+            row[key] = np.mean(self.epoch_values.get(key, [np.nan]))
+        with open(self.path, 'a') as progress_file:
+            progress_file.write('\t'.join(str(row[column]) for column in self.COLUMNS) + '\n')
+        if self.verbose:
+            print('Epoch {}, AverageEpRet {:.3f}, AverageTestEpRet {:.3f}'.format(epoch, row['AverageEpRet'],
+                                                                                row['AverageTestEpRet']))
+        self.epoch_values = {}
+
+
+def train_ddpg(env_fn: Callable, actor_critic: Callable, ac_kwargs: dict = None, seed: int = 0,
+               steps_per_epoch: int = 4000, epochs: int = 100, replay_size: int = int(1e6), gamma: float = 0.99,
+               polyak: float = 0.995, pi_lr: float = 1e-3, q_lr: float = 1e-3, batch_size: int = 100,
+               start_steps: int = 10000, update_after: int = 1000, update_every: int = 50, act_noise: float = 0.1,
+               num_test_episodes: int = 10, max_ep_len: int = 1000, output_dir: str = 'src/data/ddpg',
+               checkpoint_every: int = 1, resume: bool = False, profiler: Profiler = None,
+               verbose: bool = True) -> torch.nn.Module:
+    """
+    DDPG of spinup.ddpg_pytorch (same arguments and progress.txt / pyt_save/model.pt outputs) with periodic atomic
+    checkpoints in output_dir/checkpoint.pt: actor critic, targets, optimizers, replay buffer pointer, random
+    generators and environements. The replay buffer is a MemmapReplayBuffer in output_dir/replay.
+    :param checkpoint_every: Number of epochs between two checkpoints
+    :param resume: Continue the killed run of output_dir from its last checkpoint, as if it had not stopped
+    :param profiler: Profiler enabled during the training loop: actor, environement step, replay buffer, updates and
+                     test episodes are timed, see Profiler.report
+    :param verbose: Print the summary of every epoch, progress.txt is written either way
+    :return: Trained actor critic
+    """
+    checkpoint_path: str = os.path.join(output_dir, 'checkpoint.pt')
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    env, test_env = env_fn(), env_fn()
+    # Environement spaces have their own generators
+    test_env.seed(seed + 1)
+    env.seed(seed)
+    env.action_space.seed(seed)
+    obs_dim = env.observation_space.shape
+    act_dim: int = env.action_space.shape[0]
+    act_limit: float = env.action_space.high[0]
+
+    ac = actor_critic(env.observation_space, env.action_space, **(ac_kwargs or {}))
+    ac_targ = deepcopy(ac)
+    for p in ac_targ.parameters():
+        p.requires_grad = False
+    pi_optimizer = torch.optim.Adam(ac.pi.parameters(), lr=pi_lr)
+    q_optimizer = torch.optim.Adam(ac.q.parameters(), lr=q_lr)
+
+    replay_path: str = os.path.join(output_dir, 'replay')
+    replay_buffer = MemmapReplayBuffer(obs_dim, act_dim, replay_size, replay_path, reopen=checkpoint is not None,
+                                       seed=seed)
+
+    first_step: int = 0
+    o, ep_ret, ep_len = env.reset(), 0., 0
+    if checkpoint is not None:
+        ac.load_state_dict(checkpoint['ac'])
+        ac_targ.load_state_dict(checkpoint['ac_targ'])
+        pi_optimizer.load_state_dict(checkpoint['pi_optimizer'])
+        q_optimizer.load_state_dict(checkpoint['q_optimizer'])
+        # Transitions stored after the checkpoint are overwritten
+        replay_buffer.ptr, replay_buffer.size = checkpoint['replay_buffer']['ptr'], checkpoint['replay_buffer']['size']
+        replay_buffer.rng.bit_generator.state = checkpoint['replay_buffer']['rng']
+        env, test_env = checkpoint['env'], checkpoint['test_env']
+        o, ep_ret, ep_len = checkpoint['o'], checkpoint['ep_ret'], checkpoint['ep_len']
+        first_step = checkpoint['t']
+        set_rng_states(checkpoint['rng_states'])
+    logger = ProgressLogger(output_dir, first_step // steps_per_epoch, verbose)
+
+    def compute_loss_q(data):
+        o, a, r, o2, d = data['obs'], data['act'], data['rew'], data['obs2'], data['done']
+        q = ac.q(o, a)
+        with torch.no_grad():
+            q_pi_targ = ac_targ.q(o2, ac_targ.pi(o2))
+            backup = r + gamma * (1 - d) * q_pi_targ
+        return ((q - backup) ** 2).mean(), q.detach().numpy()
+
+    def compute_loss_pi(data):
+        o = data['obs']
+        return - ac.q(o, ac.pi(o)).mean()
+
+    def update(data):
+        q_optimizer.zero_grad()
+        loss_q, q_values = compute_loss_q(data)
+        loss_q.backward()
+        q_optimizer.step()
+
+        # Q frozen during the policy step
+        for p in ac.q.parameters():
+            p.requires_grad = False
+        pi_optimizer.zero_grad()
+        loss_pi = compute_loss_pi(data)
+        loss_pi.backward()
+        pi_optimizer.step()
+        for p in ac.q.parameters():
+            p.requires_grad = True
+
+        with torch.no_grad():
+            for p, p_targ in zip(ac.parameters(), ac_targ.parameters()):
+                p_targ.data.mul_(polyak)
+                p_targ.data.add_((1 - polyak) * p.data)
+        logger.store(LossQ=loss_q.item(), LossPi=loss_pi.item())
+        for q in q_values:
+            logger.store(QVals=q)
+
+    def get_action(o, noise_scale):
+        a = ac.act(torch.as_tensor(o, dtype=torch.float32))
+        a += noise_scale * np.random.randn(act_dim)
+        return np.clip(a, -act_limit, act_limit)
+
+    def test_agent():
+        for _ in range(num_test_episodes):
+            o, d, ep_ret, ep_len = test_env.reset(), False, 0., 0
+            while not (d or (ep_len == max_ep_len)):
+                o, r, d, _ = test_env.step(get_action(o, 0))
+                ep_ret += r
+                ep_len += 1
+            logger.store(TestEpRet=ep_ret, TestEpLen=ep_len)
+
+    # Call sites timed by the profiler. env and ac are pickled by the checkpoints, they are left unwrapped
+    env_step, store, sample_batch = env.step, replay_buffer.store, replay_buffer.sample_batch
+    if profiler is not None:
+        update, test_agent = profiler.wrap(update, 'ddpg_update'), profiler.wrap(test_agent, 'test_agent')
+        get_action, env_step = profiler.wrap(get_action, 'actor'), profiler.wrap(env_step, 'env_step')
+        store, sample_batch = profiler.wrap(store, 'replay_buffer'), profiler.wrap(sample_batch, 'replay_buffer')
+
+    with nullcontext() if profiler is None else profiler:
+        start_time: float = time.time()
+        total_steps: int = steps_per_epoch * epochs
+        for t in range(first_step, total_steps):
+            a = get_action(o, act_noise) if t > start_steps else env.action_space.sample()
+
+            o2, r, d, _ = env_step(a)
+            ep_ret += r
+            ep_len += 1
+            # Time horizon reached is not a terminal state
+            d = False if ep_len == max_ep_len else d
+            store(o, a, r, o2, d)
+            o = o2
+
+            if d or (ep_len == max_ep_len):
+                logger.store(EpRet=ep_ret, EpLen=ep_len)
+                o, ep_ret, ep_len = env.reset(), 0., 0
+
+            if t >= update_after and t % update_every == 0:
+                for _ in range(update_every):
+                    update(sample_batch(batch_size))
+
+            if (t + 1) % steps_per_epoch == 0:
+                epoch: int = (t + 1) // steps_per_epoch
+                test_agent()
+                logger.dump(epoch, t + 1, start_time)
+
+                if epoch % checkpoint_every == 0 or epoch == epochs:
+                    os.makedirs(os.path.join(output_dir, 'pyt_save'), exist_ok=True)
+                    torch.save(ac, os.path.join(output_dir, 'pyt_save', 'model.pt'))
+                    replay_buffer.flush()
+                    atomic_save({
+                        't': t + 1,
+                        'ac': ac.state_dict(),
+                        'ac_targ': ac_targ.state_dict(),
+                        'pi_optimizer': pi_optimizer.state_dict(),
+                        'q_optimizer': q_optimizer.state_dict(),
+                        'replay_buffer': {'ptr': replay_buffer.ptr, 'size': replay_buffer.size,
+                                          'rng': replay_buffer.rng.bit_generator.state},
+                        'env': env,
+                        'test_env': test_env,
+                        'o': o,
+                        'ep_ret': ep_ret,
+                        'ep_len': ep_len,
+                        'rng_states': rng_states(),
+                    }, checkpoint_path)
+
+    return ac
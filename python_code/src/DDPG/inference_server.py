@@ -0,0 +1,171 @@
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import torch
+
+
+class ActorClient:
+    """
+    Handle of a rollout worker on an ActorInferenceServer, a drop in replacement of actor_critic.act. Picklable when
+    the server is multiprocess, it can then be given to worker processes.
+    """
+
+    def __init__(self, client_id: int, requests, responses):
+        self.client_id: int = client_id
+        self.requests = requests
+        self.responses = responses
+
+    def act(self, observation) -> np.ndarray:
+        """
+        Send one observation to the server and wait for its action
+        """
+        if isinstance(observation, torch.Tensor):
+            observation = observation.numpy()
+        self.requests.put((self.client_id, np.asarray(observation, dtype=np.float32)))
+        return self.responses.get()
+
+    def __call__(self, observation) -> np.ndarray:
+        return self.act(observation)
+
+
+class ActorInferenceServer:
+    """
+    Batched inference of a DDPG actor for many rollout workers. The workers send their observations through a shared
+    queue, a server thread gathers them until max_batch observations are waiting or max_latency seconds have passed
+    since the first one, runs a single forward pass under no_grad and sends every action back to its worker.
+    Threads use in process queues, processes (multiprocess=True) use multiprocessing queues.
+    """
+
+    def __init__(self, actor: torch.nn.Module, max_batch: int = 64, max_latency: float = 0.001,
+                 multiprocess: bool = False):
+        """
+        :param actor: Module mapping a (B, obs_dim) tensor to (B, act_dim) actions (BlackBoxActor, PidActor, ...)
+        :param max_batch: Largest forward pass
+        :param max_latency: Longest wait of the first observation of a batch, in seconds
+        :param multiprocess: Serve worker processes instead of threads
+        """
+        self.actor: torch.nn.Module = actor
+        self.max_batch: int = max_batch
+        self.max_latency: float = max_latency
+
+        self.queue_type: Callable = multiprocessing.get_context().Queue if multiprocess else queue.Queue
+        self.requests = self.queue_type()
+        self.responses: Dict[int, object] = {}
+        self.thread: threading.Thread = None
+
+        # Statistics
+        self.n_batches: int = 0
+        self.n_requests: int = 0
+
+    def client(self) -> ActorClient:
+        """
+        New worker handle, create all of them before starting the workers
+        """
+        client_id: int = len(self.responses)
+        self.responses[client_id] = self.queue_type()
+        return ActorClient(client_id, self.requests, self.responses[client_id])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def mean_batch_size(self) -> float:
+        return self.n_requests / max(1, self.n_batches)
+
+    def gather(self, first: Tuple[int, np.ndarray]) -> Tuple[List[Tuple[int, np.ndarray]], bool]:
+        """
+        Gather a batch starting with the first request
+        :return: Requests of the batch, True if the stop request was received
+        """
+        batch: List[Tuple[int, np.ndarray]] = [first]
+        deadline: float = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout: float = deadline - time.perf_counter()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0. else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def serve(self):
+        stop: bool = False
+        while not stop:
+            first = self.requests.get()
+            if first is None:
+                break
+            batch, stop = self.gather(first)
+
+            observations = torch.as_tensor(np.stack([observation for _, observation in batch]))
+            with torch.no_grad():
+                actions: np.ndarray = self.actor(observations).numpy()
+            for (client_id, _), action in zip(batch, actions):
+                self.responses[client_id].put(action)
+
+            self.n_batches += 1
+            self.n_requests += len(batch)
+
+
+def rollout(act: Callable, env, n_steps: int) -> Dict[str, np.ndarray]:
+    """
+    Run an environement for n_steps, resetting it at the end of the episodes
+    :param act: Observation -> action, ActorClient.act or actor_critic.act
+    :return: Transitions, obs, act, rew, next_obs and done arrays
+    """
+    transitions: Dict[str, list] = {'obs': [], 'act': [], 'rew': [], 'next_obs': [], 'done': []}
+    o = env.reset()
+    for _ in range(n_steps):
+        a = act(o)
+        o2, r, d, _ = env.step(a)
+        for key, value in zip(transitions, (o, a, r, o2, d)):
+            transitions[key].append(np.copy(value))
+        o = env.reset() if d else o2
+    return {key: np.array(value) for key, value in transitions.items()}
+
+
+def _rollout_worker(client: ActorClient, env_fn: Callable, n_steps: int, results, worker_id: int):
+    results.put((worker_id, rollout(client.act, env_fn(), n_steps)))
+
+
+def parallel_rollouts(actor: torch.nn.Module, env_fn: Callable, n_workers: int, n_steps: int,
+                      max_batch: int = None, max_latency: float = 0.001,
+                      multiprocess: bool = False) -> List[Dict[str, np.ndarray]]:
+    """
+    n_workers environements stepped by threads or processes, their actions computed in batches by an
+    ActorInferenceServer
+    :param env_fn: Environement constructor, see env_fn_gen (must be picklable for spawned processes)
+    :param max_batch: Largest forward pass, n_workers by default
+    :return: Transitions of every worker, see rollout
+    """
+    server = ActorInferenceServer(actor, max_batch or n_workers, max_latency, multiprocess)
+    results = server.queue_type()
+    worker_type = multiprocessing.get_context().Process if multiprocess else threading.Thread
+    workers = [worker_type(target=_rollout_worker, args=(server.client(), env_fn, n_steps, results, i))
+               for i in range(n_workers)]
+
+    with server:
+        for worker in workers:
+            worker.start()
+        transitions = dict(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+
+    return [transitions[i] for i in range(n_workers)]
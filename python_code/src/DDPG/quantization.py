@@ -0,0 +1,168 @@
+"""
+Post-training quantization of the actors (BlackBoxActor, PidActor, spinup MLPActor) for the deployment:
+    - float16: weights and biases rounded to half precision
+    - int8: symmetric int8 weights with one float scale per layer, float32 biases
+QuantizedActor runs the quantized layers in numpy with the act of the actors, so it goes through the simulate methods
+of the environements, and exports the C++ header and kernels of codegen. quantization_report compares the variants
+on the benchmark trajectory and on the real system records.
+"""
+import json
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .codegen import Layer, KernelHarness, activate, actor_layers, compile_kernel, export_layers
+from ..ball_balancer.simulation import dema_step
+from ..constants import BALL_D_ERROR_SCALING, BALL_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, BALL_MAX_INTEGRAL, \
+    DT, FILTERING_PERIOD
+from ..recordings import RecordingCache
+
+MODES: Tuple[str, ...] = ('float32', 'float16', 'int8')
+
+
+def quantize_layer(layer: Layer, mode: str) -> Layer:
+    weight = layer.dequantized()
+    if mode == 'int8':
+        # float32 scale, the one of the C++ header
+        scale = float(np.float32(np.abs(weight).max() / 127.)) or 1.
+        return Layer(np.clip(np.round(weight / scale), -127, 127).astype(np.int8), layer.bias, layer.activation, scale)
+    if mode == 'float16':
+        return Layer(weight.astype(np.float16), layer.bias.astype(np.float16), layer.activation)
+    return Layer(weight.astype(np.float32), layer.bias, layer.activation)
+
+
+class QuantizedActor:
+    """
+    Actor with quantized layers, computed in float32 by numpy
+    """
+
+    def __init__(self, layers: List[Layer], act_limit: float = 1., mode: str = 'float32'):
+        self.layers: List[Layer] = layers
+        self.act_limit: float = act_limit
+        self.mode: str = mode
+        # float32 copies of the weights for the products, the int8 sums are scaled afterwards
+        self.weights: List[np.ndarray] = [layer.weight.astype(np.float32).T for layer in layers]
+        self.scales: List[np.float32] = [np.float32(1. if layer.scale is None else layer.scale) for layer in layers]
+
+    @classmethod
+    def from_actor(cls, model, mode: str = 'int8') -> 'QuantizedActor':
+        """
+        :param model: Actor, actor critic or path of a pyt_save/model.pt
+        :param mode: Key of MODES
+        """
+        if isinstance(model, str):
+            model = torch.load(model, weights_only=False)
+        layers, act_limit = actor_layers(model)
+        return cls([quantize_layer(layer, mode) for layer in layers], act_limit, mode)
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        for layer, weight, scale in zip(self.layers, self.weights, self.scales):
+            x = activate((x @ weight) * scale + layer.bias, layer.activation)
+        return x
+
+    def act(self, obs) -> np.ndarray:
+        if isinstance(obs, torch.Tensor):
+            obs = obs.numpy()
+        return self.act_limit * self.forward(obs)
+
+    def n_bytes(self) -> int:
+        """
+        Size of the weights, biases and scales
+        """
+        return sum(layer.weight.nbytes + layer.bias.nbytes + (4 if layer.scale is not None else 0)
+                   for layer in self.layers)
+
+    def export(self, output_dir: str, name: str = 'pi_nn') -> Dict[str, str]:
+        """
+        C++ header and kernels, see codegen.export_actor
+        """
+        return export_layers(self.layers, output_dir, name, self.act_limit, self.mode + ' quantization')
+
+
+def record_observations(record: Dict[str, np.ndarray], alpha: float = 2. / (1. + FILTERING_PERIOD)) -> np.ndarray:
+    """
+    Scaled observations of a real system record (target_*, ball_* columns), filtered as in the simulate methods
+    :return: (T - 1, 6) observations
+    """
+    target = np.stack([record['target_x'], record['target_y']])
+    ball = np.stack([record['ball_x'], record['ball_y']])
+    previous_error = target[:, 0]
+    integral = previous_error * DT
+    ema = ema_ema = np.zeros(2)
+    observations = []
+    for i in range(1, target.shape[1]):
+        dema, ema, ema_ema = dema_step(ball[:, i], ema, ema_ema, alpha)
+        error = dema - target[:, i]
+        d_error = (error - previous_error) / DT
+        integral = np.clip(integral + error * DT, -BALL_MAX_INTEGRAL, BALL_MAX_INTEGRAL)
+        previous_error = error
+        observations.append(np.concatenate([error * BALL_ERROR_SCALING, d_error * BALL_D_ERROR_SCALING,
+                                            integral * BALL_INTEGRAL_ERROR_SCALING]))
+    return np.array(observations)
+
+
+def step_latency(actor, observation: np.ndarray, n_steps: int = 2000) -> float:
+    """
+    :return: Duration of an act on one observation in microseconds
+    """
+    obs = torch.as_tensor(observation, dtype=torch.float32)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        actor.act(obs)
+    return (time.perf_counter() - start) * 1e6 / n_steps
+
+
+def quantization_report(model, env, modes: Tuple[str, ...] = MODES,
+                        trajectory_path: str = 'src/data/benchmark_trajectory.json', data_dir: str = 'src/data',
+                        records: str = 'real_system_test/blackbox_record_*.csv', cache_dir: str = None,
+                        output_dir: str = None, n_steps: int = 2000) -> pd.DataFrame:
+    """
+    Replay of the benchmark trajectory in env (BBEnv for the black box actors, BBEnvPid for the dynamic PID ones)
+    and of the observations of the real system records, with the torch actor and its quantized variants
+    :param model: Actor, actor critic or path of a pyt_save/model.pt
+    :param records: Glob of the real system records, relative to data_dir
+    :param cache_dir: Cache of the parsed records, see RecordingCache (user cache by default, never data_dir)
+    :param output_dir: Directory of the C++ kernels, compiled and timed if given
+    :return: Per mode: size, loss and its degradation, action errors on the records against the torch actor, numpy
+             step latency, and with output_dir the float32 kernel latency and its error against the numpy path
+             (_Float16 is emulated on x86, time the float16 kernel on the target)
+    """
+    if isinstance(model, str):
+        model = torch.load(model, weights_only=False)
+    with open(trajectory_path) as json_file:
+        target_trajectory = np.array(json.load(json_file)['target'])
+    recordings = RecordingCache(data_dir, cache_dir).load_all(records)
+    observations = [record_observations(record) for record in recordings.values()]
+    observations = np.concatenate(observations) if observations else np.zeros((1, 6))
+    with torch.no_grad():
+        reference_actions = np.array(model.act(torch.as_tensor(observations, dtype=torch.float32)))
+
+    actors = {'torch': model}
+    actors.update({mode: QuantizedActor.from_actor(model, mode) for mode in modes})
+    rows = {}
+    for mode, actor in actors.items():
+        row = {'n_bytes': actor.n_bytes() if isinstance(actor, QuantizedActor) else
+               sum(parameter.numel() * 4 for parameter in actor.pi.parameters())}
+        with torch.no_grad():
+            row['loss'] = env.simulate(actor, target_trajectory)[4]
+            actions = np.array(actor.act(torch.as_tensor(observations, dtype=torch.float32)))
+        row['record_action_rmse'] = float(np.sqrt(np.mean((actions - reference_actions) ** 2)))
+        row['record_action_max_error'] = float(np.abs(actions - reference_actions).max())
+        row['step_us'] = step_latency(actor, observations[0], n_steps)
+
+        if output_dir is not None and isinstance(actor, QuantizedActor):
+            paths = actor.export(output_dir, 'pi_nn_' + mode)
+            harness = KernelHarness(compile_kernel(paths['float32']), observations.shape[1],
+                                    len(actor.layers[-1].weight))
+            kernel_actions = actor.act_limit * np.array([harness.act(observation) for observation in observations])
+            row['kernel_max_error'] = float(np.abs(kernel_actions - actions).max())
+            row['kernel_us'] = harness.latency(observations[0])['kernel_us']
+        rows[mode] = row
+
+    report = pd.DataFrame.from_dict(rows, orient='index')
+    report['loss_degradation'] = report['loss'] - report.loc['torch', 'loss']
+    return report
@@ -0,0 +1,162 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import numpy as np
+import torch
+from numpy.lib.format import open_memmap
+
+
+class MemmapReplayBuffer:
+    """
+    Ring replay buffer stored on disk, one .npy memory mapped file per column (obs, act, rew, next_obs, done) and a
+    meta.json holding the dimensions and the write pointer. Same interface as the spinup ddpg ReplayBuffer, the
+    buffer of a previous run can be reopened to warm start or to train offline.
+    """
+
+    COLUMNS = ('obs', 'act', 'rew', 'next_obs', 'done')
+
+    def __init__(self, obs_dim, act_dim, size: int, path: str, reopen: bool = False, flush_every: int = 1000,
+                 seed: int = None):
+        """
+        :param obs_dim: Observation shape (int or tuple)
+        :param act_dim: Action shape (int or tuple)
+        :param size: Capacity in transitions
+        :param path: Directory of the buffer files
+        :param reopen: Continue the buffer found in path instead of creating a new one
+        :param flush_every: Number of stores between two writes of the pointer to meta.json
+        :param seed: Seed of the minibatch sampling
+        """
+        self.path: str = path
+        self.obs_shape: tuple = tuple(np.atleast_1d(obs_dim).tolist())
+        self.act_shape: tuple = tuple(np.atleast_1d(act_dim).tolist())
+        self.max_size: int = size
+        self.flush_every: int = flush_every
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+
+        self.ptr: int = 0
+        self.size: int = 0
+        self.n_unflushed: int = 0
+
+        shapes: Dict[str, tuple] = {'obs': self.obs_shape, 'act': self.act_shape, 'rew': (),
+                                    'next_obs': self.obs_shape, 'done': ()}
+        if reopen:
+            meta = self.read_meta(path)
+            if meta['max_size'] != size or tuple(meta['obs_shape']) != self.obs_shape or \
+                    tuple(meta['act_shape']) != self.act_shape:
+                raise ValueError('Replay buffer in {} does not match: {}'.format(path, meta))
+            self.ptr = meta['ptr']
+            self.size = meta['size']
+        else:
+            os.makedirs(path, exist_ok=True)
+
+        self.columns: Dict[str, np.memmap] = {
+            column: open_memmap(self.column_path(column), mode='r+' if reopen else 'w+', dtype=np.float32,
+                                shape=(size,) + shape)
+            for column, shape in shapes.items()
+        }
+        if not reopen:
+            self.flush()
+
+    @staticmethod
+    def read_meta(path: str) -> dict:
+        with open(os.path.join(path, 'meta.json')) as json_file:
+            return json.load(json_file)
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> 'MemmapReplayBuffer':
+        """
+        Reopen an existing buffer, the dimensions are read from its meta.json
+        """
+        meta = cls.read_meta(path)
+        return cls(meta['obs_shape'], meta['act_shape'], meta['max_size'], path, reopen=True, **kwargs)
+
+    def column_path(self, column: str) -> str:
+        return os.path.join(self.path, column + '.npy')
+
+    def __len__(self) -> int:
+        return self.size
+
+    def store(self, obs, act, rew, next_obs, done):
+        for column, value in zip(self.COLUMNS, (obs, act, rew, next_obs, done)):
+            self.columns[column][self.ptr] = value
+        self.ptr = (self.ptr + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+        self.n_unflushed += 1
+        if self.n_unflushed >= self.flush_every:
+            self.flush()
+
+    def store_batch(self, obs: np.ndarray, act: np.ndarray, rew: np.ndarray, next_obs: np.ndarray, done: np.ndarray):
+        """
+        Store N transitions at once, (N, ...) arrays (a vectorized environement step)
+        """
+        n: int = len(rew)
+        idxs = (self.ptr + np.arange(n)) % self.max_size
+        for column, value in zip(self.COLUMNS, (obs, act, rew, next_obs, done)):
+            self.columns[column][idxs] = value
+        self.ptr = (self.ptr + n) % self.max_size
+        self.size = min(self.size + n, self.max_size)
+        self.n_unflushed += n
+        if self.n_unflushed >= self.flush_every:
+            self.flush()
+
+    def sample(self, batch_size: int = 32) -> Dict[str, np.ndarray]:
+        """
+        Uniform minibatch, gathered with one fancy index per column
+        :return: Dict of (batch_size, ...) arrays, the columns names as keys
+        """
+        # Sorted indices read the files in order
+        idxs = np.sort(self.rng.integers(0, self.size, size=batch_size))
+        return {column: data[idxs] for column, data in self.columns.items()}
+
+    def sample_batch(self, batch_size: int = 32) -> Dict[str, torch.Tensor]:
+        """
+        sample with the keys and tensors of the spinup ReplayBuffer
+        """
+        batch = self.sample(batch_size)
+        return dict(obs=torch.as_tensor(batch['obs']), obs2=torch.as_tensor(batch['next_obs']),
+                    act=torch.as_tensor(batch['act']), rew=torch.as_tensor(batch['rew']),
+                    done=torch.as_tensor(batch['done']))
+
+    def state(self) -> dict:
+        return {'obs_shape': list(self.obs_shape), 'act_shape': list(self.act_shape), 'max_size': self.max_size,
+                'ptr': int(self.ptr), 'size': int(self.size)}
+
+    def flush(self):
+        """
+        Write the columns to disk, then the pointer (through a temporary file, meta.json is always consistent)
+        """
+        for data in self.columns.values():
+            data.flush()
+        meta_path: str = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as json_file:
+            json.dump(self.state(), json_file)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.n_unflushed = 0
+
+
+def memmap_replay_buffer_fn(path: str, reopen: bool = False, **kwargs) -> Callable:
+    """
+    Constructor with the signature of the spinup ReplayBuffer
+    """
+    def create_buffer(obs_dim, act_dim, size):
+        return MemmapReplayBuffer(obs_dim, act_dim, size, path, reopen=reopen, **kwargs)
+
+    return create_buffer
+
+
+@contextmanager
+def memmap_replay_buffer(path: str, reopen: bool = False, **kwargs):
+    """
+    spinup.ddpg_pytorch calls run with a MemmapReplayBuffer in path:
+        with memmap_replay_buffer('src/data/.../replay'):
+            spinup.ddpg_pytorch(...)
+    """
+    from spinup.algos.pytorch.ddpg import ddpg
+    replay_buffer = ddpg.ReplayBuffer
+    ddpg.ReplayBuffer = memmap_replay_buffer_fn(path, reopen, **kwargs)
+    try:
+        yield
+    finally:
+        ddpg.ReplayBuffer = replay_buffer
@@ -2,11 +2,21 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from .training_index import TrainingLogIndex
 
-def analyse_training(controller_type: str = 'black_box_controller', reward_type: str = 'e_r'):
-    controllers = os.listdir('src/data/{}/{}'.format(controller_type, reward_type))
-    logs = [pd.read_csv('src/data/{}/{}/{}/progress.txt'.format(controller_type, reward_type, controller), sep='\t') for
-            controller in controllers]
+
+def analyse_training(controller_type: str = 'black_box_controller', reward_type: str = 'e_r',
+                     index: TrainingLogIndex = None):
+    """
+    :param index: Index of src/data, the progress tables are read from it instead of the progress.txt files
+    """
+    if index is not None:
+        index.update()
+        controllers, logs = index.logs('{}/{}'.format(controller_type, reward_type))
+    else:
+        controllers = os.listdir('src/data/{}/{}'.format(controller_type, reward_type))
+        logs = [pd.read_csv('src/data/{}/{}/{}/progress.txt'.format(controller_type, reward_type, controller),
+                            sep='\t') for controller in controllers]
 
     fig, axs = plt.subplots(3, 1, sharex=True, figsize=(10, 10))
 
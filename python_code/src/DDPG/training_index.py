@@ -0,0 +1,240 @@
+import glob
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Run directory names: <reward><weight>_[<hidden sizes>]_<activation>[_<gamma>][_<flags>], "lep_0.6_[200]_relu_hard",
+# "le0.3_[100, 50]_relu_0.99", "15_[100]_relu"
+RUN_NAME = re.compile(r'^(?P<reward>[a-z]*)_?(?P<weight>\d+(?:\.\d+)?)_\[(?P<hidden>[\d, ]*)\]_(?P<activation>[a-z]+)'
+                      r'(?P<rest>(?:_.*)?)$')
+# Configuration entries kept in the index (config.json of spinup)
+CONFIG_KEYS = ('epochs', 'steps_per_epoch', 'batch_size', 'gamma', 'pi_lr', 'q_lr', 'polyak', 'act_noise',
+               'replay_size', 'max_ep_len', 'seed')
+# Generated files, gitignored
+RESULTS_DIR: str = 'src/data/results'
+
+
+def hidden_key(hidden_sizes) -> str:
+    return '[' + ', '.join(str(int(size)) for size in hidden_sizes) + ']'
+
+
+def parse_run_name(name: str) -> dict:
+    """
+    :return: reward, weight, hidden_sizes ("[100, 50]"), activation, gamma and flags ("hard,long") of a run
+             directory name, only the name if it does not follow the convention
+    """
+    match = RUN_NAME.match(name)
+    if match is None:
+        return {'name': name}
+    tokens = [token for token in match.group('rest').split('_') if token]
+    gamma = None
+    flags: List[str] = []
+    for token in tokens:
+        if re.fullmatch(r'\d+(?:\.\d+)?', token):
+            gamma = float(token)
+        elif flags and flags[-1] == 'no':
+            flags[-1] = 'no_' + token
+        else:
+            flags.append(token)
+    hidden = [size for size in re.split(r'[, ]+', match.group('hidden')) if size]
+    return {'name': name, 'reward': match.group('reward'), 'weight': float(match.group('weight')),
+            'hidden_sizes': hidden_key(hidden), 'activation': match.group('activation'), 'gamma': gamma,
+            'flags': ','.join(flags)}
+
+
+def read_config(run_dir: str) -> dict:
+    """
+    Entries of config.json of the run, hidden sizes and activation of ac_kwargs included
+    """
+    path = os.path.join(run_dir, 'config.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as json_file:
+        config = json.load(json_file)
+    entries = {key: config[key] for key in CONFIG_KEYS if key in config}
+    ac_kwargs = config.get('ac_kwargs', {})
+    if 'hidden_sizes' in ac_kwargs:
+        entries['hidden_sizes'] = hidden_key(ac_kwargs['hidden_sizes'])
+    if 'activation' in ac_kwargs:
+        entries['activation'] = str(ac_kwargs['activation']).lower()
+    return entries
+
+
+def default_index_path(root: str) -> str:
+    """
+    Index file of the runs under root in RESULTS_DIR, one per root
+    """
+    digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:12]
+    return os.path.join(RESULTS_DIR, 'training_index_{}.npz'.format(digest))
+
+
+class TrainingLogIndex:
+    """
+    Index of the training runs under a root directory (src/data or a controller directory): metadata from the run
+    directory names and config.json, and the progress.txt tables of all the runs stored in a single columnar .npz.
+    update reads only the lines added to the progress files since the previous update.
+    """
+
+    RUNS_KEY: str = '__runs__'
+    RUN_ID: str = 'run_id'
+
+    def __init__(self, root: str = 'src/data', path: str = None, update: bool = True):
+        """
+        :param root: Directory searched for the progress.txt files
+        :param path: Index file, default_index_path(root) by default (out of the data directory)
+        :param update: Read the new epochs now
+        """
+        self.root: str = root
+        self.path: str = path or default_index_path(root)
+        # Relative run directory -> run id, metadata, read offset, size and mtime of its progress.txt
+        self.runs: Dict[str, dict] = {}
+        self.columns: Dict[str, np.ndarray] = {self.RUN_ID: np.zeros(0, dtype=np.int64)}
+        if os.path.exists(self.path):
+            self.load()
+        if update:
+            self.update()
+
+    def load(self):
+        with np.load(self.path) as data:
+            self.runs = json.loads(str(data[self.RUNS_KEY]))
+            self.columns = {column: data[column] for column in data.files if column != self.RUNS_KEY}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # np.savez appends .npz to the names without it
+        tmp_path = self.path[:-len('.npz')] + '.tmp.npz' if self.path.endswith('.npz') else self.path + '.tmp.npz'
+        np.savez(tmp_path, **self.columns, **{self.RUNS_KEY: np.array(json.dumps(self.runs))})
+        os.replace(tmp_path, self.path)
+
+    def n_rows(self) -> int:
+        return len(self.columns[self.RUN_ID])
+
+    def drop_rows(self, run_id: int):
+        keep = self.columns[self.RUN_ID] != run_id
+        self.columns = {column: values[keep] for column, values in self.columns.items()}
+
+    def append_rows(self, run_id: int, header: List[str], lines: List[str]):
+        rows = np.array([[float(value) for value in line.split('\t')] for line in lines]).reshape(-1, len(header))
+        n_rows: int = self.n_rows()
+        for column in header:
+            if column not in self.columns:
+                self.columns[column] = np.full(n_rows, np.nan)
+        new_columns = {self.RUN_ID: np.full(len(rows), run_id, dtype=np.int64)}
+        new_columns.update({column: rows[:, header.index(column)] if column in header else np.full(len(rows), np.nan)
+                            for column in self.columns if column != self.RUN_ID})
+        self.columns = {column: np.concatenate([values, new_columns[column]])
+                        for column, values in self.columns.items()}
+
+    def update_run(self, run_dir: str, progress_path: str) -> bool:
+        """
+        Read the lines of progress_path added since the previous update
+        :return: True if the index changed
+        """
+        stat = os.stat(progress_path)
+        run = self.runs.get(run_dir)
+        if run is not None and run['size'] == stat.st_size and run['mtime'] == stat.st_mtime:
+            return False
+        if run is None:
+            run_id: int = max([other['id'] for other in self.runs.values()], default=-1) + 1
+            name = os.path.basename(run_dir)
+            metadata = dict(parse_run_name(name), group=os.path.dirname(run_dir).replace(os.sep, '/'))
+            metadata.update(read_config(os.path.join(self.root, run_dir)))
+            run = {'id': run_id, 'metadata': metadata, 'offset': 0, 'header': None}
+            self.runs[run_dir] = run
+        if stat.st_size < run['offset']:
+            # Rewritten progress (resumed run), read again from the start
+            self.drop_rows(run['id'])
+            run['offset'], run['header'] = 0, None
+
+        with open(progress_path, 'rb') as progress_file:
+            progress_file.seek(run['offset'])
+            data = progress_file.read()
+        # Only the complete lines, an epoch being written is read at the next update
+        end: int = data.rfind(b'\n') + 1
+        lines = [line for line in data[:end].decode().split('\n') if line.strip()]
+        if run['header'] is None and lines:
+            run['header'] = [column.strip() for column in lines.pop(0).split('\t')]
+        if lines:
+            self.append_rows(run['id'], run['header'], lines)
+        run['offset'] += end
+        run['size'], run['mtime'] = stat.st_size, stat.st_mtime
+        return True
+
+    def update(self) -> int:
+        """
+        Index the new runs and the new epochs of the known ones
+        :return: Number of runs updated
+        """
+        n_updated: int = 0
+        for progress_path in sorted(glob.glob(os.path.join(glob.escape(self.root), '**', 'progress.txt'),
+                                              recursive=True)):
+            run_dir = os.path.relpath(os.path.dirname(progress_path), self.root).replace(os.sep, '/')
+            n_updated += self.update_run(run_dir, progress_path)
+        if n_updated:
+            self.save()
+        return n_updated
+
+    def run_table(self) -> pd.DataFrame:
+        """
+        Metadata of the runs, indexed by run id
+        """
+        rows = [dict(run['metadata'], run_id=run['id'], path=run_dir) for run_dir, run in self.runs.items()]
+        return pd.DataFrame(rows).set_index(self.RUN_ID).sort_index()
+
+    def select(self, **filters) -> pd.DataFrame:
+        """
+        Runs whose metadata match the filters, select(group='black_box_controller/e_r', activation='relu')
+        """
+        runs = self.run_table()
+        for key, value in filters.items():
+            runs = runs[runs[key] == value]
+        return runs
+
+    def progress(self, run: Optional[str] = None, run_ids: List[int] = None) -> pd.DataFrame:
+        """
+        Progress table of a run (relative directory), of a list of runs, or of all the runs
+        """
+        ids = self.columns[self.RUN_ID]
+        if run is not None:
+            keep = ids == self.runs[run]['id']
+        elif run_ids is not None:
+            keep = np.isin(ids, run_ids)
+        else:
+            keep = np.ones(len(ids), dtype=bool)
+        return pd.DataFrame({column: values[keep] for column, values in self.columns.items()})
+
+    def summary(self, metric: str = 'AverageTestEpRet', **filters) -> pd.DataFrame:
+        """
+        Best value of the metric (and its epoch) and last value of every selected run
+        """
+        runs = self.select(**filters)
+        progress = self.progress(run_ids=list(runs.index))
+        progress = progress[np.isfinite(progress[metric])]
+        grouped = progress.groupby(self.RUN_ID)
+        best_rows = progress.loc[grouped[metric].idxmax()]
+        summary = pd.DataFrame({'best_' + metric: best_rows[metric].to_numpy(),
+                                'best_epoch': best_rows['Epoch'].to_numpy()}, index=best_rows[self.RUN_ID].to_numpy())
+        summary['last_' + metric] = grouped[metric].last()
+        summary['n_epochs'] = grouped.size()
+        return runs.join(summary, how='inner')
+
+    def best(self, by: str = 'hidden_sizes', metric: str = 'AverageTestEpRet', **filters) -> pd.DataFrame:
+        """
+        Best run of every value of a metadata key, best("hidden_sizes") gives the best AverageTestEpRet per hidden size
+        """
+        summary = self.summary(metric, **filters)
+        best_runs = summary.loc[summary.groupby(by)['best_' + metric].idxmax()]
+        return best_runs.sort_values('best_' + metric, ascending=False)
+
+    def logs(self, group: str) -> Tuple[List[str], List[pd.DataFrame]]:
+        """
+        Run names and progress tables of a controller / reward directory, as read by analyse_training
+        """
+        runs = self.select(group=group)
+        return list(runs['name']), [self.progress(run_ids=[run_id]).drop(columns=self.RUN_ID) for run_id in
+                                    runs.index]
@@ -1,2 +1,7 @@
 from .simulation import *
 from .environement import *
+from .vec_environement import *
+from .kernels import JIT_AVAILABLE, plant_step, rollout_pid, rollout_mlp, pack_mlp
+from .scenarios import ScenarioBank
+from .trajectories import TRAJECTORY_GENERATORS, trajectory_batch, mixed_trajectory_batch, random_walks, steps, \
+    circles, figure_eights, chirps
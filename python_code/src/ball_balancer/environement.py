@@ -1,5 +1,7 @@
+import math
+import time
 from abc import ABC
-from typing import Callable, Tuple
+from typing import Callable, Dict, Tuple
 
 import gym
 import numpy as np
@@ -8,8 +10,10 @@ import matplotlib
 import matplotlib.pyplot as plt
 
 from gym import spaces
-from .simulation import BbSimulation, loss, BbSimulation1D
-from ..DDPG.controllers import BallController
+from .simulation import BbSimulation, loss, BbSimulation1D, dema_step
+from .kernels import plant_state, plant_coefficients, pack_mlp, rollout_mlp, rollout_pid
+from .trajectories import random_walks
+from ..DDPG.controllers import BallController, PidController
 from ..constants import MAX_X, DT, BALL_ERROR_SCALING, BALL_D_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, MAX_ANGLE, \
     FILTERING_PERIOD, BALL_MAX_INTEGRAL
 from mpl_toolkits import mplot3d
@@ -27,11 +31,12 @@ def target_gen():
 
 
 def trajectory_gen(length: int) -> np.ndarray:
-    gen = target_gen()
-    trajectory = np.zeros((2, length))
-    for i in range(length):
-        trajectory[:, i] = next(gen)
-    return trajectory
+    """
+    Trajectory of target_gen, the increments are drawn from the global generator in the same order: a seed gives the
+    same trajectory up to rounding and leaves the generator in the same state
+    """
+    noise = np.random.normal(0., 1., (length, 2)).T
+    return random_walks(1, length, noise=noise[None])[0]
 
 
 # Reward functions eroor
@@ -70,6 +75,78 @@ def linear_de_penality_reward(error: np.ndarray, d_error: np.ndarray, target: np
         np.abs(target))) / (1. + 2. * w)
 
 
+# Batched reward functions, (N, 2) error, d_error and target arrays -> (N,) rewards, without side effects
+def batched_linear_e_reward(error: np.ndarray, d_error: np.ndarray, target: np.ndarray, w) -> np.ndarray:
+    return np.tanh(1. - (np.sum(np.abs(error), axis=-1) * 30.) ** w)
+
+
+def batched_linear_e_reward_penality(error: np.ndarray, d_error: np.ndarray, target: np.ndarray, w) -> np.ndarray:
+    return (2. * w + np.tanh(1. - (np.sum(np.abs(error), axis=-1) * 30.) ** 0.5) - w * np.sum(np.abs(target), axis=-1)
+            ) / (1. + 2. * w)
+
+
+def batched_quadratic_e_reward(error: np.ndarray, d_error: np.ndarray, target: np.ndarray, w) -> np.ndarray:
+    return np.tanh(1. - (np.sum(np.float_power(error * 10., 2) ** w, axis=-1)))
+
+
+def batched_quadratic_e_reward_penality(error: np.ndarray, d_error: np.ndarray, target: np.ndarray,
+                                        w) -> np.ndarray:
+    return (2. * w + np.tanh(1. - (np.sum(np.float_power(error * 10., 2), axis=-1))) -
+            w * np.sum(np.abs(target), axis=-1)) / (1. + 2. * w)
+
+
+def crossing_mask(error: np.ndarray, d_error: np.ndarray) -> np.ndarray:
+    """
+    Components for which the error changes sign during the next time step
+    """
+    return (d_error * DT + error) * np.sign(error) < 0.
+
+
+def batched_linear_de_reward(error: np.ndarray, d_error: np.ndarray, target: np.ndarray, w) -> np.ndarray:
+    d_error = np.where(crossing_mask(error, d_error), - error - d_error * DT, d_error)
+    return np.tanh(- np.sum(np.sign(error) * d_error * DT * BALL_D_ERROR_SCALING * w, axis=-1))
+
+
+def batched_linear_de_penality_reward(error: np.ndarray, d_error: np.ndarray, target: np.ndarray,
+                                      w) -> np.ndarray:
+    d_error = np.where(crossing_mask(error, d_error), (- error - d_error * DT) / DT, d_error)
+    return (2. * w + np.tanh(- np.sum(np.sign(error) * d_error * DT * BALL_D_ERROR_SCALING * 15., axis=-1)) -
+            w * np.sum(np.abs(target), axis=-1)) / (1. + 2. * w)
+
+
+# Batched version of the reward functions
+BATCHED_REWARDS = {
+    linear_e_reward: batched_linear_e_reward,
+    linear_e_reward_penality: batched_linear_e_reward_penality,
+    quadratic_e_reward: batched_quadratic_e_reward,
+    quadratic_e_reward_penality: batched_quadratic_e_reward_penality,
+    linear_de_reward: batched_linear_de_reward,
+    linear_de_penality_reward: batched_linear_de_penality_reward,
+}
+
+
+def benchmark_rewards(n_samples: int = 10000, w: float = 0.5) -> Dict[str, Dict[str, float]]:
+    """
+    Time the scalar reward functions looped over n_samples against their batched version
+    :return: Per reward function: scalar_s, batched_s, speedup and max_error between the two versions
+    """
+    error = np.random.uniform(- MAX_X, MAX_X, (n_samples, 2))
+    d_error = np.random.uniform(- MAX_X / DT, MAX_X / DT, (n_samples, 2))
+    target = np.random.uniform(-1., 1., (n_samples, 2))
+    results = {}
+    for reward_fn, batched_reward_fn in BATCHED_REWARDS.items():
+        start = time.perf_counter()
+        rewards = np.array([reward_fn(e, de.copy(), t, w) for e, de, t in zip(error, d_error, target)])
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batched_rewards = batched_reward_fn(error, d_error, target, w)
+        batched_time = time.perf_counter() - start
+        results[reward_fn.__name__] = {'scalar_s': scalar_time, 'batched_s': batched_time,
+                                       'speedup': scalar_time / batched_time,
+                                       'max_error': float(np.abs(rewards - batched_rewards).max())}
+    return results
+
+
 def test_reward():
     error: np.ndarray = np.arange(-MAX_X, 0., 0.001)
     w: np.ndarray = np.arange(0.3, 0.9, 0.1)
@@ -80,9 +157,8 @@ def test_reward():
     x_d_error_sum, angle_sum_d = np.meshgrid(d_error, target)
 
     # Linear reward
-    z: list = [np.array([linear_e_reward(np.array([x, x]), 0., 0., weight) for x in error]) for weight in w]
-    Z: np.ndarray = np.array([[linear_e_reward(np.array([x, y]), 0., 0., 0.6) for x, y in zip(x_row, y_row)] for x_row, y_row in
-                  zip(x_error, y_error)])
+    z: list = [batched_linear_e_reward(np.stack([error, error], axis=-1), 0., 0., weight) for weight in w]
+    Z: np.ndarray = batched_linear_e_reward(np.stack([x_error, y_error], axis=-1), 0., 0., 0.6)
 
     plt.figure()
     for weight, ts in zip(w, z):
@@ -104,10 +180,8 @@ def test_reward():
     plt.show()
 
     # Linear penality
-    Z: np.ndarray = np.array(
-        [[linear_e_reward_penality(np.array([x, x]), 0., np.array([y, y]), 0.3) for x, y in zip(x_row, y_row)] for
-         x_row, y_row in
-         zip(x_error_sum, angle_sum)])
+    Z: np.ndarray = batched_linear_e_reward_penality(np.stack([x_error_sum, x_error_sum], axis=-1), 0.,
+                                                     np.stack([angle_sum, angle_sum], axis=-1), 0.3)
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
     ax.view_init(30, 120)
     # Plot the surface.
@@ -121,9 +195,8 @@ def test_reward():
 
     # Quadratic reward
     w: np.ndarray = np.arange(0.8, 1.5, 0.2)
-    z: list = [np.array([quadratic_e_reward(np.array([x, x]), 0., 0., weight) for x in error]) for weight in w]
-    Z: np.ndarray = np.array([[quadratic_e_reward(np.array([x, y]), 0., 0., 1.) for x, y in zip(x_row, y_row)] for x_row, y_row in
-                  zip(x_error, y_error)])
+    z: list = [batched_quadratic_e_reward(np.stack([error, error], axis=-1), 0., 0., weight) for weight in w]
+    Z: np.ndarray = batched_quadratic_e_reward(np.stack([x_error, y_error], axis=-1), 0., 0., 1.)
 
     plt.figure()
     for weight, ts in zip(w, z):
@@ -145,10 +218,8 @@ def test_reward():
     plt.show()
 
     # Quadratic penality
-    Z: np.ndarray = np.array(
-        [[quadratic_e_reward_penality(np.array([x, x]), 0., np.array([y, y]), 0.3) for x, y in zip(x_row, y_row)] for
-         x_row, y_row in
-         zip(x_error_sum, angle_sum)])
+    Z: np.ndarray = batched_quadratic_e_reward_penality(np.stack([x_error_sum, x_error_sum], axis=-1), 0.,
+                                                        np.stack([angle_sum, angle_sum], axis=-1), 0.3)
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
     ax.view_init(30, 120)
     # Plot the surface.
@@ -163,7 +234,7 @@ def test_reward():
     # De reward
     e: np.ndarray = np.array([0.5, 0.5])
     w: np.ndarray = np.arange(5, 35, 10)
-    z: list = [np.array([linear_de_reward(e, np.array([x, x]), 0., weight) for x in d_error]) for weight in w]
+    z: list = [batched_linear_de_reward(e, np.stack([d_error, d_error], axis=-1), 0., weight) for weight in w]
 
     plt.figure()
     for weight, ts in zip(w, z):
@@ -175,10 +246,8 @@ def test_reward():
     plt.show()
 
     # De penality
-    Z: np.ndarray = np.array(
-        [[linear_de_penality_reward(e, np.array([x, x]), np.array([y, y]), 0.3) for x, y in zip(x_row, y_row)] for
-         x_row, y_row in
-         zip(x_d_error_sum, angle_sum_d)])
+    Z: np.ndarray = batched_linear_de_penality_reward(e, np.stack([x_d_error_sum, x_d_error_sum], axis=-1),
+                                                      np.stack([angle_sum_d, angle_sum_d], axis=-1), 0.3)
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
     ax.view_init(30, 120)
     # Plot the surface.
@@ -199,12 +268,49 @@ def env_fn_gen(env, reward_fn, reward_weight) -> Callable:
     return create_env
 
 
+# In place step state
+class BBEnvBuffer:
+    """
+    Preallocated state of the in place step path of BBEnvBasis. Every field is a (2,) (x, y) view of a single float64
+    buffer, error, d_error and integral follow each other and form the (6,) unscaled observation.
+    """
+
+    FIELDS: Tuple[str, ...] = ('target', 'ball', 'speed', 'ema', 'ema_ema', 'obs_error', 'obs_d_error', 'integral',
+                               'real_error', 'real_d_error', 'error', 'd_error', 'i_error')
+    # Offsets of the fields in the buffer
+    TARGET, BALL, SPEED, EMA, EMA_EMA, OBS_ERROR, OBS_D_ERROR, INTEGRAL, REAL_ERROR, REAL_D_ERROR, ERROR, D_ERROR, \
+        I_ERROR = range(0, 2 * len(FIELDS), 2)
+
+    def __init__(self):
+        self.values: np.ndarray = np.zeros(2 * len(self.FIELDS))
+        for i, field in enumerate(self.FIELDS):
+            setattr(self, field, self.values[2 * i:2 * i + 2])
+        self.observation: np.ndarray = self.values[self.OBS_ERROR:self.INTEGRAL + 2]
+
+        # Scaled observations returned by the steps. The two rows are used in turn, the observation returned by the
+        # previous step stays valid (o and o2 of a transition). Same for the float32 info observations
+        self.scaled: np.ndarray = np.zeros((2, 6), dtype=np.float32)
+        self.info_observation: np.ndarray = np.zeros((2, 6), dtype=np.float32)
+        self.scaled_row: int = 0
+        # Motors command of BBEnvPid, given to the reward
+        self.command: np.ndarray = np.zeros(2)
+        self.scaling: np.ndarray = np.array([BALL_ERROR_SCALING] * 2 + [BALL_D_ERROR_SCALING] * 2 +
+                                            [BALL_INTEGRAL_ERROR_SCALING] * 2)
+
+
 # Environement "trait"
 class BBEnvBasis(gym.Env, BbSimulation, ABC):
     """
     Abstract class for the environement, it ensure having the same environement for the commun methods and allows easy modifications
+
+    With in_place the steps work on the preallocated BBEnvBuffer: no numpy array is allocated by the environement,
+    the observation is kept in float64 and the returned float32 scaled and info observations are views reused every
+    other step (copy them to keep them longer). The remaining allocations are the python floats and lists of the
+    transition (the buffer is read with one tolist and written back at once), the info dict and the ones of the
+    reward function (the rewards of this module work on (2,) arrays).
+    With return_info False the steps return an empty info dict.
     """
-    def __init__(self, reward_func=linear_e_reward, reward_w=0.5):
+    def __init__(self, reward_func=linear_e_reward, reward_w=0.5, in_place: bool = False, return_info: bool = True):
         super(BBEnvBasis, self).__init__()
 
         # Actions, State, Observation
@@ -224,6 +330,8 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
         self.real_error: np.ndarray = np.array([0., 0.])
         self.real_d_error: np.ndarray = np.array([0., 0.])
         self.alpha: float = 2. / (1. + FILTERING_PERIOD)
+        # Target jumps, see seed
+        self.np_random: np.random.Generator = np.random.default_rng()
 
         # Traing parameters
         self.max_iter: int = int(10. // DT)
@@ -231,6 +339,11 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
         self.reward: Callable = reward_func
         self.w: float = reward_w
 
+        # In place step path
+        self.in_place: bool = in_place
+        self.return_info: bool = return_info
+        self.buffer: BBEnvBuffer = BBEnvBuffer()
+
         self.reset()
 
     def step(self, action):
@@ -263,10 +376,11 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
         self.ball.x = self.genetic_initial_state[1]
         self.ball.d_x = self.genetic_initial_state[2]
 
-        self.observe()
-        self.iter = 0
+        # Filter initialised before observing, the candidates rollouts must not depend on the previous one
         self.ema = self.state[1]
         self.ema_ema = self.state[1]
+        self.observe()
+        self.iter = 0
         self.real_error = np.array([0., 0.])
         self.real_d_error = np.array([0., 0.])
 
@@ -276,6 +390,20 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
         self.genetic_initial_state = self.state_space.sample()
         print(self.genetic_initial_state[0])
 
+    def seed(self, seed=None):
+        """
+        Seed the random initial states and the random target jumps (generator of the environement, the numpy global
+        one is left untouched)
+        """
+        self.state_space.seed(seed)
+        self.observation_space.seed(seed)
+        self.np_random = np.random.default_rng(seed)
+        # The next reset observes with the filter of the previous episode, it must not come from an unseeded one.
+        # float64 whatever the previous episode left (float32 samples), the filter rounding must not depend on it
+        self.ema = np.zeros_like(self.ema, dtype=np.float64)
+        self.ema_ema = np.zeros_like(self.ema_ema, dtype=np.float64)
+        return [seed]
+
     def test_reset(self):
         self.reset_bb()
         zero_arr = np.zeros_like(self.state_space.sample()[0])
@@ -296,9 +424,7 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
 
     def observe(self):
         obs = np.zeros_like(self.observation)
-        ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-        ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-        dema = (2. * ema) - ema_ema
+        dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
         obs[0:2] = dema - self.state[0]
         real_error = self.state[1] - self.state[0]
         self.real_d_error = (real_error - self.real_error) / DT
@@ -318,6 +444,97 @@ class BBEnvBasis(gym.Env, BbSimulation, ABC):
         observation[4:6] = self.observation[4:6] * BALL_INTEGRAL_ERROR_SCALING
         return observation
 
+    def step_info(self) -> dict:
+        if self.return_info:
+            if self.in_place:
+                # float32 as the observation of the default path, in the row of the scaled observation
+                buf = self.buffer
+                info_observation = buf.info_observation[buf.scaled_row]
+                np.copyto(info_observation, buf.observation, casting='same_kind')
+                return {'state': self.state, 'observation': info_observation}
+            return {'state': self.state, 'observation': self.observation}
+        return {}
+
+    def bind_buffer(self):
+        """
+        Point the state attributes to the views of the in place buffer. The attributes rebound since the last call
+        (resets, simulate) are copied to the buffer first.
+        """
+        buf = self.buffer
+        for name in ('ema', 'ema_ema', 'real_error', 'real_d_error', 'error', 'd_error', 'i_error', 'observation'):
+            view = getattr(buf, name)
+            value = getattr(self, name)
+            if value is not view:
+                view[:] = value
+                setattr(self, name, view)
+        for view, value in ((buf.target, self.state[0]), (buf.ball, self.ball.x), (buf.speed, self.ball.d_x)):
+            if value is not view:
+                view[:] = value
+        self.ball.x = buf.ball
+        self.ball.d_x = buf.speed
+        if self.state[0] is not buf.target or self.state[1] is not buf.ball or self.state[2] is not buf.speed:
+            self.state = (buf.target, buf.ball, buf.speed)
+
+    def transition_in_place(self, angle_x: float, angle_y: float):
+        """
+        step_bb followed by observe, computed on python floats. The buffer is read and written back at once.
+        :param angle_x: Motor x angle target
+        :param angle_y: Motor y angle target
+        """
+        buf = self.buffer
+        s = buf.values.tolist()
+
+        # Motors, each with the gains of its own pid
+        for k, motor, pid, target in ((0, self.motor_x, self.motor_pid_x, angle_x),
+                                      (1, self.motor_y, self.motor_pid_y, angle_y)):
+            w_e, w_de, w_ie = pid.w.tolist()
+            b = float(pid.b)
+            error = target - motor.angle
+            d_error = (error - s[buf.ERROR + k]) / DT
+            i_error = s[buf.I_ERROR + k] + error * DT
+            s[buf.ERROR + k], s[buf.D_ERROR + k], s[buf.I_ERROR + k] = error, d_error, i_error
+            motor.step(w_e * error + w_de * d_error + w_ie * i_error + b)
+
+        # Ball
+        (a_00, a_01, a_02, a_03), (a_10, a_11, a_12, a_13) = self.ball.a.tolist()
+        sin_x = math.sin(math.pi / 180. * self.motor_x.angle)
+        sin_y = math.sin(math.pi / 180. * self.motor_y.angle)
+        d_x, d_y = s[buf.SPEED], s[buf.SPEED + 1]
+        d_x, d_y = (d_x + (a_00 * d_x + a_01 * d_y + a_02 * sin_x + a_03 * sin_y),
+                    d_y + (a_10 * d_x + a_11 * d_y + a_12 * sin_x + a_13 * sin_y))
+        s[buf.SPEED], s[buf.SPEED + 1] = d_x, d_y
+        s[buf.BALL] += d_x * DT
+        s[buf.BALL + 1] += d_y * DT
+
+        # Observation
+        alpha = self.alpha
+        for k in (0, 1):
+            ball = s[buf.BALL + k]
+            target = s[buf.TARGET + k]
+            ema = alpha * ball + (1 - alpha) * s[buf.EMA + k]
+            ema_ema = alpha * ema + (1 - alpha) * s[buf.EMA_EMA + k]
+            error = (2. * ema) - ema_ema - target
+            s[buf.OBS_D_ERROR + k] = (error - s[buf.OBS_ERROR + k]) / DT
+            s[buf.OBS_ERROR + k] = error
+            s[buf.INTEGRAL + k] = max(min(s[buf.INTEGRAL + k] + error * DT, BALL_MAX_INTEGRAL), - BALL_MAX_INTEGRAL)
+            real_error = ball - target
+            s[buf.REAL_D_ERROR + k] = (real_error - s[buf.REAL_ERROR + k]) / DT
+            s[buf.REAL_ERROR + k] = real_error
+            s[buf.EMA + k], s[buf.EMA_EMA + k] = ema, ema_ema
+
+        buf.values[:] = s
+
+    def scaled_obs_in_place(self) -> np.ndarray:
+        """
+        scaled_obs written to the next row of the scaled observations buffer
+        """
+        buf = self.buffer
+        buf.scaled_row ^= 1
+        return np.multiply(buf.observation, buf.scaling, out=buf.scaled[buf.scaled_row], casting='same_kind')
+
+    def jump_target_in_place(self, axis: int):
+        self.buffer.target[axis] = self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)
+
     def render(self, mode='human'):
         pass
 
@@ -327,8 +544,8 @@ class BBEnv(BBEnvBasis):
     Ball balancer environement, obs -> motors angle
     """
 
-    def __init__(self, reward_func=linear_e_reward, reward_w=0.5):
-        super(BBEnv, self).__init__()
+    def __init__(self, reward_func=linear_e_reward, reward_w=0.5, in_place: bool = False, return_info: bool = True):
+        super(BBEnv, self).__init__(in_place=in_place, return_info=return_info)
 
         # Actions, State, Observation
         self.action_space = spaces.Box(low=-1., high=1., shape=(2,), dtype=np.float32)
@@ -344,6 +561,8 @@ class BBEnv(BBEnvBasis):
         print(self.state)
 
     def step(self, action):
+        if self.in_place:
+            return self.step_in_place(action)
         self.step_bb(action * MAX_ANGLE)
         self.state = (self.state[0], self.ball.x, self.ball.d_x)
         self.observe()
@@ -352,16 +571,29 @@ class BBEnv(BBEnvBasis):
         self.iter += 1
         if self.iter == 200:
             self.state = (
-                np.array([np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
+                np.array([self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
                 self.state[2])
         if self.iter == 300:
             self.state = (
-                np.array([self.state[0][0], np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
+                np.array([self.state[0][0], self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
                 self.state[2])
         done: bool = (self.iter >= self.max_iter)  # or np.any(np.abs(self.ball.x) > 2 * MAX_X)
-        info = {'state': self.state, 'observation': self.observation}
 
-        return self.scaled_obs(), reward, done, info
+        return self.scaled_obs(), reward, done, self.step_info()
+
+    def step_in_place(self, action):
+        self.bind_buffer()
+        self.transition_in_place(float(action[0] * MAX_ANGLE), float(action[1] * MAX_ANGLE))
+        reward: float = self.reward(self.real_error, self.real_d_error, action, self.w)
+
+        self.iter += 1
+        if self.iter == 200:
+            self.jump_target_in_place(0)
+        if self.iter == 300:
+            self.jump_target_in_place(1)
+        done: bool = (self.iter >= self.max_iter)
+
+        return self.scaled_obs_in_place(), reward, done, self.step_info()
 
     def simulate(self, model, target_trajectory: np.ndarray) -> Tuple[
         np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
@@ -375,9 +607,7 @@ class BBEnv(BBEnvBasis):
 
         for i in range(1, target_trajectory.shape[1]):
             trajectory[:, i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[:, i] = dema - target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
             integral = integral + error[:, i] * DT
@@ -405,14 +635,27 @@ class BBEnv(BBEnvBasis):
 
         return trajectory, error, u, angle, loss(error)
 
+    def simulate_kernel(self, model: torch.nn.Module, target_trajectory: np.ndarray, act_limit: float = 1.) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
+        """
+        simulate on the compiled rollout_mlp kernel (plain python if numba is not installed)
+        :param model: Chain of Linear layers and activations, see kernels.pack_mlp
+        :param act_limit: Scaling of the model output
+        """
+        self.test_reset()
+        flat, layout = pack_mlp(model)
+        trajectory, error, u, angle = rollout_mlp(plant_state(self), plant_coefficients(self), flat, layout,
+                                                  act_limit, np.asarray(target_trajectory, dtype=np.float64))
+        return trajectory, error, u, angle, loss(error)
+
 
 class BBEnvPid(BBEnvBasis):
     """
     Ball balancer environement for dynamic PID, obs -> pid weights
     """
 
-    def __init__(self, reward_func=linear_e_reward, reward_w=0.5):
-        super(BBEnvPid, self).__init__()
+    def __init__(self, reward_func=linear_e_reward, reward_w=0.5, in_place: bool = False, return_info: bool = True):
+        super(BBEnvPid, self).__init__(in_place=in_place, return_info=return_info)
 
         # Actions, State, Observation
         self.action_space = spaces.Box(low=0., high=2.5, shape=(6,), dtype=np.float32)
@@ -431,6 +674,8 @@ class BBEnvPid(BBEnvBasis):
         print(self.state)
 
     def step(self, action):
+        if self.in_place:
+            return self.step_in_place(action)
         obs = self.scaled_obs()
         u_x = np.sum(action[[0, 2, 4]] * obs[[0, 2, 4]])
         u_y = np.sum(action[[1, 3, 5]] * obs[[1, 3, 5]])
@@ -443,16 +688,38 @@ class BBEnvPid(BBEnvBasis):
         self.iter += 1
         if self.iter == 100:
             self.state = (
-                np.array([np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
+                np.array([self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
                 self.state[2])
         if self.iter == 200:
             self.state = (
-                np.array([self.state[0][0], np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
+                np.array([self.state[0][0], self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
                 self.state[2])
         done: bool = (self.iter >= self.max_iter) or np.any(np.abs(self.ball.x) > 2 * MAX_X)
-        info = {'state': self.state, 'observation': self.observation}
 
-        return self.scaled_obs(), reward, done, info
+        return self.scaled_obs(), reward, done, self.step_info()
+
+    def step_in_place(self, action):
+        self.bind_buffer()
+        buf = self.buffer
+        e_x, e_y, de_x, de_y, ie_x, ie_y = [o * scaling for o, scaling in zip(buf.observation.tolist(),
+                                                                              buf.scaling.tolist())]
+        k_p_x, k_p_y, k_d_x, k_d_y, k_i_x, k_i_y = action.tolist()
+        u_x = math.tanh(k_p_x * e_x + k_d_x * de_x + k_i_x * ie_x)
+        u_y = math.tanh(k_p_y * e_y + k_d_y * de_y + k_i_y * ie_y)
+        self.transition_in_place(u_x * MAX_ANGLE, u_y * MAX_ANGLE)
+        buf.command[0] = u_x
+        buf.command[1] = u_y
+        reward: float = self.reward(self.real_error, self.real_d_error, buf.command, self.w)
+
+        self.iter += 1
+        if self.iter == 100:
+            self.jump_target_in_place(0)
+        if self.iter == 200:
+            self.jump_target_in_place(1)
+        x, y = buf.ball.tolist()
+        done: bool = (self.iter >= self.max_iter) or abs(x) > 2 * MAX_X or abs(y) > 2 * MAX_X
+
+        return self.scaled_obs_in_place(), reward, done, self.step_info()
 
     def simulate(self, model, target_trajectory: np.ndarray) -> Tuple[
         np.ndarray, np.ndarray, np.ndarray, np.ndarray, float, np.ndarray, np.ndarray, np.ndarray]:
@@ -469,9 +736,7 @@ class BBEnvPid(BBEnvBasis):
 
         for i in range(1, target_trajectory.shape[1]):
             trajectory[:, i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[:, i] = dema - target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
             integral = integral + error[:, i] * DT
@@ -509,10 +774,52 @@ class BBEnvPid(BBEnvBasis):
 # Benchmark Environement
 class BenchmarkEvaluator(BBEnv):
 
-    def __init__(self, target_trajectory: np.ndarray):
+    def __init__(self, target_trajectory: np.ndarray, fast_path: bool = False):
         super(BenchmarkEvaluator, self).__init__()
 
         self.target_trajectory: np.ndarray = target_trajectory
+        # Use simulate_linear for PidController models in evaluate
+        self.fast_path: bool = fast_path
+        self.motor_f, self.motor_g, self.motor_h, self.ball_f, self.ball_g = self.plant_matrices()
+
+    def plant_matrices(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        State space form of the plant, linear between the saturations.
+        Motor (per axis, with the pid and motor of the axis), state [angle, speed, error, integral error] and input u
+        the angle target:
+            z_m' = F_m z_m + G_m u + h_m
+        Ball (both axes), state [x, y, d_x, d_y] and input [sin(angle_x), sin(angle_y)]:
+            z_b' = F_b z_b + G_b sin(angle)
+        :return: F_m (2, 4, 4), G_m (2, 4), h_m (2, 4), F_b, G_b
+        """
+        motor_f = np.zeros((2, 4, 4))
+        motor_g = np.zeros((2, 4))
+        motor_h = np.zeros((2, 4))
+        for axis, (pid, motor) in enumerate(((self.motor_pid_x, self.motor_x), (self.motor_pid_y, self.motor_y))):
+            w = pid.w
+            b = pid.b
+            u_coef = motor.motor.u_coef
+            s_coef = motor.motor.s_coef / motor.motor.speed_scaling
+
+            # Motor pid output, from the state and from the input
+            pid_f = np.array([- w[0] - w[1] / DT - w[2] * DT, 0., - w[1] / DT, w[2]])
+            pid_g = w[0] + w[1] / DT + w[2] * DT
+
+            speed_f = u_coef * pid_f + np.array([0., s_coef, 0., 0.])
+            motor_f[axis] = np.array([
+                np.array([1., 0., 0., 0.]) + DT * speed_f,  # Angle
+                speed_f,  # Speed
+                [-1., 0., 0., 0.],  # Error
+                [-DT, 0., 0., 1.],  # Integral error
+            ])
+            motor_g[axis] = np.array([DT * u_coef * pid_g, u_coef * pid_g, 1., DT])
+            motor_h[axis] = np.array([DT * u_coef * b, u_coef * b, 0., 0.])
+
+        speed_f = np.eye(2) + self.ball.a[:, :2]
+        ball_f = np.block([[np.eye(2), DT * speed_f], [np.zeros((2, 2)), speed_f]])
+        ball_g = np.concatenate([DT * self.ball.a[:, 2:], self.ball.a[:, 2:]])
+
+        return motor_f, motor_g, motor_h, ball_f, ball_g
 
     def simulate(self, model: BallController, test=False) -> Tuple[
         np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
@@ -529,9 +836,7 @@ class BenchmarkEvaluator(BBEnv):
 
         for i in range(1, self.target_trajectory.shape[1]):
             trajectory[:, i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[:, i] = dema - self.target_trajectory[:, i]
             error[:, i] = self.ball.x - self.target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
@@ -550,7 +855,79 @@ class BenchmarkEvaluator(BBEnv):
 
         return trajectory, error, u, angle, loss(error)
 
+    def simulate_linear(self, gains: np.ndarray, test=False) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Same rollout as simulate for a PidController, run on the plant_matrices recurrence. Only the tanh of the
+        controller, the motor angle and integral clamps and the sin of the angles are applied element wise.
+        Every gains row is simulated from the same initial state.
+        :param gains: PidController weights (error, d_error, integral), (3,) or (P, 3) for P controllers at once
+        :return: trajectory, error, u, angle with shape (2, T) or (P, 2, T) and the loss, float or (P,)
+        """
+        if test:
+            self.test_reset()
+        else:
+            self.reset()
+        # The pid gains or motor coefficients may have changed since the construction
+        self.motor_f, self.motor_g, self.motor_h, self.ball_f, self.ball_g = self.plant_matrices()
+        single: bool = np.ndim(gains) == 1
+        gains = np.atleast_2d(gains) * np.array([BALL_ERROR_SCALING, BALL_D_ERROR_SCALING,
+                                                 BALL_INTEGRAL_ERROR_SCALING])
+        k_e, k_d, k_i = gains[:, 0:1], gains[:, 1:2], gains[:, 2:3]
+        n_controllers: int = gains.shape[0]
+        shape = (n_controllers,) + self.target_trajectory.shape
+
+        trajectory = np.zeros(shape)
+        error = np.zeros(shape)
+        u = np.zeros(shape)
+        angle = np.zeros(shape)
+        error[:, :, 0] = self.target_trajectory[:, 0]
+        integral: np.ndarray = error[:, :, 0] * DT
+
+        motor: np.ndarray = np.zeros((n_controllers, 2, 4))
+        ball: np.ndarray = np.zeros((n_controllers, 4))
+        ball[:, :2] = self.ball.x
+        ball[:, 2:] = self.ball.d_x
+
+        for i in range(1, self.target_trajectory.shape[1]):
+            trajectory[:, :, i] = ball[:, :2]
+            error[:, :, i] = ball[:, :2] - self.target_trajectory[:, i]
+            d_error: np.ndarray = (error[:, :, i] - error[:, :, i - 1]) / DT
+            integral = np.clip(integral + error[:, :, i] * DT, - BALL_MAX_INTEGRAL, BALL_MAX_INTEGRAL)
+
+            angle[:, :, i] = motor[:, :, 0]
+            u[:, :, i] = MAX_ANGLE * np.tanh(k_e * error[:, :, i] + k_d * d_error + k_i * integral)
+
+            motor = (self.motor_f @ motor[..., None])[..., 0] + u[:, :, i, None] * self.motor_g + self.motor_h
+            np.clip(motor[:, :, 0], -180., 180., out=motor[:, :, 0])
+            ball = ball @ self.ball_f.T + np.sin(np.pi / 180. * motor[:, :, 0]) @ self.ball_g.T
+
+        losses: np.ndarray = - np.power(error, 2.).sum(axis=1).mean(axis=1)
+        if single:
+            return trajectory[0], error[0], u[0], angle[0], losses[0]
+        return trajectory, error, u, angle, losses
+
+    def simulate_kernel(self, model: PidController, test=False) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
+        """
+        simulate on the compiled rollout_pid kernel (plain python if numba is not installed)
+        """
+        if test:
+            self.test_reset()
+        else:
+            self.reset()
+        gains: np.ndarray = model.predict.weight.detach().numpy()[0].astype(np.float64)
+        trajectory, error, u, angle = rollout_pid(plant_state(self), plant_coefficients(self), gains,
+                                                  np.asarray(self.target_trajectory, dtype=np.float64))
+        return trajectory, error, u, angle, loss(error)
+
+    def evaluate_linear(self, gains: np.ndarray) -> np.ndarray:
+        _, _, _, _, loss = self.simulate_linear(gains)
+        return loss
+
     def evaluate(self, model: BallController) -> float:
+        if self.fast_path and isinstance(model, PidController):
+            return self.evaluate_linear(model.predict.weight.detach().numpy()[0])
         _, _, _, _, loss = self.simulate(model)
         # print("Loss", loss)
         return loss
@@ -652,9 +1029,7 @@ class BBEnvBasis1D(gym.Env, BbSimulation1D, ABC):
 
     def observe(self):
         obs = np.zeros_like(self.observation)
-        ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-        ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-        dema = (2. * ema) - ema_ema
+        dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
         obs[0] = dema - self.state[0]
         self.last_error_sign = np.sign(obs[0])
         real_error = self.state[1] - self.state[0]
@@ -726,9 +1101,7 @@ class BBEnv1D(BBEnvBasis1D):
 
         for i in range(1, target_trajectory.shape[0]):
             trajectory[i] = self.state[1][0]
-            ema = self.alpha * self.state[1][0] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1][0], self.ema, self.ema_ema, self.alpha)
             error[i] = dema - target_trajectory[i]
             self.last_error_sign = np.sign(error[i])
             d_error: np.ndarray = (error[i] - error[i - 1]) / DT
@@ -770,9 +1143,7 @@ class BBEnv1D(BBEnvBasis1D):
 
         for i in range(1, target_trajectory.shape[1]):
             trajectory[:, i] = test_env.state[1]
-            ema = test_env.alpha * test_env.state[1] + (1 - test_env.alpha) * test_env.ema
-            ema_ema = test_env.alpha * ema + (1 - test_env.alpha) * test_env.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(test_env.state[1], test_env.ema, test_env.ema_ema, test_env.alpha)
             error[:, i] = dema - target_trajectory[:, i]
             error[:, i] = test_env.ball.x - target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
@@ -865,9 +1236,7 @@ class BBEnvPid1D(BBEnvBasis1D):
 
         for i in range(1, target_trajectory.shape[0]):
             trajectory[i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[i] = dema - target_trajectory[i]
             d_error: float = (error[i] - error[i - 1]) / DT
             integral = integral + error[i] * DT
@@ -922,6 +1291,8 @@ class BBEnvBasisNoIntegral(gym.Env, BbSimulation, ABC):
         self.real_error: np.ndarray = np.array([0., 0.])
         self.real_d_error: np.ndarray = np.array([0., 0.])
         self.alpha: float = 2. / (1. + FILTERING_PERIOD)
+        # Target jumps
+        self.np_random: np.random.Generator = np.random.default_rng()
 
         # Traing parameters
         self.max_iter: int = int(10. // DT)
@@ -960,10 +1331,11 @@ class BBEnvBasisNoIntegral(gym.Env, BbSimulation, ABC):
         self.ball.x = self.genetic_initial_state[1]
         self.ball.d_x = self.genetic_initial_state[2]
 
-        self.observe()
-        self.iter = 0
+        # Filter initialised before observing, the candidates rollouts must not depend on the previous one
         self.ema = self.state[1]
         self.ema_ema = self.state[1]
+        self.observe()
+        self.iter = 0
         self.real_error = np.array([0., 0.])
         self.real_d_error = np.array([0., 0.])
 
@@ -993,9 +1365,7 @@ class BBEnvBasisNoIntegral(gym.Env, BbSimulation, ABC):
 
     def observe(self):
         obs = np.zeros_like(self.observation)
-        ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-        ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-        dema = (2. * ema) - ema_ema
+        dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
         obs[0:2] = dema - self.state[0]
         real_error = self.state[1] - self.state[0]
         self.real_d_error = (real_error - self.real_error) / DT
@@ -1046,11 +1416,11 @@ class BBEnvNoIntegral(BBEnvBasisNoIntegral):
         self.iter += 1
         if self.iter % 200 == 0:
             self.state = (
-                np.array([np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
+                np.array([self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
                 self.state[2])
         if (self.iter + 100) % 200 == 0:
             self.state = (
-                np.array([self.state[0][0], np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
+                np.array([self.state[0][0], self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
                 self.state[2])
         done: bool = (self.iter >= self.max_iter)  or np.any(np.abs(self.ball.x) > 2 * MAX_X)
         info = {'state': self.state, 'observation': self.observation}
@@ -1068,9 +1438,7 @@ class BBEnvNoIntegral(BBEnvBasisNoIntegral):
 
         for i in range(1, target_trajectory.shape[1]):
             trajectory[:, i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[:, i] = dema - target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
 
@@ -1131,11 +1499,11 @@ class BBEnvPidNoIntegral(BBEnvBasisNoIntegral):
         self.iter += 1
         """if self.iter % 202 == 0:
             self.state = (
-                np.array([np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
+                np.array([self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X), self.state[0][1]]), self.state[1],
                 self.state[2])
         if (self.iter + 100) % 200 == 0:
             self.state = (
-                np.array([self.state[0][0], np.random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
+                np.array([self.state[0][0], self.np_random.uniform(- 0.8 * MAX_X, 0.8 * MAX_X)]), self.state[1],
                 self.state[2])"""
         done: bool = (self.iter >= self.max_iter) or np.any(np.abs(self.ball.x) > 2 * MAX_X)
         info = {'state': self.state, 'observation': self.observation}
@@ -1156,9 +1524,7 @@ class BBEnvPidNoIntegral(BBEnvBasisNoIntegral):
 
         for i in range(1, target_trajectory.shape[1]):
             trajectory[:, i] = self.state[1]
-            ema = self.alpha * self.state[1] + (1 - self.alpha) * self.ema
-            ema_ema = self.alpha * ema + (1 - self.alpha) * self.ema_ema
-            dema = (2. * ema) - ema_ema
+            dema, ema, ema_ema = dema_step(self.state[1], self.ema, self.ema_ema, self.alpha)
             error[:, i] = dema - target_trajectory[:, i]
             d_error: np.ndarray = (error[:, i] - error[:, i - 1]) / DT
 
@@ -0,0 +1,253 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+from .simulation import BbSimulation
+from ..DDPG.controllers import GeneticController
+from ..constants import DT, BALL_ERROR_SCALING, BALL_D_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, MAX_ANGLE, \
+    FILTERING_PERIOD, BALL_MAX_INTEGRAL
+
+try:
+    from numba import njit
+    JIT_AVAILABLE: bool = True
+except ImportError:
+    JIT_AVAILABLE: bool = False
+
+    def njit(*args, **kwargs):
+        """
+        Pure python fallback, the kernels run as plain functions
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Plant state layout, (x, y) pairs
+MOTOR_ANGLE, MOTOR_SPEED, ERROR, D_ERROR, I_ERROR, BALL_X, BALL_D_X = range(0, 14, 2)
+PLANT_STATE_SIZE: int = 14
+# Plant coefficients layout: per axis motor u and speed coefficients, pid weights and bias, then the ball matrix
+MOTOR_COEFS_SIZE: int = 6
+BALL_COEFS: int = 2 * MOTOR_COEFS_SIZE
+PLANT_COEFS_SIZE: int = BALL_COEFS + 8
+
+# Activations of the packed MLP layers
+IDENTITY, TANH, RELU, SIGMOID = range(4)
+ACTIVATIONS = {torch.nn.Identity: IDENTITY, torch.nn.Tanh: TANH, torch.nn.ReLU: RELU, torch.nn.Sigmoid: SIGMOID}
+# Activation applied by the forward of the model type after every Linear layer (functional, not a module)
+FORWARD_ACTIVATIONS: Dict[type, int] = {GeneticController: TANH}
+
+
+# Conversions from / to the simulation classes
+def plant_coefficients(sim: BbSimulation) -> np.ndarray:
+    """
+    :return: Motor u and speed coefficients, motor pid weights and bias of the x then the y axis, ball matrix (row
+             major), (20,)
+    """
+    coefs: List[np.ndarray] = []
+    for motor, pid in ((sim.motor_x.motor, sim.motor_pid_x), (sim.motor_y.motor, sim.motor_pid_y)):
+        coefs += [[motor.u_coef, motor.s_coef / motor.speed_scaling], pid.w, [pid.b]]
+    return np.concatenate(coefs + [sim.ball.a.ravel()]).astype(np.float64)
+
+
+def plant_state(sim: BbSimulation) -> np.ndarray:
+    """
+    :return: State of the simulation in the kernels layout, (14,)
+    """
+    return np.concatenate([[sim.motor_x.angle, sim.motor_y.angle], [sim.motor_x.speed, sim.motor_y.speed],
+                           sim.error, sim.d_error, sim.i_error, sim.ball.x, sim.ball.d_x]).astype(np.float64)
+
+
+def load_plant_state(sim: BbSimulation, state: np.ndarray):
+    """
+    Write a kernels layout state back to the simulation
+    """
+    sim.motor_x.angle, sim.motor_y.angle = state[MOTOR_ANGLE:MOTOR_ANGLE + 2].tolist()
+    sim.motor_x.speed, sim.motor_y.speed = state[MOTOR_SPEED:MOTOR_SPEED + 2].tolist()
+    sim.error = state[ERROR:ERROR + 2].copy()
+    sim.d_error = state[D_ERROR:D_ERROR + 2].copy()
+    sim.i_error = state[I_ERROR:I_ERROR + 2].copy()
+    sim.ball.x = state[BALL_X:BALL_X + 2].copy()
+    sim.ball.d_x = state[BALL_D_X:BALL_D_X + 2].copy()
+
+
+def pack_mlp(model: torch.nn.Module, activation: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flatten a chain of Linear layers and activations (BlackBoxActor, GeneticController, torch Sequential) for
+    rollout_mlp. An activation module following a Linear layer is applied to its output.
+    :param activation: Activation of the Linear layers without an activation module, the one of
+                       FORWARD_ACTIVATIONS for the model type if None, IDENTITY for the other types
+    :return: Float64 weights and biases of all the layers one after the other,
+             (n_layers, 4) layout rows [n_inputs, n_outputs, has_bias, activation]
+    """
+    if activation is None:
+        activation = FORWARD_ACTIVATIONS.get(type(model), IDENTITY)
+    flat: List[np.ndarray] = []
+    layout: List[List[int]] = []
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            flat.append(module.weight.detach().numpy().ravel())
+            if module.bias is not None:
+                flat.append(module.bias.detach().numpy())
+            layout.append([module.in_features, module.out_features, int(module.bias is not None), activation])
+        elif type(module) in ACTIVATIONS:
+            layout[-1][3] = ACTIVATIONS[type(module)]
+    return np.concatenate(flat).astype(np.float64), np.array(layout, dtype=np.int64)
+
+
+# Kernels
+@njit(cache=True)
+def plant_step(state: np.ndarray, target_x: float, target_y: float, coefs: np.ndarray):
+    """
+    BbSimulation.step_bb on the kernels layout state, updated in place
+    :param state: (14,) plant state
+    :param target_x: Motor x angle target
+    :param target_y: Motor y angle target
+    :param coefs: plant_coefficients
+    """
+    # Motors, each with its own coefficients
+    for k in range(2):
+        target = target_x if k == 0 else target_y
+        m = k * MOTOR_COEFS_SIZE
+        error = target - state[MOTOR_ANGLE + k]
+        state[D_ERROR + k] = (error - state[ERROR + k]) / DT
+        state[I_ERROR + k] = state[I_ERROR + k] + error * DT
+        state[ERROR + k] = error
+        u = coefs[m + 2] * error + coefs[m + 3] * state[D_ERROR + k] + coefs[m + 4] * state[I_ERROR + k] + \
+            coefs[m + 5]
+        state[MOTOR_SPEED + k] = coefs[m] * u + coefs[m + 1] * state[MOTOR_SPEED + k]
+        state[MOTOR_ANGLE + k] = max(-180., min(180., state[MOTOR_ANGLE + k] + state[MOTOR_SPEED + k] * DT))
+
+    # Ball
+    sin_x = math.sin(math.pi / 180. * state[MOTOR_ANGLE])
+    sin_y = math.sin(math.pi / 180. * state[MOTOR_ANGLE + 1])
+    d_x = state[BALL_D_X]
+    d_y = state[BALL_D_X + 1]
+    a = BALL_COEFS
+    state[BALL_D_X] = d_x + (coefs[a] * d_x + coefs[a + 1] * d_y + coefs[a + 2] * sin_x + coefs[a + 3] * sin_y)
+    state[BALL_D_X + 1] = d_y + (coefs[a + 4] * d_x + coefs[a + 5] * d_y + coefs[a + 6] * sin_x +
+                                 coefs[a + 7] * sin_y)
+    state[BALL_X] = state[BALL_X] + state[BALL_D_X] * DT
+    state[BALL_X + 1] = state[BALL_X + 1] + state[BALL_D_X + 1] * DT
+
+
+@njit(cache=True)
+def rollout_pid(state: np.ndarray, coefs: np.ndarray, gains: np.ndarray, target_trajectory: np.ndarray):
+    """
+    BenchmarkEvaluator.simulate of a PidController, the state is updated in place
+    :param state: (14,) initial plant state
+    :param coefs: plant_coefficients
+    :param gains: PidController weights (error, d_error, integral), (3,)
+    :param target_trajectory: (2, T)
+    :return: trajectory, error, u, angle, (2, T) each
+    """
+    length = target_trajectory.shape[1]
+    trajectory = np.zeros((2, length))
+    error = np.zeros((2, length))
+    u = np.zeros((2, length))
+    angle = np.zeros((2, length))
+    integral = np.zeros(2)
+    for k in range(2):
+        error[k, 0] = target_trajectory[k, 0]
+        integral[k] = error[k, 0] * DT
+
+    for i in range(1, length):
+        for k in range(2):
+            trajectory[k, i] = state[BALL_X + k]
+            error[k, i] = state[BALL_X + k] - target_trajectory[k, i]
+            d_error = (error[k, i] - error[k, i - 1]) / DT
+            integral[k] = max(min(integral[k] + error[k, i] * DT, BALL_MAX_INTEGRAL), - BALL_MAX_INTEGRAL)
+            angle[k, i] = state[MOTOR_ANGLE + k]
+            u[k, i] = MAX_ANGLE * math.tanh(gains[0] * error[k, i] * BALL_ERROR_SCALING +
+                                            gains[1] * d_error * BALL_D_ERROR_SCALING +
+                                            gains[2] * integral[k] * BALL_INTEGRAL_ERROR_SCALING)
+        plant_step(state, u[0, i], u[1, i], coefs)
+
+    return trajectory, error, u, angle
+
+
+@njit(cache=True)
+def mlp_forward(x: np.ndarray, flat: np.ndarray, layout: np.ndarray) -> np.ndarray:
+    """
+    Forward of a pack_mlp network
+    """
+    start = 0
+    for layer in range(layout.shape[0]):
+        n_inputs, n_outputs, has_bias, activation = layout[layer, 0], layout[layer, 1], layout[layer, 2], \
+            layout[layer, 3]
+        y = np.zeros(n_outputs)
+        for o in range(n_outputs):
+            acc = 0.
+            for j in range(n_inputs):
+                acc += flat[start + o * n_inputs + j] * x[j]
+            y[o] = acc
+        start += n_inputs * n_outputs
+        if has_bias:
+            for o in range(n_outputs):
+                y[o] += flat[start + o]
+            start += n_outputs
+        for o in range(n_outputs):
+            if activation == TANH:
+                y[o] = math.tanh(y[o])
+            elif activation == RELU:
+                y[o] = max(y[o], 0.)
+            elif activation == SIGMOID:
+                y[o] = 1. / (1. + math.exp(- y[o]))
+        x = y
+    return x
+
+
+@njit(cache=True)
+def rollout_mlp(state: np.ndarray, coefs: np.ndarray, flat: np.ndarray, layout: np.ndarray, act_limit: float,
+                target_trajectory: np.ndarray):
+    """
+    BBEnv.simulate of a pack_mlp actor (obs -> motors angle) from test_reset, the state is updated in place
+    :param state: (14,) initial plant state
+    :param coefs: plant_coefficients
+    :param flat: pack_mlp weights
+    :param layout: pack_mlp layout
+    :param act_limit: Scaling of the network output
+    :param target_trajectory: (2, T)
+    :return: trajectory, error, u, angle, (2, T) each
+    """
+    alpha = 2. / (1. + FILTERING_PERIOD)
+    length = target_trajectory.shape[1]
+    trajectory = np.zeros((2, length))
+    error = np.zeros((2, length))
+    u = np.zeros((2, length))
+    angle = np.zeros((2, length))
+    integral = np.zeros(2)
+    ema = np.zeros(2)
+    ema_ema = np.zeros(2)
+    obs = np.zeros(6)
+    for k in range(2):
+        error[k, 0] = target_trajectory[k, 0]
+        integral[k] = error[k, 0] * DT
+
+    for i in range(1, length):
+        for k in range(2):
+            ball = state[BALL_X + k]
+            trajectory[k, i] = ball
+            ema[k] = alpha * ball + (1 - alpha) * ema[k]
+            ema_ema[k] = alpha * ema[k] + (1 - alpha) * ema_ema[k]
+            error[k, i] = (2. * ema[k]) - ema_ema[k] - target_trajectory[k, i]
+            d_error = (error[k, i] - error[k, i - 1]) / DT
+            integral[k] = max(min(integral[k] + error[k, i] * DT, BALL_MAX_INTEGRAL), - BALL_MAX_INTEGRAL)
+            angle[k, i] = state[MOTOR_ANGLE + k]
+            obs[k] = error[k, i] * BALL_ERROR_SCALING
+            obs[2 + k] = d_error * BALL_D_ERROR_SCALING
+            obs[4 + k] = integral[k] * BALL_INTEGRAL_ERROR_SCALING
+        action = mlp_forward(obs, flat, layout)
+        for k in range(2):
+            u[k, i] = act_limit * action[k]
+        plant_step(state, u[0, i] * MAX_ANGLE, u[1, i] * MAX_ANGLE, coefs)
+        # The environement step observes the new ball position, the filter is updated a second time
+        for k in range(2):
+            ema[k] = alpha * state[BALL_X + k] + (1 - alpha) * ema[k]
+            ema_ema[k] = alpha * ema[k] + (1 - alpha) * ema_ema[k]
+
+    for i in range(length):
+        for k in range(2):
+            u[k, i] = MAX_ANGLE * u[k, i]
+    return trajectory, error, u, angle
+
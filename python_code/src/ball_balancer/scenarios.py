@@ -0,0 +1,86 @@
+from typing import Tuple
+
+import numpy as np
+
+from .trajectories import random_walks
+from ..constants import MAX_X
+
+
+class ScenarioBank:
+    """
+    Precomputed episodes of the ball balancer: initial states, target jump iterations and values, and optionally
+    target trajectories (random walk of trajectory_gen). Every candidate of a genetic generation can then be rolled
+    out on the same scenarios (common random numbers), see BBVecEnvBasis.set_scenarios.
+    Arrays, S scenarios:
+        initial_states (S, 3, 2) float32: target, ball position and ball speed
+        jump_iters (S, 2) int16: iterations of the x and y target jumps
+        jump_targets (S, 2) float32: targets after the jumps
+        trajectories (S, 2, T) float32 or None: targets of every iteration, replace the jumps
+    """
+
+    def __init__(self, initial_states: np.ndarray, jump_iters: np.ndarray, jump_targets: np.ndarray,
+                 trajectories: np.ndarray = None):
+        self.initial_states: np.ndarray = np.asarray(initial_states, dtype=np.float32)
+        self.jump_iters: np.ndarray = np.asarray(jump_iters, dtype=np.int16)
+        self.jump_targets: np.ndarray = np.asarray(jump_targets, dtype=np.float32)
+        self.trajectories: np.ndarray = None if trajectories is None else np.asarray(trajectories, dtype=np.float32)
+
+    @classmethod
+    def generate(cls, n_scenarios: int, seed: int = None, jump_iters: Tuple[int, int] = (200, 300),
+                 trajectory_length: int = 0) -> 'ScenarioBank':
+        """
+        Sample a bank with the distributions of the environements (state_space, target jumps, target_gen)
+        :param seed: Seed of the bank generator, the global numpy generator is not used
+        :param jump_iters: Target jump iterations, (200, 300) for BBEnv, (100, 200) for BBEnvPid
+        :param trajectory_length: Length of the target trajectories, no trajectory if 0
+        """
+        rng = np.random.default_rng(seed)
+        initial_states = np.empty((n_scenarios, 3, 2))
+        initial_states[:, 0:2] = rng.uniform(-0.8 * MAX_X, 0.8 * MAX_X, (n_scenarios, 2, 2))
+        initial_states[:, 2] = rng.uniform(-MAX_X / 30., MAX_X / 30., (n_scenarios, 2))
+        jump_targets = rng.uniform(-0.8 * MAX_X, 0.8 * MAX_X, (n_scenarios, 2))
+
+        trajectories = None
+        if trajectory_length:
+            # Increments drawn time major like the former per step loop, a seed gives the same bank as before
+            noise = rng.standard_normal((trajectory_length, n_scenarios, 2)).transpose(1, 2, 0)
+            trajectories = random_walks(n_scenarios, trajectory_length, noise=noise)
+            initial_states[:, 0] = trajectories[:, :, 0]
+
+        return cls(initial_states, np.tile(jump_iters, (n_scenarios, 1)), jump_targets, trajectories)
+
+    @classmethod
+    def load(cls, path: str) -> 'ScenarioBank':
+        with np.load(path) as data:
+            return cls(data['initial_states'], data['jump_iters'], data['jump_targets'],
+                       data['trajectories'] if 'trajectories' in data else None)
+
+    def save(self, path: str):
+        arrays = {'initial_states': self.initial_states, 'jump_iters': self.jump_iters,
+                  'jump_targets': self.jump_targets}
+        if self.trajectories is not None:
+            arrays['trajectories'] = self.trajectories
+        np.savez_compressed(path, **arrays)
+
+    def __len__(self) -> int:
+        return len(self.initial_states)
+
+    def targets(self, iterations: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        """
+        :param iterations: (N,) iterations of the environements
+        :param idx: (N,) scenarios of the environements
+        :return: (N, 2) targets, the last target of the trajectory past its end
+        """
+        if self.trajectories is not None:
+            return self.trajectories[idx, :, np.minimum(iterations, self.trajectories.shape[2] - 1)]
+        jumped = iterations[:, None] >= self.jump_iters[idx]
+        return np.where(jumped, self.jump_targets[idx], self.initial_states[idx, 0])
+
+    def trajectory(self, i: int, length: int) -> np.ndarray:
+        """
+        Target trajectory of scenario i, (2, length), as given to the simulate methods
+        """
+        if self.trajectories is not None:
+            return self.trajectories[i, :, :length].astype(np.float64)
+        return self.targets(np.arange(length), np.full(length, i)).T.astype(np.float64)
+
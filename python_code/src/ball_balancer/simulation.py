@@ -47,6 +47,73 @@ class BbSimulation:
         self.ball.step(self.motor_x.angle, self.motor_y.angle)
 
 
+class BatchedBbSimulation:
+    """
+    N ball balancers advanced in lockstep. The dynamics are the ones of BbSimulation, but the state of every system
+    is stored in contiguous (N, 2) arrays (column 0 is the x axis, column 1 the y axis) and a step is a handful of
+    vectorized operations. Trajectories are bit for bit the ones of N BbSimulation instances.
+    """
+
+    def __init__(self, n_envs: int):
+        self.n_envs: int = n_envs
+
+        # Plant coefficients, read from the scalar components so both engines share the same data
+        motor: MotorSimulation = MotorSimulation()
+        motor_pid: Pid = Pid()
+        ball: BallSimulation = BallSimulation()
+        self.motor_u_coef: float = motor.motor.u_coef
+        self.motor_s_coef: float = motor.motor.s_coef / motor.motor.speed_scaling
+        self.motor_pid_w: np.ndarray = motor_pid.w
+        self.motor_pid_b: float = motor_pid.b
+        self.ball_a: np.ndarray = ball.a
+
+        # Motors
+        self.motor_angle: np.ndarray = np.zeros((n_envs, 2))
+        self.motor_speed: np.ndarray = np.zeros((n_envs, 2))
+
+        # Ball
+        self.ball_x: np.ndarray = np.zeros((n_envs, 2))
+        self.ball_d_x: np.ndarray = np.zeros((n_envs, 2))
+
+        # Motors error
+        self.error: np.ndarray = np.zeros((n_envs, 2))
+        self.d_error: np.ndarray = np.zeros((n_envs, 2))
+        self.i_error: np.ndarray = np.zeros((n_envs, 2))
+
+    def reset_bb(self, mask: np.ndarray = None):
+        """
+        Put the systems in zero state
+        :param mask: Boolean (N,) mask or indices of the systems to reset, all of them if None
+        """
+        if mask is None:
+            mask = slice(None)
+        for arr in (self.motor_angle, self.motor_speed, self.ball_x, self.ball_d_x, self.error, self.d_error,
+                    self.i_error):
+            arr[mask] = 0.
+
+    def step_bb(self, target: np.ndarray = np.array([0., 0.])):
+        """
+        Advance every system by one time step
+        :param target: Motors angle targets, (N, 2) or (2,) to give the same target to all the systems
+        """
+        error = target - self.motor_angle
+        self.d_error = (error - self.error) / DT
+        self.i_error += error * DT
+        self.error = error
+
+        w = self.motor_pid_w
+        motor_u = w[0] * self.error + w[1] * self.d_error + w[2] * self.i_error + self.motor_pid_b
+
+        self.motor_speed = self.motor_u_coef * motor_u + self.motor_s_coef * self.motor_speed
+        np.clip(self.motor_angle + self.motor_speed * DT, -180., 180., out=self.motor_angle)
+
+        a = self.ball_a
+        sin_angle = np.sin(np.pi / 180. * self.motor_angle)
+        self.ball_d_x = self.ball_d_x + (a[:, 0] * self.ball_d_x[:, 0:1] + a[:, 1] * self.ball_d_x[:, 1:2] +
+                                         a[:, 2] * sin_angle[:, 0:1] + a[:, 3] * sin_angle[:, 1:2])
+        self.ball_x = self.ball_x + self.ball_d_x * DT
+
+
 class BbSimulation1D:
 
     def __init__(self):
@@ -87,6 +154,16 @@ def loss(error: np.ndarray) -> float:
     return - np.power(np.apply_along_axis(np.linalg.norm, 0, error), 2.).mean()
 
 
+def dema_step(x, ema, ema_ema, alpha: float):
+    """
+    One step of the DEMA filter of the ball position observed by the controllers
+    :return: Filtered position, new ema and ema_ema
+    """
+    ema = alpha * x + (1 - alpha) * ema
+    ema_ema = alpha * ema + (1 - alpha) * ema_ema
+    return (2. * ema) - ema_ema, ema, ema_ema
+
+
 """class BenchmarkEvaluator:
 
     def __init__(self, target_trajectory: np.ndarray):
@@ -0,0 +1,149 @@
+"""
+Target trajectory library. Every generator returns a (B, 2, T) batch of (x, y) targets sampled every DT, built in
+one call from its seed (int or numpy Generator). A trajectory of the batch is a (2, T) array as given to the simulate
+methods of the environements.
+"""
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from ..constants import DT, MAX_X, MAX_Y
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+
+def n_samples(duration: float) -> int:
+    """
+    :param duration: Duration in seconds
+    :return: Number of samples of a trajectory of that duration
+    """
+    return int(duration // DT)
+
+
+def time_axis(length: int) -> np.ndarray:
+    return np.arange(length) * DT
+
+
+def mean_reverting_filter(noise: np.ndarray, coef: float) -> np.ndarray:
+    """
+    x[t] = coef * x[t - 1] + noise[t] along the last axis, from x[-1] = 0
+    """
+    if lfilter is not None:
+        return lfilter([1.], [1., -coef], noise, axis=-1)
+    # Time loop, vectorized over the batch
+    x = np.empty_like(noise)
+    last = np.zeros(noise.shape[:-1])
+    for t in range(noise.shape[-1]):
+        last = coef * last + noise[..., t]
+        x[..., t] = last
+    return x
+
+
+def random_walks(batch: int, length: int, seed=None, reversion: float = 1. / 2000., sigma: float = MAX_X / 25.,
+                 noise: np.ndarray = None) -> np.ndarray:
+    """
+    Random walk with mean reversion of target_gen: target += N(- target * reversion, sigma) every sample
+    :param reversion: Fraction of the target pulled back to 0 every sample
+    :param sigma: Standard deviation of the increments
+    :param noise: (B, 2, T) standard normal increments, drawn from the seed if None
+    """
+    if noise is None:
+        noise = np.random.default_rng(seed).standard_normal((batch, 2, length))
+    return mean_reverting_filter(sigma * noise, 1. - reversion)
+
+
+def steps(batch: int, length: int, seed=None, hold: float = 10.,
+          amplitude: Tuple[float, float] = (0.8 * MAX_X, 0.8 * MAX_Y)) -> np.ndarray:
+    """
+    Piecewise constant targets, a new uniform position every hold seconds
+    :param hold: Duration of a step in seconds
+    :param amplitude: Largest x and y targets
+    """
+    rng = np.random.default_rng(seed)
+    hold_samples: int = max(1, n_samples(hold))
+    n_steps: int = -(-length // hold_samples)
+    positions = rng.uniform(-1., 1., (batch, 2, n_steps)) * np.array(amplitude)[:, None]
+    return np.repeat(positions, hold_samples, axis=-1)[:, :, :length]
+
+
+def periods(rng: np.random.Generator, batch: int, period: Tuple[float, float]) -> np.ndarray:
+    """
+    (B, 1) uniform periods in seconds, from the (min, max) range
+    """
+    return rng.uniform(period[0], period[1], (batch, 1))
+
+
+def circles(batch: int, length: int, seed=None, radius: Tuple[float, float] = (0.2 * MAX_Y, 0.8 * MAX_Y),
+            period: Tuple[float, float] = (20., 40.)) -> np.ndarray:
+    """
+    Circles around the center with random radius, period, phase and direction
+    :param radius: (min, max) radius
+    :param period: (min, max) period in seconds
+    """
+    rng = np.random.default_rng(seed)
+    r = rng.uniform(radius[0], radius[1], (batch, 1))
+    direction = rng.choice([-1., 1.], (batch, 1))
+    phase = 2. * np.pi * direction * time_axis(length) / periods(rng, batch, period) + \
+        rng.uniform(0., 2. * np.pi, (batch, 1))
+    return np.stack([r * np.sin(phase), r * np.cos(phase)], axis=1)
+
+
+def figure_eights(batch: int, length: int, seed=None, amplitude: Tuple[float, float] = (0.8 * MAX_X, 0.8 * MAX_Y),
+                  period: Tuple[float, float] = (20., 40.)) -> np.ndarray:
+    """
+    Lissajous figure eights, x at the frequency, y at twice the frequency, random scale and period
+    :param amplitude: Largest x and y amplitudes, the figures are scaled by a uniform factor in [0.25, 1]
+    :param period: (min, max) period in seconds
+    """
+    rng = np.random.default_rng(seed)
+    scale = rng.uniform(0.25, 1., (batch, 1))
+    phase = 2. * np.pi * time_axis(length) / periods(rng, batch, period) + rng.uniform(0., 2. * np.pi, (batch, 1))
+    return np.stack([amplitude[0] * scale * np.sin(phase), amplitude[1] * scale * np.sin(2. * phase)], axis=1)
+
+
+def chirps(batch: int, length: int, seed=None, amplitude: Tuple[float, float] = (0.5 * MAX_X, 0.5 * MAX_Y),
+           frequency: Tuple[float, float] = (0.01, 0.5)) -> np.ndarray:
+    """
+    Linear chirps, the frequency sweeps from frequency[0] to frequency[1] Hz over the trajectory, random phase and
+    sign on each axis
+    :param amplitude: x and y amplitudes
+    :param frequency: Start and end frequencies in Hz
+    """
+    rng = np.random.default_rng(seed)
+    t = time_axis(length)
+    duration: float = max(length * DT, DT)
+    phase = 2. * np.pi * (frequency[0] * t + (frequency[1] - frequency[0]) * t ** 2 / (2. * duration))
+    offset = rng.uniform(0., 2. * np.pi, (batch, 2, 1))
+    sign = rng.choice([-1., 1.], (batch, 2, 1))
+    return np.array(amplitude)[:, None] * sign * np.sin(phase + offset)
+
+
+TRAJECTORY_GENERATORS: Dict[str, Callable] = {
+    'random_walk': random_walks,
+    'step': steps,
+    'circle': circles,
+    'figure_eight': figure_eights,
+    'chirp': chirps,
+}
+
+
+def trajectory_batch(kind: str, batch: int, duration: float, seed=None, **kwargs) -> np.ndarray:
+    """
+    :param kind: Key of TRAJECTORY_GENERATORS
+    :param duration: Duration of the trajectories in seconds
+    :return: (B, 2, T) trajectories
+    """
+    return TRAJECTORY_GENERATORS[kind](batch, n_samples(duration), seed, **kwargs)
+
+
+def mixed_trajectory_batch(batch: int, duration: float, seed=None, kinds: Tuple[str, ...] = None) -> np.ndarray:
+    """
+    Evaluation set mixing the kinds of trajectories, batch // len(kinds) of each (the first kinds get the remainder)
+    """
+    rng = np.random.default_rng(seed)
+    kinds = kinds or tuple(TRAJECTORY_GENERATORS)
+    counts = [batch // len(kinds) + (i < batch % len(kinds)) for i in range(len(kinds))]
+    return np.concatenate([trajectory_batch(kind, count, duration, rng) for kind, count in zip(kinds, counts)])
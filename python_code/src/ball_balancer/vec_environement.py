@@ -0,0 +1,289 @@
+from abc import ABC
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from gym import spaces
+from .simulation import BatchedBbSimulation, dema_step
+from .environement import linear_e_reward, BATCHED_REWARDS
+from .scenarios import ScenarioBank
+from ..constants import MAX_X, DT, BALL_ERROR_SCALING, BALL_D_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, MAX_ANGLE, \
+    FILTERING_PERIOD, BALL_MAX_INTEGRAL
+
+
+# Environement creation
+def vec_env_fn_gen(env, reward_fn, reward_weight, n_envs: int) -> Callable:
+    def create_env():
+        return env(n_envs, reward_func=reward_fn, reward_w=reward_weight)
+
+    return create_env
+
+
+# Vectorized environement "trait"
+class BBVecEnvBasis(BatchedBbSimulation, ABC):
+    """
+    Vectorized counterpart of BBEnvBasis: N environements are stepped together with (N, ...) arrays.
+    Finished environements are reset automatically at the end of the step, their last observation is given in the
+    info dict.
+    With a ScenarioBank (set_scenarios) the initial states and the targets are the ones of the bank instead of random
+    ones, environement i plays scenario i % S.
+    """
+
+    # Iterations at which the x, then the y target jumps to a random position
+    target_jump_iters: Tuple[int, int] = (200, 300)
+
+    def __init__(self, n_envs: int, reward_func=linear_e_reward, reward_w=0.5):
+        super(BBVecEnvBasis, self).__init__(n_envs)
+
+        # Actions, State, Observation (of a single environement)
+        self.action_space = None
+        self.state_space = spaces.Tuple(spaces=[
+            spaces.Box(low=-0.8 * MAX_X, high=0.8 * MAX_X, shape=(2,), dtype=np.float32),  # Target position
+            spaces.Box(low=-0.8 * MAX_X, high=0.8 * MAX_X, shape=(2,), dtype=np.float32),  # Ball position
+            spaces.Box(low=-MAX_X / 30., high=MAX_X / 30., shape=(2,), dtype=np.float32),  # Ball speed
+        ])
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(6,))
+
+        self.genetic_initial_state = self.state_space.sample()
+        # Ball position and speed are the simulation ball_x and ball_d_x arrays
+        self.target: np.ndarray = np.zeros((n_envs, 2))
+        self.observation: np.ndarray = np.zeros((n_envs, 6), dtype=np.float32)
+        self.ema: np.ndarray = np.zeros((n_envs, 2))
+        self.ema_ema: np.ndarray = np.zeros((n_envs, 2))
+        self.real_error: np.ndarray = np.zeros((n_envs, 2))
+        self.real_d_error: np.ndarray = np.zeros((n_envs, 2))
+        self.alpha: float = 2. / (1. + FILTERING_PERIOD)
+        # Target jumps, one generator per environement
+        self.np_random: List[np.random.Generator] = [np.random.default_rng() for _ in range(n_envs)]
+
+        # Traing parameters
+        self.max_iter: int = int(10. // DT)
+        self.iter: np.ndarray = np.zeros(n_envs, dtype=int)
+        self.reward: Callable = reward_func
+        self.w: float = reward_w
+
+        # Scenario bank
+        self.scenarios: ScenarioBank = None
+        self.scenario_index: np.ndarray = None
+
+        self.reset()
+
+    def step(self, actions: np.ndarray):
+        return NotImplemented
+
+    def set_scenarios(self, scenarios: ScenarioBank = None):
+        """
+        Play the scenarios of the bank from now on, random episodes again if None
+        :param scenarios: Bank, its size must divide the number of environements
+        """
+        if scenarios is not None and self.n_envs % len(scenarios):
+            raise ValueError('{} environements can not play {} scenarios'.format(self.n_envs, len(scenarios)))
+        self.scenarios = scenarios
+        self.scenario_index = None if scenarios is None else np.arange(self.n_envs) % len(scenarios)
+
+    def reset(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Reset the environements to a random state
+        :param mask: Boolean (N,) array selecting the environements to reset, all of them if None
+        :return: Scaled observations of all the environements, (N, 6)
+        """
+        idx = np.arange(self.n_envs) if mask is None else np.flatnonzero(mask)
+        self.reset_bb(idx)
+        if self.scenarios is not None:
+            return self.scenario_reset(idx)
+
+        states = [self.state_space.sample() for _ in idx]
+        self.target[idx] = [state[0] for state in states]
+        self.ball_x[idx] = [state[1] for state in states]
+        self.ball_d_x[idx] = [state[2] for state in states]
+        self.observation[idx] = [self.observation_space.sample() for _ in idx]
+
+        self.observe(idx)
+        self.iter[idx] = 0
+        self.ema[idx] = self.ball_x[idx]
+        self.ema_ema[idx] = self.ball_x[idx]
+        self.real_error[idx] = 0.
+        self.real_d_error[idx] = 0.
+
+        return self.scaled_obs()
+
+    def genetic_reset(self) -> np.ndarray:
+        """
+        Reset all the environements to genetic_initial_state
+        :return: Scaled observations, (N, 6)
+        """
+        self.reset_bb()
+        self.target[:] = self.genetic_initial_state[0]
+        self.ball_x[:] = self.genetic_initial_state[1]
+        self.ball_d_x[:] = self.genetic_initial_state[2]
+        self.observation[:] = 0.
+
+        self.ema[:] = self.ball_x
+        self.ema_ema[:] = self.ball_x
+        self.observe()
+        self.iter[:] = 0
+        self.real_error[:] = 0.
+        self.real_d_error[:] = 0.
+
+        return self.scaled_obs()
+
+    def scenario_reset(self, idx: np.ndarray) -> np.ndarray:
+        """
+        Reset the environements to the initial states of their scenarios, with the filter of genetic_reset
+        """
+        states = self.scenarios.initial_states[self.scenario_index[idx]]
+        self.target[idx] = states[:, 0]
+        self.ball_x[idx] = states[:, 1]
+        self.ball_d_x[idx] = states[:, 2]
+        self.observation[idx] = 0.
+
+        self.ema[idx] = self.ball_x[idx]
+        self.ema_ema[idx] = self.ball_x[idx]
+        self.observe(idx)
+        self.iter[idx] = 0
+        self.real_error[idx] = 0.
+        self.real_d_error[idx] = 0.
+
+        return self.scaled_obs()
+
+    def genetic_generation_reset(self):
+        self.genetic_initial_state = self.state_space.sample()
+        print(self.genetic_initial_state[0])
+
+    def seed(self, seed=None, shared: bool = False):
+        """
+        Seed the random initial states and the random target jumps (one generator per environement, the numpy global
+        one is left untouched). By default the generators are independent: the seeded environements jump to different
+        targets, they play different episodes.
+        :param shared: Give every environement the generator of BBEnvBasis.seed(seed), they all play the episode of a
+                       BBEnv seeded with seed (common random numbers of the GA fitness functions)
+        """
+        self.state_space.seed(seed)
+        self.observation_space.seed(seed)
+        if shared:
+            self.np_random = [np.random.default_rng(seed) for _ in range(self.n_envs)]
+        else:
+            self.np_random = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(self.n_envs)]
+        # The next reset observes with the filter of the previous episode, see BBEnvBasis.seed
+        self.ema = np.zeros_like(self.ema)
+        self.ema_ema = np.zeros_like(self.ema_ema)
+        return [seed]
+
+    def observe(self, idx=slice(None)):
+        """
+        DEMA filtered error, its derivative and its clamped integral, see BBEnvBasis.observe
+        :param idx: Environements to update, all of them by default
+        """
+        ball_x = self.ball_x[idx]
+        target = self.target[idx]
+        last_obs = self.observation[idx]
+
+        obs = np.zeros_like(last_obs)
+        dema, ema, ema_ema = dema_step(ball_x, self.ema[idx], self.ema_ema[idx], self.alpha)
+        obs[:, 0:2] = dema - target
+        real_error = ball_x - target
+        self.real_d_error[idx] = (real_error - self.real_error[idx]) / DT
+        self.real_error[idx] = real_error
+        obs[:, 2:4] = (obs[:, 0:2] - last_obs[:, 0:2]) / DT
+        obs[:, 4:6] = np.clip(last_obs[:, 4:6] + obs[:, 0:2] * DT, - BALL_MAX_INTEGRAL, BALL_MAX_INTEGRAL)
+
+        self.observation[idx] = obs
+        self.ema[idx] = ema
+        self.ema_ema[idx] = ema_ema
+
+    def scaled_obs(self) -> np.ndarray:
+        observation = np.zeros_like(self.observation)
+        observation[:, 0:2] = self.observation[:, 0:2] * BALL_ERROR_SCALING
+        observation[:, 2:4] = self.observation[:, 2:4] * BALL_D_ERROR_SCALING
+        observation[:, 4:6] = self.observation[:, 4:6] * BALL_INTEGRAL_ERROR_SCALING
+        return observation
+
+    def rewards(self, actions: np.ndarray) -> np.ndarray:
+        batched_reward = BATCHED_REWARDS.get(self.reward)
+        if batched_reward is not None:
+            return batched_reward(self.real_error, self.real_d_error, actions, self.w)
+        return np.array([self.reward(self.real_error[i], self.real_d_error[i].copy(), actions[i], self.w)
+                         for i in range(self.n_envs)])
+
+    def jump_targets(self):
+        """
+        Move the x (then y) target of the environements reaching the target_jump_iters iterations, or follow the
+        targets of the scenarios
+        """
+        if self.scenarios is not None:
+            self.target[:] = self.scenarios.targets(self.iter, self.scenario_index)
+            return
+        for axis, jump_iter in enumerate(self.target_jump_iters):
+            jumping = np.flatnonzero(self.iter == jump_iter)
+            if len(jumping):
+                self.target[jumping, axis] = [self.np_random[i].uniform(- 0.8 * MAX_X, 0.8 * MAX_X) for i in jumping]
+
+    def end_step(self, actions: np.ndarray, done: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        Common end of the step: rewards, target jumps and reset of the finished environements
+        """
+        reward = self.rewards(actions)
+        self.iter += 1
+        self.jump_targets()
+        done = done | (self.iter >= self.max_iter)
+        info = {}
+
+        obs = self.scaled_obs()
+        if np.any(done):
+            info['terminal_observation'] = obs
+            obs = self.reset(done)
+
+        return obs, reward, done, info
+
+    def render(self, mode='human'):
+        pass
+
+
+class BBVecEnv(BBVecEnvBasis):
+    """
+    Vectorized ball balancer environement, obs -> motors angle
+    """
+
+    def __init__(self, n_envs: int, reward_func=linear_e_reward, reward_w=0.5):
+        super(BBVecEnv, self).__init__(n_envs, reward_func, reward_w)
+
+        # Actions, State, Observation
+        self.action_space = spaces.Box(low=-1., high=1., shape=(2,), dtype=np.float32)
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        :param actions: (N, 2) actions
+        :return: (N, 6) scaled observations, (N,) rewards, (N,) dones and info dict
+        """
+        self.step_bb(actions * MAX_ANGLE)
+        self.observe()
+
+        return self.end_step(actions, np.zeros(self.n_envs, dtype=bool))
+
+
+class BBVecEnvPid(BBVecEnvBasis):
+    """
+    Vectorized ball balancer environement for dynamic PID, obs -> pid weights
+    """
+
+    target_jump_iters: Tuple[int, int] = (100, 200)
+
+    def __init__(self, n_envs: int, reward_func=linear_e_reward, reward_w=0.5):
+        super(BBVecEnvPid, self).__init__(n_envs, reward_func, reward_w)
+
+        # Actions, State, Observation
+        self.action_space = spaces.Box(low=0., high=2.5, shape=(6,), dtype=np.float32)
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        :param actions: (N, 6) pid weights
+        :return: (N, 6) scaled observations, (N,) rewards, (N,) dones and info dict
+        """
+        obs = self.scaled_obs()
+        u_x = np.sum(actions[:, [0, 2, 4]] * obs[:, [0, 2, 4]], axis=1)
+        u_y = np.sum(actions[:, [1, 3, 5]] * obs[:, [1, 3, 5]], axis=1)
+        angles = np.tanh(np.stack([u_x, u_y], axis=1)) * MAX_ANGLE
+        self.step_bb(angles)
+        self.observe()
+
+        return self.end_step(angles / MAX_ANGLE, np.any(np.abs(self.ball_x) > 2 * MAX_X, axis=1))
@@ -5,13 +5,20 @@ import pygad
 import numpy as np
 
 from pygad import torchga
-from ..ball_balancer import BenchmarkEvaluator
+from ..ball_balancer import BenchmarkEvaluator, BbSimulation
+from ..ball_balancer.kernels import plant_coefficients
 from ..DDPG import BallController, PidController
+from ..fitness import FitnessCache, build_fitness_func, fitness_context
+from ..profiling import GA_PHASES, MODEL_PHASES, Profiler
 
 
-def fitness_fn_generator(model: BallController, target_trajectory: np.ndarray) -> Callable:
+def fitness_fn_generator(model: BallController, target_trajectory: np.ndarray, fast_path: bool = False,
+                         seed: int = None) -> Callable:
     global torch_ga
-    evaluator: BenchmarkEvaluator = BenchmarkEvaluator(target_trajectory)
+    evaluator: BenchmarkEvaluator = BenchmarkEvaluator(target_trajectory, fast_path)
+
+    # Numpy scalar steps, the weights export is refreshed by load_state_dict
+    model.inference_mode()
 
     def fitness_func(solution, sol_idx) -> float:
         model_weights_dict = torchga.model_weights_as_dict(model=model,
@@ -19,6 +26,9 @@ def fitness_fn_generator(model: BallController, target_trajectory: np.ndarray) -
 
         model.load_state_dict(model_weights_dict)
 
+        if seed is not None:
+            # Same initial state for every candidate, deterministic fitness
+            evaluator.seed(seed)
         return evaluator.evaluate(model)
 
     return fitness_func
@@ -29,7 +39,17 @@ def callback_generation(ga_instance):
     print("Fitness    = {fitness}".format(fitness=ga_instance.best_solution()[1]))
 
 
-def train_ball_controller(target_trajectory: np.ndarray, nb_generation: int, population: int) -> PidController:
+def train_ball_controller(target_trajectory: np.ndarray, nb_generation: int, population: int,
+                          fast_path: bool = False, n_workers: int = 1, seed: int = None,
+                          cache_size: int = 1024, profiler: Profiler = None) -> PidController:
+    """
+    :param fast_path: Evaluate on the state space recurrence of BenchmarkEvaluator.simulate_linear instead of the
+                      reference simulation, tests/test_benchmark_evaluator.py checks they agree
+    :param cache_size: Number of fitness values kept by the FitnessCache, 0 to evaluate every solution. Only used
+                       with a seed, the fitness of unseeded rollouts is random
+    :param profiler: Profiler enabled during the run: the fitness function, the model and the pygad engine are timed,
+                     see Profiler.report
+    """
     model = PidController(3, 1)
 
     torch_ga = torchga.TorchGA(model=model,
@@ -43,10 +63,21 @@ def train_ball_controller(target_trajectory: np.ndarray, nb_generation: int, pop
     mutation_percent_genes: int = 40
     keep_parents: int = 3
 
+    fitness_func, pool = build_fitness_func(fitness_fn_generator, (model, target_trajectory, fast_path, seed), n_workers)
+
+    cache = None
+    if cache_size and seed is not None:
+        cache = FitnessCache(cache_size, fitness_context(target_trajectory, plant_coefficients(BbSimulation()),
+                                                         seed, fast_path))
+        fitness_func = cache.wrap(fitness_func, pool is not None)
+    if profiler is not None:
+        fitness_func = profiler.wrap_fitness(fitness_func)
+
     ga_instance = pygad.GA(num_generations=nb_generation,
                            num_parents_mating=num_parents_mating,
                            initial_population=initial_population,
-                           fitness_func=fitness_fn_generator(model, target_trajectory),
+                           fitness_func=fitness_func,
+                           fitness_batch_size=None if pool is None else population,
                            parent_selection_type=parent_selection_type,
                            crossover_type=crossover_type,
                            mutation_type=mutation_type,
@@ -58,7 +89,16 @@ def train_ball_controller(target_trajectory: np.ndarray, nb_generation: int, pop
                            gene_space={'low': 0., 'high': 2.},
                            allow_duplicate_genes=False)
 
-    ga_instance.run()
+    if profiler is None:
+        ga_instance.run()
+    else:
+        with profiler, profiler.instrumented(model, MODEL_PHASES), profiler.instrumented(ga_instance, GA_PHASES), \
+                profiler.phase('ga_run'):
+            ga_instance.run()
+    if pool is not None:
+        pool.shutdown()
+    if cache is not None:
+        print("Fitness cache: {stats}".format(stats=cache.stats()))
 
     ga_instance.plot_result(title="Iteration vs. Fitness", linewidth=4)
 
@@ -1,30 +1,41 @@
-from typing import Callable
+from typing import Callable, List
 
 import pygad.torchga
 import pygad
 import numpy as np
 
 from pygad import torchga
-from ..ball_balancer import BBEnv
+from ..ball_balancer import BBEnv, BBVecEnv, BbSimulation, ScenarioBank
+from ..ball_balancer.kernels import plant_coefficients
 from ..DDPG import GeneticController
 from ..constants import MAX_ANGLE
+from ..fitness import FitnessCache, build_fitness_func, fitness_context, population_weights_as_dict
+from ..checkpoint import GACheckpointer
+from ..profiling import GA_PHASES, MODEL_PHASES, Profiler
 
 
-def fitness_fn_generator_blackbox(actor: GeneticController, reward_fn: Callable, reward_weight: float) -> Callable:
+def fitness_fn_generator_blackbox(actor: GeneticController, reward_fn: Callable, reward_weight: float,
+                                  seed: int = None) -> Callable:
     global torch_ga
     env = BBEnv(reward_fn, reward_weight)
+    if seed is not None:
+        env.seed(seed)
     env.genetic_generation_reset()
 
     def fitness_func(solution, sol_idx) -> float:
         model_weights_dict = torchga.model_weights_as_dict(model=actor, weights_vector=solution)
         actor.load_state_dict(model_weights_dict)
 
+        if seed is not None:
+            # Same target jumps for every candidate, deterministic fitness
+            env.seed(seed)
+
         cummulative_reward = 0.
         done: bool = False
         observation: np.ndarray = env.genetic_reset()
         while not done:
             action = actor.act(observation)
-            obs, reward, done, _ = env.step(action)
+            observation, reward, done, _ = env.step(action)
             cummulative_reward += reward
 
         return cummulative_reward
@@ -32,6 +43,76 @@ def fitness_fn_generator_blackbox(actor: GeneticController, reward_fn: Callable,
     return fitness_func
 
 
+def population_fitness_fn_generator_blackbox(actor: GeneticController, reward_fn: Callable, reward_weight: float,
+                                             population: int, seed: int = None) -> Callable:
+    """
+    Batch fitness function (pygad fitness_batch_size): the candidates are rolled out together in a vectorized
+    environement, with one batched forward per time step. With a seed every candidate plays the episode of
+    fitness_fn_generator_blackbox, whatever its row in the batch
+    """
+    env = BBVecEnv(population, reward_fn, reward_weight)
+    if seed is not None:
+        env.seed(seed, shared=True)
+    env.genetic_generation_reset()
+    n_weights: int = sum(p.numel() for p in actor.state_dict().values())
+
+    def fitness_func(solutions, solutions_indices) -> List[float]:
+        # pygad may submit less solutions than the population (kept parents), the remaining rows are padding
+        n_solutions: int = len(solutions)
+        padded_solutions = np.zeros((population, n_weights))
+        padded_solutions[:n_solutions] = solutions
+        weights = population_weights_as_dict(actor, padded_solutions)
+
+        if seed is not None:
+            env.seed(seed, shared=True)
+
+        cummulative_reward = np.zeros(population)
+        running = np.ones(population, dtype=bool)
+        observation: np.ndarray = env.genetic_reset()
+        while np.any(running):
+            action = actor.population_act(weights, observation)
+            observation, reward, done, _ = env.step(action)
+            cummulative_reward += reward * running
+            running &= ~done
+
+        return list(cummulative_reward[:n_solutions])
+
+    return fitness_func
+
+
+def scenario_fitness_fn_generator_blackbox(actor: GeneticController, reward_fn: Callable, reward_weight: float,
+                                           population: int, scenarios: ScenarioBank) -> Callable:
+    """
+    Batch fitness function (pygad fitness_batch_size) rolling out every candidate on every scenario of the bank in
+    one vectorized environement (population x scenarios). All the candidates see the same episodes, the fitness is
+    the mean cumulative reward over the scenarios.
+    """
+    n_scenarios: int = len(scenarios)
+    env = BBVecEnv(population * n_scenarios, reward_fn, reward_weight)
+    env.set_scenarios(scenarios)
+    n_weights: int = sum(p.numel() for p in actor.state_dict().values())
+
+    def fitness_func(solutions, solutions_indices) -> List[float]:
+        n_solutions: int = len(solutions)
+        padded_solutions = np.zeros((population, n_weights))
+        padded_solutions[:n_solutions] = solutions
+        # Environement p * n_scenarios + s plays scenario s with candidate p
+        weights = population_weights_as_dict(actor, np.repeat(padded_solutions, n_scenarios, axis=0))
+
+        cummulative_reward = np.zeros(env.n_envs)
+        running = np.ones(env.n_envs, dtype=bool)
+        observation: np.ndarray = env.reset()
+        while np.any(running):
+            action = actor.population_act(weights, observation)
+            observation, reward, done, _ = env.step(action)
+            cummulative_reward += reward * running
+            running &= ~done
+
+        return list(cummulative_reward.reshape(population, n_scenarios).mean(axis=1)[:n_solutions])
+
+    return fitness_func
+
+
 def callback_generation(ga_instance):
     print("Generation = {generation}".format(generation=ga_instance.generations_completed))
     print("Fitness    = {fitness}".format(fitness=ga_instance.best_solution()[1]))
@@ -40,7 +121,23 @@ def callback_generation(ga_instance):
 def train_ball_controller_genetic(hidden_size: int, reward_fn: Callable, reward_weight: float,
                                   nb_generation: int, population: int, num_parents_mating: int,
                                   parent_selection_type: str, crossover_type: str, mutation_type: str,
-                                  mutation_percent_genes: int, keep_parents: int):
+                                  mutation_percent_genes: int, keep_parents: int, n_workers: int = 1,
+                                  seed: int = None, population_batched: bool = False, checkpoint_path: str = None,
+                                  checkpoint_every: int = 1, resume: bool = False, n_scenarios: int = 0,
+                                  scenario_seed: int = None, cache_size: int = 1024, profiler: Profiler = None):
+    """
+    :param n_scenarios: Evaluate the candidates on a ScenarioBank of n_scenarios episodes instead of a single random
+                        episode per generation, the rollouts are vectorized over candidates and scenarios
+    :param scenario_seed: Seed of the bank, seed if None
+    :param cache_size: Number of fitness values kept by the FitnessCache, 0 to evaluate every solution. Only used
+                       with a seed, the fitness of a random episode is not worth caching
+    :param checkpoint_path: File of the periodic checkpoints (population, fitness cache, random generators)
+    :param checkpoint_every: Number of generations between two checkpoints
+    :param resume: Continue from the checkpoint in checkpoint_path if there is one. The resumed run is the one that
+                   was interrupted when the fitness is deterministic (seed given)
+    :param profiler: Profiler enabled during the run: the fitness function, the actor and the pygad engine are timed,
+                     see Profiler.report
+    """
 
     actor = GeneticController(6, hidden_size, 2)
     torch_ga = torchga.TorchGA(model=actor,
@@ -48,16 +145,47 @@ def train_ball_controller_genetic(hidden_size: int, reward_fn: Callable, reward_
 
     initial_population = torch_ga.population_weights
 
+    cache = None
+    if seed is not None and cache_size:
+        cache = FitnessCache(cache_size, fitness_context(seed, reward_fn, reward_weight, hidden_size,
+                                                         population_batched, n_scenarios, scenario_seed,
+                                                         plant_coefficients(BbSimulation())))
+
+    checkpointer = None
+    if checkpoint_path is not None:
+        checkpointer = GACheckpointer(checkpoint_path, checkpoint_every, callback_generation, cache)
+        checkpoint = checkpointer.resume() if resume else None
+        if checkpoint is not None:
+            initial_population = checkpoint['population']
+            nb_generation -= checkpoint['generations_completed']
+
+    if n_scenarios:
+        scenarios = ScenarioBank.generate(n_scenarios, seed if scenario_seed is None else scenario_seed)
+        fitness_func, pool = scenario_fitness_fn_generator_blackbox(actor, reward_fn, reward_weight, population,
+                                                                    scenarios), None
+    elif population_batched:
+        fitness_func, pool = population_fitness_fn_generator_blackbox(actor, reward_fn, reward_weight, population,
+                                                                      seed), None
+    else:
+        fitness_func, pool = build_fitness_func(fitness_fn_generator_blackbox, (actor, reward_fn, reward_weight, seed),
+                                                n_workers)
+    fitness_batch_size: int = population if n_scenarios or population_batched or pool is not None else None
+    if cache is not None:
+        fitness_func = cache.wrap(fitness_func, fitness_batch_size is not None)
+    if profiler is not None:
+        fitness_func = profiler.wrap_fitness(fitness_func)
+
     ga_instance = pygad.GA(num_generations=nb_generation,
                            num_parents_mating=num_parents_mating,
                            initial_population=initial_population,
-                           fitness_func=fitness_fn_generator_blackbox(actor, reward_fn, reward_weight),
+                           fitness_func=fitness_func,
+                           fitness_batch_size=fitness_batch_size,
                            parent_selection_type=parent_selection_type,
                            crossover_type=crossover_type,
                            mutation_type=mutation_type,
                            mutation_percent_genes=mutation_percent_genes,
                            keep_parents=keep_parents,
-                           on_generation=callback_generation,
+                           on_generation=callback_generation if checkpointer is None else checkpointer.on_generation,
                            init_range_low=-2.,
                            init_range_high=2.,
                            gene_space={'low': -2., 'high': 2.},
@@ -65,7 +193,18 @@ def train_ball_controller_genetic(hidden_size: int, reward_fn: Callable, reward_
                            random_mutation_max_val=0.1,
                            allow_duplicate_genes=False)
 
-    ga_instance.run()
+    if checkpointer is not None:
+        checkpointer.restore(ga_instance)
+    if profiler is None:
+        ga_instance.run()
+    else:
+        with profiler, profiler.instrumented(actor, MODEL_PHASES), profiler.instrumented(ga_instance, GA_PHASES), \
+                profiler.phase('ga_run'):
+            ga_instance.run()
+    if pool is not None:
+        pool.shutdown()
+    if cache is not None:
+        print("Fitness cache: {stats}".format(stats=cache.stats()))
 
     ga_instance.plot_result(title="Iteration vs. Fitness", linewidth=4)
 
@@ -3,22 +3,41 @@ import torch
 
 from torch import relu, tanh
 from torch.autograd import Variable
+from typing import Dict
 from sklearn.metrics import r2_score
 from ..constants import DT, MAX_X, MAX_Y
+from ..inference import NumpyInference, numpy_linear
+from ..model_training import train_model
 
 
-class Ball(torch.nn.Module):
+class Ball(NumpyInference, torch.nn.Module):
     def __init__(self):
         super(Ball, self).__init__()
 
-    def step(self, x: float, y: float, d_x: float, d_y: float, angle_x: float, angle_y: float) -> float:
+    def step(self, x: float, y: float, d_x: float, d_y: float, angle_x: float, angle_y: float) -> torch.Tensor:
         top = 1. if y > 0 else 0.
         right = 1. if x > 0. else 0.
-        x = torch.tensor(
-            [[int(top and right), int(top and not right), int(not top and right), int(not top and not right), d_x, d_y,
-              angle_x * 7., angle_y * 7.]])
+        inputs = [int(top and right), int(top and not right), int(not top and right), int(not top and not right), d_x,
+                  d_y, angle_x * 7., angle_y * 7.]
+        weights = self.inference_weights()
+        if weights is not None:
+            # Same (2,) float32 tensor as the torch path
+            return torch.from_numpy(self.numpy_forward(weights, np.array(inputs, dtype=np.float64))).float()
+        x = torch.tensor([inputs])
         return self.forward(x)[0]
 
+    def step_many(self, x: np.ndarray, y: np.ndarray, d_x: np.ndarray, d_y: np.ndarray, angle_x: np.ndarray,
+                  angle_y: np.ndarray) -> np.ndarray:
+        """
+        step of N samples at once, in numpy. Every argument is a (N,) array
+        :return: (N, 2) speed variations
+        """
+        top = np.asarray(y) > 0.
+        right = np.asarray(x) > 0.
+        inputs = np.stack([top & right, top & ~right, ~top & right, ~top & ~right, d_x, d_y,
+                           np.asarray(angle_x) * 7., np.asarray(angle_y) * 7.], axis=1).astype(np.float64)
+        return self.numpy_forward(self.batch_weights(), inputs)
+
     def recurcive_predict(self, x_0: float, y_0: float, d_x_0: float, d_y_0: float, inputs: np.ndarray) -> np.ndarray:
         pos: np.ndarray = np.zeros((inputs.shape[0], 2))
         pos[0, 0] = x_0
@@ -35,6 +54,27 @@ class Ball(torch.nn.Module):
             pos[i, 1] = max(min(pos[i - 1, 1] + d_y * DT, MAX_Y), -MAX_Y)
         return pos
 
+    def recurcive_predict_many(self, x_0: np.ndarray, d_x_0: np.ndarray, inputs: np.ndarray) -> np.ndarray:
+        """
+        recurcive_predict of B sequences advanced together, one step_many per tick
+        :param x_0: (B, 2) initial positions
+        :param d_x_0: (B, 2) initial speeds
+        :param inputs: (B, T, 2) inputs (sin of the angles)
+        :return: (B, T, 2) positions
+        """
+        inputs = np.asarray(inputs, dtype=np.float64)
+        pos: np.ndarray = np.zeros_like(inputs)
+        pos[:, 0] = x_0
+        d_x = np.array(d_x_0, dtype=np.float64)
+        limit = np.array([MAX_X, MAX_Y])
+
+        with self.exported_weights():
+            for i in range(1, inputs.shape[1]):
+                d_x = d_x + self.step_many(pos[:, i - 1, 0], pos[:, i - 1, 1], d_x[:, 0], d_x[:, 1],
+                                           inputs[:, i - 1, 0], inputs[:, i - 1, 1])
+                pos[:, i] = np.clip(pos[:, i - 1] + d_x * DT, -limit, limit)
+        return pos
+
 
 class BallNet1Hidden(Ball):
     def __init__(self, n_inputs: int, n_hidden_1: int, n_output: int):
@@ -48,6 +88,12 @@ class BallNet1Hidden(Ball):
         x = self.predict(x)
         return x / 50.
 
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        x = np.maximum(numpy_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']), 0.)
+        x = numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x / 50.
+
 
 class BallNet2Hidden(Ball):
     def __init__(self, n_inputs: int, n_hidden_1: int, n_hidden_2: int, n_output: int):
@@ -63,8 +109,22 @@ class BallNet2Hidden(Ball):
         x = self.predict(x)
         return x / 50.
 
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        x = np.maximum(numpy_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']), 0.)
+        x = np.maximum(numpy_linear(x, weights['hidden_2.weight'], weights['hidden_2.bias']), 0.)
+        x = numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x / 50.
+
 
-def train_ball_model(model: torch.nn.Module, x: Variable, y: Variable, n_epoch: int = 200) -> torch.nn.Module:
+def train_ball_model(model: torch.nn.Module, x: Variable, y: Variable, n_epoch: int = 200,
+                     batch_size: int = None, **kwargs) -> torch.nn.Module:
+    """
+    Full-batch SGD, or the mini-batch training with early stopping of model_training.train_model if batch_size is
+    given (kwargs: optimizer, lr, patience, checkpoint_path...)
+    """
+    if batch_size is not None:
+        return train_model(model, x, y, n_epoch=n_epoch, batch_size=batch_size, **kwargs)[0]
     optimizer = torch.optim.SGD(model.parameters(), lr=0.00001, momentum=0.5)
     loss_func = torch.nn.MSELoss()
 
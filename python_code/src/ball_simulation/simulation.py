@@ -32,14 +32,38 @@ class BallSimulation:
         :param angle_x: Current input
         :param angle_y: Current input
         """
-        x = np.array([self.d_x[0], self.d_x[1], np.sin(np.pi / 180. * angle_x), np.sin(np.pi / 180. * angle_y)])
-        self.d_x = self.d_x + np.dot(self.a, x)
+        sin_x = np.sin(np.pi / 180. * angle_x)
+        sin_y = np.sin(np.pi / 180. * angle_y)
+        # Explicit sum (no BLAS dot) so the batched simulation reproduces it bit for bit
+        self.d_x = self.d_x + (self.a[:, 0] * self.d_x[0] + self.a[:, 1] * self.d_x[1] + self.a[:, 2] * sin_x +
+                               self.a[:, 3] * sin_y)
         # self.d_x[self.x > MAX_X] = 0.  # MAX_X
         # self.d_x[self.x < -MAX_X] = 0.  # -MAX_X
         self.x = self.x + self.d_x * DT
         # self.x[self.x > MAX_X] = MAX_X
         # self.x[self.x < -MAX_X] = -MAX_X
 
+    def recurcive_predict_many(self, x_0: np.ndarray, d_x_0: np.ndarray, angles: np.ndarray) -> np.ndarray:
+        """
+        Positions of B balls driven by angle sequences, the step recurrence on (B, 2) arrays
+        :param x_0: (B, 2) initial positions
+        :param d_x_0: (B, 2) initial speeds
+        :param angles: (B, T, 2) angles in degrees
+        :return: (B, T, 2) positions
+        """
+        sin = np.sin(np.pi / 180. * np.asarray(angles, dtype=np.float64))
+        pos: np.ndarray = np.zeros_like(sin)
+        pos[:, 0] = x_0
+        d_x = np.array(d_x_0, dtype=np.float64)
+        a = self.a
+
+        for i in range(1, sin.shape[1]):
+            # Same sum as step, column by column
+            d_x = d_x + (a[:, 0] * d_x[:, 0:1] + a[:, 1] * d_x[:, 1:2] + a[:, 2] * sin[:, i - 1, 0:1] +
+                         a[:, 3] * sin[:, i - 1, 1:2])
+            pos[:, i] = pos[:, i - 1] + d_x * DT
+        return pos
+
 
 class BallSimulation1D:
 
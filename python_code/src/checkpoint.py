@@ -0,0 +1,128 @@
+import os
+import random
+from typing import Callable, Optional
+
+import numpy as np
+import torch
+
+from .fitness import FitnessCache
+
+
+def atomic_save(obj, path: str):
+    """
+    torch.save through a temporary file renamed over path, a killed run never leaves a truncated checkpoint
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    torch.save(obj, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    """
+    :return: The checkpoint, None if there is none
+    """
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, weights_only=False)
+
+
+def rng_states() -> dict:
+    """
+    States of the global generators (python, numpy, torch)
+    """
+    return {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+
+
+def set_rng_states(states: dict):
+    random.setstate(states['python'])
+    np.random.set_state(states['numpy'])
+    torch.set_rng_state(states['torch'])
+
+
+class GACheckpointer:
+    """
+    Periodic checkpoints of a pygad run: population, its fitness, fitness cache, best fitness of every generation and
+    the random generators, written atomically at the end of the generations.
+    """
+
+    def __init__(self, path: str, every: int = 1, on_generation: Callable = None, fitness_cache: FitnessCache = None):
+        """
+        :param path: Checkpoint file
+        :param every: Number of generations between two checkpoints
+        :param on_generation: Callback to run before checkpointing
+        :param fitness_cache: Cache of the fitness function saved with the checkpoints, only when the fitness is
+                              deterministic
+        """
+        self.path: str = path
+        self.every: int = every
+        self.callback: Callable = on_generation
+        self.fitness_cache: Optional[FitnessCache] = fitness_cache
+        self.generations_offset: int = 0
+        self.best_solutions_fitness: list = []
+        self.checkpoint: Optional[dict] = None
+
+    def resume(self) -> Optional[dict]:
+        """
+        Load the last checkpoint and its fitness cache, restore must then be called on the new GA instance. The saved
+        fitness values are dropped when the cache context differs (other reward, controller, plant...)
+        :return: The checkpoint, None if there is none
+        """
+        self.checkpoint = load_checkpoint(self.path)
+        if self.checkpoint is not None:
+            if self.fitness_cache is not None and self.checkpoint.get('fitness_context') == self.fitness_cache.context:
+                for key, value in (self.checkpoint['fitness_cache'] or {}).items():
+                    self.fitness_cache.put(key, value)
+            self.generations_offset = self.checkpoint['generations_completed']
+            self.best_solutions_fitness = list(self.checkpoint['best_solutions_fitness'])
+        return self.checkpoint
+
+    def restore(self, ga_instance):
+        """
+        Restore the best fitness history and the random generators of the resumed run, to call right before
+        ga_instance.run()
+        """
+        if self.checkpoint is None:
+            return
+        # run() evaluates the checkpointed population again and appends its best fitness, the last entry
+        ga_instance.best_solutions_fitness = list(self.best_solutions_fitness[:-1])
+        set_rng_states(self.checkpoint['rng_states'])
+        for name, state in self.checkpoint['ga_rng_states'].items():
+            generator = getattr(ga_instance, name)
+            if hasattr(generator, 'set_state'):
+                generator.set_state(state)
+            else:
+                generator.setstate(state)
+
+    def generations_completed(self, ga_instance) -> int:
+        return self.generations_offset + ga_instance.generations_completed
+
+    def on_generation(self, ga_instance):
+        if self.callback is not None:
+            self.callback(ga_instance)
+        _, best_fitness, _ = ga_instance.best_solution(pop_fitness=ga_instance.last_generation_fitness)
+        if not self.best_solutions_fitness:
+            # Best fitness of the initial population
+            self.best_solutions_fitness.append(ga_instance.best_solutions_fitness[0])
+        self.best_solutions_fitness.append(best_fitness)
+        if self.generations_completed(ga_instance) % self.every == 0:
+            self.save(ga_instance)
+
+    def save(self, ga_instance):
+        # Generators owned by the GA instance (recent pygad versions)
+        ga_rng_states = {}
+        for name in ('numpy_random_generator', 'python_random_generator'):
+            generator = getattr(ga_instance, name, None)
+            if generator is not None:
+                ga_rng_states[name] = generator.get_state() if hasattr(generator, 'get_state') else \
+                    generator.getstate()
+        checkpoint = {
+            'generations_completed': self.generations_completed(ga_instance),
+            'population': np.array(ga_instance.population),
+            'last_generation_fitness': np.array(ga_instance.last_generation_fitness),
+            'best_solutions_fitness': self.best_solutions_fitness,
+            'fitness_cache': None if self.fitness_cache is None else dict(self.fitness_cache.values),
+            'fitness_context': None if self.fitness_cache is None else self.fitness_cache.context,
+            'rng_states': rng_states(),
+            'ga_rng_states': ga_rng_states,
+        }
+        atomic_save(checkpoint, self.path)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+# Fitness function of a worker process, built once by the pool initializer
+_worker_fitness_func: Optional[Callable] = None
+
+
+def _init_worker(fitness_fn_generator: Callable, generator_args: tuple):
+    global _worker_fitness_func
+    torch.set_num_threads(1)
+    _worker_fitness_func = fitness_fn_generator(*generator_args)
+
+
+def _worker_evaluate(solution: np.ndarray, sol_idx: int) -> float:
+    return _worker_fitness_func(solution, sol_idx)
+
+
+def parallel_fitness_fn_generator(fitness_fn_generator: Callable, generator_args: tuple,
+                                  n_workers: int = None) -> Tuple[Callable, ProcessPoolExecutor]:
+    """
+    Batch fitness function (pygad fitness_batch_size) spreading the population over a pool of worker processes.
+    Every worker builds its own model and evaluator once with fitness_fn_generator(*generator_args), so it returns the
+    same fitness values as the serial fitness function whenever the evaluation is deterministic.
+
+    :param fitness_fn_generator: Module level fitness function generator, must be picklable
+    :param generator_args: Arguments of the generator
+    :param n_workers: Number of worker processes, one per core if None
+    :return: Batch fitness function and the pool, to shut down once the training is over
+    """
+    n_workers = n_workers or os.cpu_count()
+    pool = ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(fitness_fn_generator, generator_args))
+
+    def fitness_func(solutions, solutions_indices) -> List[float]:
+        chunksize: int = max(1, len(solutions) // n_workers)
+        return list(pool.map(_worker_evaluate, solutions, solutions_indices, chunksize=chunksize))
+
+    return fitness_func, pool
+
+
+def build_fitness_func(fitness_fn_generator: Callable, generator_args: tuple,
+                       n_workers: int = 1) -> Tuple[Callable, Optional[ProcessPoolExecutor]]:
+    """
+    Serial fitness function if n_workers is 1, parallel batch fitness function otherwise
+    """
+    if n_workers == 1:
+        return fitness_fn_generator(*generator_args), None
+    return parallel_fitness_fn_generator(fitness_fn_generator, generator_args, n_workers)
+
+
+def population_weights_as_dict(model: torch.nn.Module, solutions: np.ndarray) -> Dict[str, torch.Tensor]:
+    """
+    Batched torchga.model_weights_as_dict: the weights of P solutions stacked along a new first dimension
+    :param model: Model giving the layout of the weights vectors
+    :param solutions: (P, n_weights) solutions
+    :return: State dict of (P, ...) tensors
+    """
+    solutions = torch.as_tensor(np.asarray(solutions), dtype=torch.float32)
+    weights: Dict[str, torch.Tensor] = {}
+    start: int = 0
+    for key, value in model.state_dict().items():
+        end: int = start + value.numel()
+        weights[key] = solutions[:, start:end].reshape((-1,) + value.shape)
+        start = end
+    return weights
+
+
+def fitness_context(*arrays) -> bytes:
+    """
+    Digest of what the fitness depends on besides the solution: target trajectory, plant parameters, seed...
+    Strings and functions (reward function...) are hashed by name, the other values as float64 arrays.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        if callable(array):
+            array = '{}.{}'.format(array.__module__, array.__qualname__)
+        if isinstance(array, str):
+            digest.update(array.encode())
+        else:
+            digest.update(np.asarray(-1 if array is None else array, dtype=np.float64).tobytes())
+    return digest.digest()
+
+
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness values. The key hashes the solution vector with the context digest (see
+    fitness_context), a cache only holds the values of one trajectory and plant. pygad evaluates again the kept
+    parents and the duplicate genomes of every generation, they are hits when the fitness is deterministic.
+    """
+
+    def __init__(self, max_size: int = 1024, context: bytes = b''):
+        """
+        :param max_size: Number of fitness values kept, the least recently used ones are dropped first
+        :param context: Digest of the trajectory and plant, see fitness_context
+        """
+        self.max_size: int = max_size
+        self.context: bytes = context
+        self.values: OrderedDict = OrderedDict()
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def key(self, solution: np.ndarray) -> bytes:
+        digest = hashlib.blake2b(self.context, digest_size=16)
+        digest.update(np.asarray(solution, dtype=np.float64).tobytes())
+        return digest.digest()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, key: bytes) -> Optional[float]:
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.values.move_to_end(key)
+        return value
+
+    def put(self, key: bytes, value: float):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self) -> float:
+        return self.hits / max(1, self.hits + self.misses)
+
+    def stats(self) -> Dict[str, float]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.values),
+                'hit_rate': self.hit_rate()}
+
+    def wrap(self, fitness_func: Callable, batched: bool = False) -> Callable:
+        """
+        Fitness function looking the solutions up in the cache first. A batch fitness function (pygad
+        fitness_batch_size, process pool) only receives the missing solutions.
+        :param batched: fitness_func is a batch fitness function
+        """
+        if batched:
+            def batch_fitness_func(solutions, solutions_indices) -> List[float]:
+                keys = [self.key(solution) for solution in solutions]
+                fitness = [self.get(key) for key in keys]
+                missing = [i for i, value in enumerate(fitness) if value is None]
+                if missing:
+                    values = fitness_func([solutions[i] for i in missing], [solutions_indices[i] for i in missing])
+                    for i, value in zip(missing, values):
+                        fitness[i] = value
+                        self.put(keys[i], value)
+                return fitness
+
+            return batch_fitness_func
+
+        def cached_fitness_func(solution, sol_idx) -> float:
+            key = self.key(solution)
+            value = self.get(key)
+            if value is None:
+                value = fitness_func(solution, sol_idx)
+                self.put(key, value)
+            return value
+
+        return cached_fitness_func
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+
+def numpy_weights(model: torch.nn.Module) -> Dict[str, np.ndarray]:
+    """
+    State dict of the model as float64 numpy arrays
+    """
+    return {key: value.detach().cpu().numpy().astype(np.float64) for key, value in model.state_dict().items()}
+
+
+def numpy_linear(x: np.ndarray, weight: np.ndarray, bias: np.ndarray = None) -> np.ndarray:
+    """
+    torch.nn.Linear on numpy arrays
+    :param x: (in,) or (N, in) inputs
+    :param weight: (out, in) weights
+    :param bias: (out,) biases
+    :return: (out,) or (N, out) outputs
+    """
+    x = x @ weight.T
+    if bias is not None:
+        x = x + bias
+    return x
+
+
+def population_linear(x: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor = None) -> torch.Tensor:
+    """
+    P linear layers applied to P inputs in one batched matmul
+    :param x: (P, in) inputs
+    :param weight: (P, out, in) weights
+    :param bias: (P, out) biases
+    :return: (P, out) outputs
+    """
+    x = torch.einsum('poi,pi->po', weight, x)
+    if bias is not None:
+        x = x + bias
+    return x
+
+
+class NumpyInference:
+    """
+    Inference without torch for the small models. Every model defines numpy_forward(weights, x), the numpy twin of
+    its forward. inference_mode exports the weights once, the scalar step then calls numpy_forward instead of building
+    a tensor and going through autograd. The export is a snapshot refreshed by load_state_dict, call inference_mode
+    again after changing the weights any other way (optimizer step).
+    """
+
+    def inference_mode(self, enabled: bool = True):
+        self._inference_weights = numpy_weights(self) if enabled else None
+
+    def load_state_dict(self, *args, **kwargs):
+        result = super(NumpyInference, self).load_state_dict(*args, **kwargs)
+        if self.inference_weights() is not None:
+            self.inference_mode()
+        return result
+
+    def inference_weights(self) -> Optional[Dict[str, np.ndarray]]:
+        """
+        :return: Exported weights, None if the model is not in inference mode
+        """
+        # Models loaded with torch.load skip __init__, the attribute may not exist
+        return self.__dict__.get('_inference_weights')
+
+    def batch_weights(self) -> Dict[str, np.ndarray]:
+        """
+        Weights used by step_many, the exported ones or a new export
+        """
+        weights = self.inference_weights()
+        return numpy_weights(self) if weights is None else weights
+
+    @contextmanager
+    def exported_weights(self):
+        """
+        Inference mode for the duration of a rollout, the weights are exported once instead of at every step_many
+        """
+        if self.inference_weights() is not None:
+            yield
+            return
+        self.inference_mode()
+        try:
+            yield
+        finally:
+            self.inference_mode(False)
+
+
+def ensemble_recurcive_predict(models: List[NumpyInference], *args) -> np.ndarray:
+    """
+    recurcive_predict_many of every candidate model on the same sequences
+    :return: (M, B, ...) predictions of the M models
+    """
+    return np.stack([model.recurcive_predict_many(*args) for model in models])
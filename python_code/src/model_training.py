@@ -0,0 +1,151 @@
+"""
+Training engine of the identification models (PlateauNet*, BallNet*): shuffled mini-batches, configurable optimizer,
+early stopping on a validation set and checkpoint of the best model. train_models trains a list of candidate
+architectures, in a pool of worker processes when n_workers > 1.
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from sklearn.metrics import r2_score
+from torch.utils.data import BatchSampler, DataLoader, RandomSampler, TensorDataset
+
+from .checkpoint import atomic_save
+
+OPTIMIZERS: Dict[str, type] = {
+    'sgd': torch.optim.SGD,
+    'adam': torch.optim.Adam,
+    'adamw': torch.optim.AdamW,
+    'rmsprop': torch.optim.RMSprop,
+}
+
+
+def split_validation(x: torch.Tensor, y: torch.Tensor, fraction: float,
+                     seed: int = None) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Random split of the samples in training and validation sets
+    :param fraction: Fraction of the samples kept for the validation
+    :return: x_train, y_train, x_val, y_val
+    """
+    permutation = torch.as_tensor(np.random.default_rng(seed).permutation(len(x)))
+    n_val: int = int(len(x) * fraction)
+    val, train = permutation[:n_val], permutation[n_val:]
+    return x[train], y[train], x[val], y[val]
+
+
+def evaluate_loss(model: torch.nn.Module, x: torch.Tensor, y: torch.Tensor) -> float:
+    with torch.no_grad():
+        return torch.nn.functional.mse_loss(model(x), y).item()
+
+
+def train_model(model: torch.nn.Module, x: torch.Tensor, y: torch.Tensor, x_val: torch.Tensor = None,
+                y_val: torch.Tensor = None, n_epoch: int = 1000, batch_size: int = 256, optimizer: str = 'adam',
+                lr: float = 1e-3, optimizer_kwargs: dict = None, validation_fraction: float = 0.2, patience: int = 20,
+                min_delta: float = 0., checkpoint_path: str = None, seed: int = None,
+                verbose: bool = True) -> Tuple[torch.nn.Module, dict]:
+    """
+    Mini-batch training on the MSE, stopped when the validation loss did not improve for patience epochs. The model
+    is returned with the weights of its best validation epoch.
+    :param x_val: Validation inputs, validation_fraction of (x, y) if None
+    :param y_val: Validation targets
+    :param optimizer: Key of OPTIMIZERS
+    :param optimizer_kwargs: Other arguments of the optimizer (momentum, weight_decay...)
+    :param patience: Number of epochs without improvement before stopping, never stopped if 0
+    :param min_delta: Smallest decrease of the validation loss counted as an improvement
+    :param checkpoint_path: File where the best model is saved at every improvement
+    :param seed: Seed of the validation split, the shuffling and of torch during the training. The model is already
+                 initialized, seed torch before building it for a reproducible run
+    :return: Model and history: train_loss and val_loss per epoch, best_epoch, best_val_loss, val_r2
+    """
+    if seed is not None:
+        torch.manual_seed(seed)
+    if x_val is None:
+        x, y, x_val, y_val = split_validation(x, y, validation_fraction, seed)
+
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    dataset = TensorDataset(x, y)
+    # Whole mini-batches indexed at once, the default per sample collate dominates the step of these small models
+    sampler = BatchSampler(RandomSampler(dataset, generator=generator), batch_size, drop_last=False)
+    loader = DataLoader(dataset, sampler=sampler, batch_size=None)
+    optimizer = OPTIMIZERS[optimizer](model.parameters(), lr=lr, **(optimizer_kwargs or {}))
+    loss_func = torch.nn.MSELoss()
+
+    history = {'train_loss': [], 'val_loss': [], 'best_epoch': -1, 'best_val_loss': np.inf}
+    best_state: Optional[dict] = None
+    for epoch in range(n_epoch):
+        model.train()
+        total_loss: float = 0.
+        for x_batch, y_batch in loader:
+            loss = loss_func(model(x_batch), y_batch)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(x_batch)
+        model.eval()
+        val_loss: float = evaluate_loss(model, x_val, y_val)
+        history['train_loss'].append(total_loss / len(x))
+        history['val_loss'].append(val_loss)
+
+        if val_loss < history['best_val_loss'] - min_delta:
+            history['best_epoch'], history['best_val_loss'] = epoch, val_loss
+            best_state = copy.deepcopy(model.state_dict())
+            if checkpoint_path is not None:
+                atomic_save({'model': model, 'epoch': epoch, 'val_loss': val_loss}, checkpoint_path)
+        elif patience and epoch - history['best_epoch'] >= patience:
+            break
+        if verbose and epoch % 100 == 0:
+            print(epoch, history['train_loss'][-1], val_loss)
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    with torch.no_grad():
+        history['val_r2'] = r2_score(y_val.numpy(), model(x_val).numpy())
+    if verbose:
+        print('best epoch', history['best_epoch'], history['best_val_loss'], 'r2', history['val_r2'])
+    return model, history
+
+
+def train_candidate(args: tuple) -> Tuple[torch.nn.Module, dict]:
+    model, x, y, kwargs = args
+    torch.set_num_threads(1)
+    return train_model(model, x, y, **kwargs)
+
+
+def train_models(models: List[torch.nn.Module], x: torch.Tensor, y: torch.Tensor, n_workers: int = 1,
+                 checkpoint_dir: str = None, **kwargs) -> Tuple[List[torch.nn.Module], List[dict]]:
+    """
+    train_model of every candidate on the same data and validation split
+    :param n_workers: Number of worker processes, one per core if None, trained in this process if 1
+    :param checkpoint_dir: Directory of the best models, candidate_<i>.pt
+    :param kwargs: Arguments of train_model, seed included so all the candidates see the same split
+    :return: Trained models and their histories
+    """
+    if kwargs.get('x_val') is None:
+        x, y, kwargs['x_val'], kwargs['y_val'] = split_validation(x, y, kwargs.pop('validation_fraction', 0.2),
+                                                                  kwargs.get('seed'))
+    jobs = []
+    for i, model in enumerate(models):
+        candidate_kwargs = dict(kwargs)
+        if checkpoint_dir is not None:
+            candidate_kwargs['checkpoint_path'] = os.path.join(checkpoint_dir, 'candidate_{}.pt'.format(i))
+        jobs.append((model, x, y, candidate_kwargs))
+
+    if n_workers == 1:
+        results = [train_model(model, x, y, **candidate_kwargs) for model, x, y, candidate_kwargs in jobs]
+    else:
+        with ProcessPoolExecutor(n_workers or os.cpu_count()) as pool:
+            results = list(pool.map(train_candidate, jobs))
+    return [model for model, _ in results], [history for _, history in results]
+
+
+def best_model(models: List[torch.nn.Module], histories: List[dict]) -> Tuple[int, torch.nn.Module]:
+    """
+    :return: Index and model of the lowest validation loss
+    """
+    index = int(np.argmin([history['best_val_loss'] for history in histories]))
+    return index, models[index]
@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import Callable, List
 
 import pygad.torchga
 import pygad
@@ -6,13 +6,18 @@ import numpy as np
 
 from pygad import torchga
 from .neural_net_controller import MotorController, PidController, NnController
+from .neural_net_motor import PlateauPhy
 from .simulation import ModelEvaluator
+from ..fitness import FitnessCache, build_fitness_func, fitness_context, population_weights_as_dict
 
 
 def fitness_fn_generator(model: MotorController, target_trajectory: np.ndarray) -> Callable:
     global torch_ga
     evaluator: ModelEvaluator = ModelEvaluator(target_trajectory)
 
+    # Numpy scalar steps, the weights export is refreshed by load_state_dict
+    model.inference_mode()
+
     def fitness_func(solution, sol_idx) -> float:
         model_weights_dict = torchga.model_weights_as_dict(model=model,
                                                            weights_vector=solution)
@@ -24,6 +29,19 @@ def fitness_fn_generator(model: MotorController, target_trajectory: np.ndarray)
     return fitness_func
 
 
+def population_fitness_fn_generator(model: MotorController, target_trajectory: np.ndarray) -> Callable:
+    """
+    Batch fitness function (pygad fitness_batch_size) simulating the whole batch with one forward per time step
+    """
+    evaluator: ModelEvaluator = ModelEvaluator(target_trajectory)
+
+    def fitness_func(solutions, solutions_indices) -> List[float]:
+        weights = population_weights_as_dict(model, solutions)
+        return list(evaluator.evaluate_population(model, weights))
+
+    return fitness_func
+
+
 def callback_generation(ga_instance):
     print("Generation = {generation}".format(generation=ga_instance.generations_completed))
     print("Fitness    = {fitness}".format(fitness=ga_instance.best_solution()[1]))
@@ -31,7 +49,11 @@ def callback_generation(ga_instance):
 
 def train_motor_controller(target_trajectory: np.ndarray, nb_generation: int, population: int,
                            controller_type: str = 'pid',
-                           hidden_size: int = 9) -> MotorController:
+                           hidden_size: int = 9, n_workers: int = 1,
+                           population_batched: bool = False, cache_size: int = 1024) -> MotorController:
+    """
+    :param cache_size: Number of fitness values kept by the FitnessCache, 0 to evaluate every solution
+    """
     model: MotorController
     if controller_type == 'pid':
         model = PidController(3, 1)
@@ -49,10 +71,25 @@ def train_motor_controller(target_trajectory: np.ndarray, nb_generation: int, po
     mutation_percent_genes: int = 50
     keep_parents: int = 3
 
+    if population_batched:
+        fitness_func, pool = population_fitness_fn_generator(model, target_trajectory), None
+    else:
+        fitness_func, pool = build_fitness_func(fitness_fn_generator, (model, target_trajectory), n_workers)
+    fitness_batch_size: int = population if population_batched or pool is not None else None
+
+    # phy_simulate is deterministic, the fitness only depends on the solution, trajectory and motor
+    cache = None
+    if cache_size:
+        motor = PlateauPhy()
+        cache = FitnessCache(cache_size, fitness_context(target_trajectory,
+                                                         [motor.u_coef, motor.s_coef, motor.speed_scaling]))
+        fitness_func = cache.wrap(fitness_func, fitness_batch_size is not None)
+
     ga_instance = pygad.GA(num_generations=nb_generation,
                            num_parents_mating=num_parents_mating,
                            initial_population=initial_population,
-                           fitness_func=fitness_fn_generator(model, target_trajectory),
+                           fitness_func=fitness_func,
+                           fitness_batch_size=fitness_batch_size,
                            parent_selection_type=parent_selection_type,
                            crossover_type=crossover_type,
                            mutation_type=mutation_type,
@@ -61,6 +98,10 @@ def train_motor_controller(target_trajectory: np.ndarray, nb_generation: int, po
                            on_generation=callback_generation)
 
     ga_instance.run()
+    if pool is not None:
+        pool.shutdown()
+    if cache is not None:
+        print("Fitness cache: {stats}".format(stats=cache.stats()))
 
     ga_instance.plot_result(title="Iteration vs. Fitness", linewidth=4)
 
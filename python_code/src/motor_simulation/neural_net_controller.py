@@ -1,11 +1,14 @@
+import numpy as np
 import torch
 
+from typing import Dict
 from torch import relu
 from numpy import abs, sign
 from ..constants import MOTOR_ERROR_SCALING, MOTOR_D_ERROR_SCALING, MOTOR_INTEGRAL_ERROR_SCALING
+from ..inference import NumpyInference, numpy_linear, population_linear
 
 
-class MotorController(torch.nn.Module):
+class MotorController(NumpyInference, torch.nn.Module):
 
     def __init__(self):
         super(MotorController, self).__init__()
@@ -15,6 +18,9 @@ class MotorController(torch.nn.Module):
         d_error = d_error * MOTOR_D_ERROR_SCALING
         integral_error = integral_error * MOTOR_INTEGRAL_ERROR_SCALING
 
+        weights = self.inference_weights()
+        if weights is not None:
+            return self.numpy_forward(weights, np.array([error, d_error, integral_error]))[0].item()
         x = torch.tensor([[
             error,
             d_error,
@@ -22,6 +28,33 @@ class MotorController(torch.nn.Module):
         ]])
         return self.forward(x)[0].item()
 
+    def step_many(self, error: np.ndarray, d_error: np.ndarray, integral_error: np.ndarray) -> np.ndarray:
+        """
+        step of N samples at once, in numpy
+        :return: (N,) controls
+        """
+        x = np.stack([
+            np.asarray(error) * MOTOR_ERROR_SCALING,
+            np.asarray(d_error) * MOTOR_D_ERROR_SCALING,
+            np.asarray(integral_error) * MOTOR_INTEGRAL_ERROR_SCALING,
+        ], axis=1).astype(np.float64)
+        return self.numpy_forward(self.batch_weights(), x)[:, 0]
+
+    def population_step(self, weights: Dict[str, torch.Tensor], error: np.ndarray, d_error: np.ndarray,
+                        integral_error: np.ndarray) -> np.ndarray:
+        """
+        Step of P controllers at once, one error per controller
+        :param weights: Stacked state dicts, see fitness.population_weights_as_dict
+        :return: (P,) controls
+        """
+        x = torch.as_tensor(np.stack([
+            error * MOTOR_ERROR_SCALING,
+            d_error * MOTOR_D_ERROR_SCALING,
+            integral_error * MOTOR_INTEGRAL_ERROR_SCALING,
+        ], axis=1), dtype=torch.float32)
+        with torch.no_grad():
+            return self.population_forward(weights, x)[:, 0].numpy()
+
 
 class PidController(MotorController):
     def __init__(self, n_inputs: int, n_output: int):
@@ -33,6 +66,14 @@ class PidController(MotorController):
         x = self.predict(x)
         return x
 
+    @staticmethod
+    def population_forward(weights: Dict[str, torch.Tensor], x: torch.Tensor) -> torch.Tensor:
+        return population_linear(x, weights['predict.weight'], weights['predict.bias'])
+
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        return numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+
 
 class NnController(MotorController):
     def __init__(self, n_inputs: int, n_hidden_1: int, n_output: int):
@@ -45,3 +86,15 @@ class NnController(MotorController):
         x = relu(self.hidden_1(x))
         x = self.predict(x)
         return x
+
+    @staticmethod
+    def population_forward(weights: Dict[str, torch.Tensor], x: torch.Tensor) -> torch.Tensor:
+        x = relu(population_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']))
+        x = population_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x
+
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        x = np.maximum(numpy_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']), 0.)
+        x = numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x
@@ -4,18 +4,35 @@ import json
 
 from torch import relu
 from torch.autograd import Variable
+from typing import Dict
 from sklearn.metrics import r2_score
 from ..constants import MOTOR_SPEED_SCALING
+from ..inference import NumpyInference, numpy_linear
+from ..model_training import train_model
 
 
-class Plateau(torch.nn.Module):
+class Plateau(NumpyInference, torch.nn.Module):
     def __init__(self):
         super(Plateau, self).__init__()
 
-    def step(self, u: float, s: float) -> float:
+    def step(self, u: float, s: float) -> torch.Tensor:
+        weights = self.inference_weights()
+        if weights is not None:
+            # Same (1,) float32 tensor as the torch path
+            return torch.from_numpy(self.numpy_forward(weights, np.array([[u, s / MOTOR_SPEED_SCALING]]))[0]).float()
         x = torch.tensor([[u, s / MOTOR_SPEED_SCALING]])
         return self.forward(x)[0]
 
+    def step_many(self, u: np.ndarray, s: np.ndarray) -> np.ndarray:
+        """
+        step of N samples at once, in numpy
+        :param u: (N,) inputs
+        :param s: (N,) speeds
+        :return: (N,) next speeds
+        """
+        x = np.stack([np.asarray(u, dtype=np.float64), np.asarray(s, dtype=np.float64) / MOTOR_SPEED_SCALING], axis=1)
+        return self.numpy_forward(self.batch_weights(), x)[:, 0]
+
     def recurcive_predict(self, s_0: float, u: np.ndarray) -> np.ndarray:
         s = np.zeros_like(u)
         s[0] = s_0
@@ -23,6 +40,21 @@ class Plateau(torch.nn.Module):
             s[i] = self.step(u[i - 1], s[i - 1] / MOTOR_SPEED_SCALING)
         return s
 
+    def recurcive_predict_many(self, s_0: np.ndarray, u: np.ndarray) -> np.ndarray:
+        """
+        recurcive_predict of B sequences advanced together, one step_many per tick
+        :param s_0: (B,) initial speeds
+        :param u: (B, T) inputs
+        :return: (B, T) speeds
+        """
+        u = np.asarray(u, dtype=np.float64)
+        s = np.zeros_like(u)
+        s[:, 0] = s_0
+        with self.exported_weights():
+            for i in range(1, u.shape[1]):
+                s[:, i] = self.step_many(u[:, i - 1], s[:, i - 1] / MOTOR_SPEED_SCALING)
+        return s
+
 
 class PlateauPhy(Plateau):
 
@@ -38,6 +70,9 @@ class PlateauPhy(Plateau):
     def step(self, u: float, s: float) -> float:
         return self.u_coef * u + self.s_coef / self.speed_scaling * s
 
+    def step_many(self, u: np.ndarray, s: np.ndarray) -> np.ndarray:
+        return self.u_coef * np.asarray(u) + self.s_coef / self.speed_scaling * np.asarray(s)
+
 
 class PlateauNet1Hidden(Plateau):
     def __init__(self, n_inputs: int, n_hidden_1: int, n_output: int):
@@ -51,6 +86,12 @@ class PlateauNet1Hidden(Plateau):
         x = self.predict(x)
         return x * 10
 
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        x = np.maximum(numpy_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']), 0.)
+        x = numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x * 10
+
 
 class PlateauNet2Hidden(Plateau):
     def __init__(self, n_inputs: int, n_hidden_1: int, n_hidden_2: int, n_output: int):
@@ -66,8 +107,22 @@ class PlateauNet2Hidden(Plateau):
         x = self.predict(x)
         return x * 10
 
+    @staticmethod
+    def numpy_forward(weights: Dict[str, np.ndarray], x: np.ndarray) -> np.ndarray:
+        x = np.maximum(numpy_linear(x, weights['hidden_1.weight'], weights['hidden_1.bias']), 0.)
+        x = np.maximum(numpy_linear(x, weights['hidden_2.weight'], weights['hidden_2.bias']), 0.)
+        x = numpy_linear(x, weights['predict.weight'], weights['predict.bias'])
+        return x * 10
+
 
-def train_plateau_model(model: torch.nn.Module, x: Variable, y: Variable, n_epoch: int = 200) -> torch.nn.Module:
+def train_plateau_model(model: torch.nn.Module, x: Variable, y: Variable, n_epoch: int = 200,
+                        batch_size: int = None, **kwargs) -> torch.nn.Module:
+    """
+    Full-batch SGD, or the mini-batch training with early stopping of model_training.train_model if batch_size is
+    given (kwargs: optimizer, lr, patience, checkpoint_path...)
+    """
+    if batch_size is not None:
+        return train_model(model, x, y, n_epoch=n_epoch, batch_size=batch_size, **kwargs)[0]
     optimizer = torch.optim.SGD(model.parameters(), lr=0.000001, momentum=0.5)
     loss_func = torch.nn.MSELoss()
 
@@ -12,4 +12,5 @@ class Pid:
         self.b: float = data['bias']
 
     def step(self, error: np.ndarray) -> float:
-        return np.dot(self.w, error) + self.b
+        # Explicit sum (no BLAS dot) so the batched simulation reproduces it bit for bit
+        return self.w[0] * error[0] + self.w[1] * error[1] + self.w[2] * error[2] + self.b
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Dict, Tuple
 
 import torch
 import numpy as np
@@ -92,6 +92,40 @@ class ModelEvaluator:
 
         return trajectory, error, u, loss(error)
 
+    def phy_simulate_population(self, model: MotorController, weights: Dict[str, torch.Tensor]) -> Tuple[
+            ndarray, ndarray, ndarray, ndarray]:
+        """
+        phy_simulate of P controllers at once, one batched forward per time step
+        :param model: Controller type of the population
+        :param weights: Stacked state dicts, see fitness.population_weights_as_dict
+        :return: trajectory, error and u, (P, T), and the losses, (P,)
+        """
+        n_controllers: int = next(iter(weights.values())).shape[0]
+        motor: PlateauPhy = self.phy_model.motor
+        trajectory = np.zeros((n_controllers, len(self.target_trajectory)))
+        error = np.zeros_like(trajectory)
+        u = np.zeros_like(trajectory)
+        error[:, 0] = self.target_trajectory[0]
+        integral: ndarray = error[:, 0] * self.dt
+        angle: ndarray = np.zeros(n_controllers)
+        speed: ndarray = np.zeros(n_controllers)
+
+        for i in range(1, len(self.target_trajectory)):
+            trajectory[:, i] = angle
+            error[:, i] = self.target_trajectory[i] - angle
+            d_error: ndarray = (error[:, i] - error[:, i - 1]) / self.dt
+            integral += error[:, i] * self.dt
+
+            u[:, i] = model.population_step(weights, error[:, i], d_error, integral)
+            speed = motor.step(u[:, i], speed)
+            angle = np.clip(angle + speed * self.dt, -180., 180.)
+
+        return trajectory, error, u, - np.sqrt(np.mean(np.power(error, 2), axis=1))
+
     def evaluate(self, model: MotorController) -> float:
         _, _, _, loss = self.phy_simulate(model)
         return loss
+
+    def evaluate_population(self, model: MotorController, weights: Dict[str, torch.Tensor]) -> ndarray:
+        _, _, _, losses = self.phy_simulate_population(model, weights)
+        return losses
@@ -0,0 +1,341 @@
+"""
+Throughput benchmarks of the simulators, environements, evaluators, GA fitness and actors. Every benchmark reports
+its rate (steps, rollouts or candidates per second, best of the repeats) and the peak memory traced while it runs.
+The results are saved in a JSON file keyed by commit (in src/data/results, not versioned), and compared with a
+baseline commit: a tracked metric worse than the baseline by more than the threshold is a regression.
+
+    python -m src.perf_benchmark --save
+    python -m src.perf_benchmark --baseline 1a2b3c4 --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import torch
+
+from .constants import DT, MAX_ANGLE, MAX_X
+
+# Generated results, gitignored directory
+RESULTS_PATH: str = 'src/data/results/perf_results.json'
+# Tracked metric -> 1 if higher is better, -1 if lower is better
+TRACKED_METRICS: Dict[str, int] = {'rate': 1, 'alloc_peak_kib': -1}
+# Memory differences below this size are noise, never regressions
+ALLOC_SLACK_KIB: float = 64.
+
+
+def test_trajectory(length: int) -> np.ndarray:
+    """
+    (2, length) smooth target trajectory
+    """
+    t = np.arange(length) * DT
+    return 0.5 * MAX_X * np.array([np.sin(0.5 * t), np.cos(0.3 * t)])
+
+
+# Benchmarks: setup(scale) -> (run, number of units done by run, unit)
+def bench_motor_step(scale: float) -> Tuple[Callable, int, str]:
+    from .motor_simulation.simulation import MotorSimulation
+    motor = MotorSimulation()
+    n = int(20000 * scale)
+    inputs = np.random.default_rng(0).uniform(-1., 1., n).tolist()
+
+    def run():
+        motor.reset_motor()
+        for u in inputs:
+            motor.step(u)
+
+    return run, n, 'steps'
+
+
+def bench_ball_step(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_simulation.simulation import BallSimulation
+    ball = BallSimulation()
+    n = int(20000 * scale)
+    angles = np.random.default_rng(0).uniform(-MAX_ANGLE, MAX_ANGLE, (n, 2)).tolist()
+
+    def run():
+        ball.reset_ball()
+        for angle_x, angle_y in angles:
+            ball.step(angle_x, angle_y)
+
+    return run, n, 'steps'
+
+
+def bench_step_bb(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_balancer.simulation import BbSimulation
+    sim = BbSimulation()
+    n = int(10000 * scale)
+    targets = np.random.default_rng(0).uniform(-MAX_ANGLE, MAX_ANGLE, (n, 2))
+
+    def run():
+        sim.reset_bb()
+        for target in targets:
+            sim.step_bb(target)
+
+    return run, n, 'steps'
+
+
+def env_steps(env, n: int, action_sampler: Callable) -> Callable:
+    actions = [action_sampler() for _ in range(n)]
+
+    def run():
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+
+    return run
+
+
+def bench_bbenv_step(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_balancer.environement import BBEnv
+    env = BBEnv()
+    env.action_space.seed(0)
+    n = int(5000 * scale)
+    return env_steps(env, n, env.action_space.sample), n, 'steps'
+
+
+def bench_bbenv_reset(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_balancer.environement import BBEnv
+    env = BBEnv()
+    n = int(2000 * scale)
+
+    def run():
+        for _ in range(n):
+            env.reset()
+
+    return run, n, 'resets'
+
+
+def bench_bbenv_pid_step(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_balancer.environement import BBEnvPid
+    env = BBEnvPid()
+    env.action_space.seed(0)
+    n = int(5000 * scale)
+    return env_steps(env, n, env.action_space.sample), n, 'steps'
+
+
+def bench_benchmark_evaluate(scale: float) -> Tuple[Callable, int, str]:
+    from .ball_balancer.environement import BenchmarkEvaluator
+    from .DDPG.controllers import PidController
+    length = int(2000 * scale)
+    evaluator = BenchmarkEvaluator(test_trajectory(length))
+    model = PidController(3, 1)
+    model.predict.weight.data = torch.tensor([[-0.8, -0.3, -0.1]])
+    model.inference_mode()
+    return lambda: evaluator.evaluate(model), length, 'steps'
+
+
+def bench_phy_simulate(scale: float) -> Tuple[Callable, int, str]:
+    from .motor_simulation.neural_net_controller import PidController
+    from .motor_simulation.simulation import ModelEvaluator
+    length = int(5000 * scale)
+    evaluator = ModelEvaluator(20. * np.sin(np.arange(length) * DT))
+    model = PidController(3, 1)
+    model.inference_mode()
+    return lambda: evaluator.phy_simulate(model), length, 'steps'
+
+
+def bench_ga_generation(scale: float) -> Tuple[Callable, int, str]:
+    from pygad import torchga
+    from .ball_simulation.ball_position_control_benchmark import fitness_fn_generator
+    from .DDPG.controllers import PidController
+    model = PidController(3, 1)
+    fitness_func = fitness_fn_generator(model, test_trajectory(1000), seed=0)
+    population = int(max(1, 20 * scale))
+    solutions = torchga.TorchGA(model=model, num_solutions=population).population_weights
+
+    def run():
+        for i, solution in enumerate(solutions):
+            fitness_func(solution, i)
+
+    return run, population, 'candidates'
+
+
+def actor() -> torch.nn.Module:
+    from .DDPG.controllers import BlackBoxActor
+    torch.manual_seed(0)
+    return BlackBoxActor(6, 2, (400, 200), torch.nn.Sigmoid, 1.)
+
+
+def bench_actor_torch(scale: float) -> Tuple[Callable, int, str]:
+    model = actor()
+    n = int(2000 * scale)
+    obs = torch.rand(6)
+
+    def run():
+        with torch.no_grad():
+            for _ in range(n):
+                model.act(obs)
+
+    return run, n, 'steps'
+
+
+def bench_actor_numpy(scale: float) -> Tuple[Callable, int, str]:
+    from .DDPG.quantization import QuantizedActor
+    model = QuantizedActor.from_actor(actor(), 'float32')
+    n = int(2000 * scale)
+    obs = np.random.default_rng(0).uniform(-1., 1., 6).astype(np.float32)
+
+    def run():
+        for _ in range(n):
+            model.act(obs)
+
+    return run, n, 'steps'
+
+
+BENCHMARKS: Dict[str, Callable[[float], Tuple[Callable, int, str]]] = {
+    'motor_simulation_step': bench_motor_step,
+    'ball_simulation_step': bench_ball_step,
+    'bb_simulation_step_bb': bench_step_bb,
+    'bbenv_step': bench_bbenv_step,
+    'bbenv_reset': bench_bbenv_reset,
+    'bbenv_pid_step': bench_bbenv_pid_step,
+    'benchmark_evaluator_evaluate': bench_benchmark_evaluate,
+    'model_evaluator_phy_simulate': bench_phy_simulate,
+    'ga_generation': bench_ga_generation,
+    'actor_inference_torch': bench_actor_torch,
+    'actor_inference_numpy': bench_actor_numpy,
+}
+
+
+def measure(setup: Callable[[float], Tuple[Callable, int, str]], scale: float = 1., repeats: int = 3) -> dict:
+    """
+    :return: rate (units per second, best repeat), unit, n, seconds, alloc_peak_kib (peak traced memory of one run)
+    """
+    np.random.seed(0)
+    run, n, unit = setup(scale)
+    run()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    # Separate run, tracemalloc slows the allocations down
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'rate': n / min(durations), 'unit': unit, 'n': n, 'scale': scale, 'seconds': min(durations),
+            'alloc_peak_kib': peak / 1024.}
+
+
+def run_suite(names: List[str] = None, scale: float = 1., repeats: int = 3, verbose: bool = True) -> Dict[str, dict]:
+    """
+    :param names: Keys of BENCHMARKS, all of them if None
+    :param scale: Factor of the number of steps of every benchmark
+    :return: Measure of every benchmark, or its error
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        try:
+            results[name] = measure(BENCHMARKS[name], scale, repeats)
+        except Exception as exception:
+            message = str(exception).strip().splitlines()
+            results[name] = {'error': '{}: {}'.format(type(exception).__name__, message[0] if message else '')}
+        if verbose:
+            result = results[name]
+            print('{:<30} {}'.format(name, result['error'] if 'error' in result else
+                                     '{:>12.1f} {}/s {:>10.1f} KiB'.format(result['rate'], result['unit'],
+                                                                            result['alloc_peak_kib'])))
+    return results
+
+
+def git_commit() -> str:
+    """
+    Short hash of HEAD, suffixed with -dirty when the tree has changes
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if dirty else commit
+
+
+def load_results(path: str = RESULTS_PATH) -> Dict[str, dict]:
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_results(results: Dict[str, dict], commit: str, path: str = RESULTS_PATH) -> Dict[str, dict]:
+    """
+    Store the results of the commit, replacing its previous entry
+    """
+    history = load_results(path)
+    history.pop(commit, None)
+    history[commit] = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'numpy': np.__version__, 'torch': torch.__version__, 'machine': platform.machine(),
+                       'results': results}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as json_file:
+        json.dump(history, json_file, indent=1)
+    return history
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.1) -> List[str]:
+    """
+    :param threshold: Largest relative degradation of a tracked metric
+    :return: Description of the regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        if result.get('scale') != reference.get('scale'):
+            # The traced memory grows with the number of steps
+            continue
+        for metric, direction in TRACKED_METRICS.items():
+            if metric not in result or metric not in reference:
+                continue
+            change = direction * (result[metric] - reference[metric]) / max(abs(reference[metric]), 1e-12)
+            if metric == 'alloc_peak_kib' and abs(result[metric] - reference[metric]) < ALLOC_SLACK_KIB:
+                continue
+            if change < - threshold:
+                regressions.append('{} {}: {:.4g} -> {:.4g} ({:+.1%})'.format(
+                    name, metric, reference[metric], result[metric], direction * change))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Performance benchmarks')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run, all by default')
+    parser.add_argument('--scale', type=float, default=1., help='Factor of the number of steps')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save', action='store_true', help='Store the results of the current commit')
+    parser.add_argument('--baseline', default=None, help='Commit compared with, the last other stored one by default')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Largest relative degradation')
+    parser.add_argument('--results', default=RESULTS_PATH, help='JSON file of the stored results')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run_suite(args.names or None, args.scale, args.repeats)
+    history = load_results(args.results)
+    baseline_commit = args.baseline or next((key for key in reversed(list(history)) if key != commit), None)
+    if args.save:
+        save_results(results, commit, args.results)
+    if baseline_commit is None:
+        print('No baseline')
+        return 0
+    if baseline_commit not in history:
+        print('Unknown baseline', baseline_commit)
+        return 2
+    regressions = compare(results, history[baseline_commit]['results'], args.threshold)
+    print('Baseline', baseline_commit)
+    for regression in regressions:
+        print('Regression', regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
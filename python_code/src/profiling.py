@@ -0,0 +1,230 @@
+"""
+Opt-in per-phase timers of the hot paths: physics (step_bb), observation filtering (observe), reward, actor forward,
+load_state_dict of the GA fitness functions, pygad bookkeeping... Nothing is patched process wide: the trainers wrap
+their own call sites (wrap, wrap_fitness, phase) and instrumented wraps the methods of given instances only, for the
+duration of a with block. Other instances, the classes and the code run without a profiler are left untouched.
+
+    profiler = Profiler(trace=True)
+    env = BBEnv()
+    with profiler, profiler.instrumented(env, ENV_PHASES):
+        env.simulate(model, target_trajectory)
+    print(profiler.report())
+    profiler.export_chrome_trace('trace.json')  # chrome://tracing or https://ui.perfetto.dev
+    profiler.export_folded('stacks.txt')  # flamegraph.pl stacks.txt > flamegraph.svg
+
+The phases nest, a phase time includes its children and its self time excludes them (the self time of ga_run is the
+pygad bookkeeping: selection, crossover, mutation, callbacks). A phase called inside itself (act calling forward) is
+timed once. Only this process is timed, not the workers of a process pool.
+"""
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Methods (or callables stored on the instance) -> phase, for instrumented
+ENV_PHASES: Dict[str, str] = {'step_bb': 'physics', 'observe': 'observe', 'reward': 'reward', 'step': 'env_step',
+                              'reset': 'env_reset', 'genetic_reset': 'env_reset', 'evaluate': 'evaluate'}
+MODEL_PHASES: Dict[str, str] = {'step': 'actor', 'step_many': 'actor', 'act': 'actor', 'population_act': 'actor',
+                                'forward': 'actor', 'load_state_dict': 'load_state_dict'}
+GA_PHASES: Dict[str, str] = {'cal_pop_fitness': 'ga_fitness', 'best_solution': 'ga_best_solution'}
+
+
+class Profiler:
+    """
+    Calls, total and self times of the phases, counters, and with trace the timed calls for the trace export
+    """
+
+    def __init__(self, trace: bool = False, max_events: int = 1000000):
+        """
+        :param trace: Keep every timed call (name, start, duration) for export_chrome_trace
+        :param max_events: Largest number of kept calls, the next ones are only summed
+        """
+        self.trace: bool = trace
+        self.max_events: int = max_events
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.total_ns: Dict[str, int] = defaultdict(int)
+        self.self_ns: Dict[str, int] = defaultdict(int)
+        self.stacks_ns: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.events: List[Tuple[str, int, int, int]] = []
+        self.wall_ns: int = 0
+        self.origin_ns: Optional[int] = None
+        self._enabled_at: Optional[int] = None
+        self._depth: int = 0
+        # Open phases: [phase, start, children time]
+        self._stack: List[list] = []
+
+    # Timers
+    def _close(self, frame: list, end: int):
+        stack = self._stack
+        stack.pop()
+        phase, start, children_ns = frame
+        duration = end - start
+        if stack:
+            stack[-1][2] += duration
+        self.calls[phase] += 1
+        self.total_ns[phase] += duration
+        self.self_ns[phase] += duration - children_ns
+        self.stacks_ns[tuple(open_frame[0] for open_frame in stack) + (phase,)] += duration - children_ns
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((phase, start, duration, len(stack)))
+
+    def wrap(self, fn: Callable, phase: str) -> Callable:
+        """
+        fn timed as phase, whether the profiler is enabled or not
+        """
+        stack = self._stack
+        clock = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            if stack and stack[-1][0] == phase:
+                return fn(*args, **kwargs)
+            frame = [phase, clock(), 0]
+            stack.append(frame)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._close(frame, clock())
+
+        return profiled
+
+    def wrap_fitness(self, fitness_func: Callable, phase: str = 'fitness') -> Callable:
+        """
+        Fitness function timed as phase, with the two arguments pygad checks (single or batch fitness function)
+        """
+        profiled = self.wrap(fitness_func, phase)
+
+        def profiled_fitness_func(solution, sol_idx):
+            return profiled(solution, sol_idx)
+
+        return profiled_fitness_func
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a block of code as the phase name
+        """
+        frame = [name, time.perf_counter_ns(), 0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._close(frame, time.perf_counter_ns())
+
+    def count(self, name: str, value: float = 1.):
+        self.counters[name] += value
+
+    # Instrumentation
+    @contextmanager
+    def instrumented(self, obj, phases: Dict[str, str]):
+        """
+        Time the methods of obj, and only of this instance, for the duration of the block. The wrappers are stored
+        in the instance dict and removed on exit, exception included. The attributes obj does not have are skipped.
+        Do not instrument an object pickled inside the block (checkpointed environement, saved model).
+        :param phases: Method name -> phase, ENV_PHASES, MODEL_PHASES, GA_PHASES...
+        """
+        missing = object()
+        patches: List[Tuple[str, object]] = []
+        try:
+            for attribute, phase in phases.items():
+                original = getattr(obj, attribute, None)
+                if not callable(original):
+                    continue
+                patches.append((attribute, obj.__dict__.get(attribute, missing)))
+                setattr(obj, attribute, self.wrap(original, phase))
+            yield obj
+        finally:
+            # Nested instrumentations of the same instance restore the wrappers of the outer ones
+            for attribute, previous in reversed(patches):
+                if previous is missing:
+                    delattr(obj, attribute)
+                else:
+                    setattr(obj, attribute, previous)
+
+    def enable(self) -> 'Profiler':
+        """
+        Start the wall clock of the profiled time, the nested enables are counted
+        """
+        self._depth += 1
+        if self._depth == 1:
+            self._enabled_at = time.perf_counter_ns()
+            if self.origin_ns is None:
+                self.origin_ns = self._enabled_at
+        return self
+
+    def disable(self):
+        """
+        Stop the wall clock at the exit of the outermost enable, the timings are kept
+        """
+        if self._depth == 0:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            self.wall_ns += time.perf_counter_ns() - self._enabled_at
+            self._enabled_at = None
+
+    def __enter__(self) -> 'Profiler':
+        return self.enable()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disable()
+
+    # Outputs
+    def elapsed_ns(self) -> int:
+        return self.wall_ns + (0 if self._enabled_at is None else time.perf_counter_ns() - self._enabled_at)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return: Per phase, largest self time first: calls, total_ms, self_ms, mean_us (total per call) and
+                 self_share (of the profiled wall time). The untracked row is the time spent outside every phase.
+        """
+        wall_ns = max(self.elapsed_ns(), 1)
+        rows = {phase: {'calls': self.calls[phase], 'total_ms': self.total_ns[phase] / 1e6,
+                        'self_ms': self.self_ns[phase] / 1e6,
+                        'mean_us': self.total_ns[phase] / 1e3 / self.calls[phase]} for phase in self.calls}
+        # The self times partition the time spent in the phases
+        untracked_ns = max(wall_ns - sum(self.stacks_ns.values()), 0)
+        summary = pd.DataFrame.from_dict(rows, orient='index', columns=['calls', 'total_ms', 'self_ms', 'mean_us'])
+        summary = summary.sort_values('self_ms', ascending=False)
+        summary.loc['untracked'] = [0, untracked_ns / 1e6, untracked_ns / 1e6, float('nan')]
+        summary['self_share'] = summary['self_ms'] * 1e6 / wall_ns
+        summary['calls'] = summary['calls'].astype(int)
+        summary.index.name = 'phase'
+        return summary
+
+    def report(self) -> str:
+        lines = ['Profiled {:.3f} s'.format(self.elapsed_ns() / 1e9), self.summary().to_string(float_format='{:.3f}'
+                                                                                               .format)]
+        if self.counters:
+            lines.append(', '.join('{}: {:g}'.format(name, value) for name, value in self.counters.items()))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path: str) -> str:
+        """
+        Trace Event Format JSON of the timed calls (requires trace=True), opened by chrome://tracing and Perfetto
+        """
+        origin = self.origin_ns or 0
+        pid = os.getpid()
+        events = [{'name': phase, 'cat': 'phase', 'ph': 'X', 'ts': (start - origin) / 1e3, 'dur': duration / 1e3,
+                   'pid': pid, 'tid': 0} for phase, start, duration, _ in self.events]
+        events += [{'name': name, 'ph': 'C', 'ts': self.elapsed_ns() / 1e3, 'pid': pid, 'tid': 0,
+                    'args': {name: value}} for name, value in self.counters.items()]
+        with open(path, 'w') as json_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, json_file)
+        return path
+
+    def export_folded(self, path: str) -> str:
+        """
+        Folded stacks (phase;child self_time_us per line) of flamegraph.pl, inferno and speedscope
+        """
+        with open(path, 'w') as folded_file:
+            for stack, duration in sorted(self.stacks_ns.items()):
+                folded_file.write('{} {}\n'.format(';'.join(stack), int(round(duration / 1e3))))
+        return path
+
@@ -0,0 +1,201 @@
+"""
+Columnar cache of the CSV recordings of src/data (train, test and real_system_test). Every recording is parsed once
+and saved with its derived columns as a .npz in the cache directory, in the user cache by default (outside of the
+source tree). A manifest.json keeps the modification time, size and hash of the sources: a recording is parsed again
+only when its file changed.
+"""
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .constants import DT, MOTOR_SPEED_SCALING
+
+# Version of the derived columns, the cache entries of another version are rebuilt
+DERIVED_VERSION: int = 1
+# Span of the ball position filters (lag of ball_simulation_final)
+BALL_FILTER_LAG: int = 2
+SIN_ANGLE_SCALING: float = 7.
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_cache_dir(data_dir: str) -> str:
+    """
+    Cache directory of the recordings of data_dir in the user cache ($XDG_CACHE_HOME or ~/.cache), one per data_dir
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(os.path.abspath(data_dir).encode()).hexdigest()[:12]
+    return os.path.join(root, 'ball_balancer', 'recordings', digest)
+
+
+def derive_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Derived columns of the identification notebooks, the rows are kept (NaN where a column is not defined)
+    Identification recordings (x, y, angle_*, input_*):
+        d_angle_*: motor speed, next_d_angle_*: next motor speed (target of the plateau models)
+        sin_angle_*, smoothed_*, d_smoothed_*, dema_*, d_*: filtered ball position and speed, tl, tr, bl, br:
+        quadrant of the ball, d_target_*: next ball speed change (target of the ball models)
+    Real system recordings (target_*, ball_*, ...):
+        x_error, y_error: ball error
+    """
+    data = data.copy()
+    if 'angle_x' in data and 'input_x' in data:
+        for axis in ('x', 'y'):
+            data['d_angle_' + axis] = (data['angle_' + axis] - data['angle_' + axis].shift(1)) / DT
+            data['next_d_angle_' + axis] = data['d_angle_' + axis].shift(-1)
+    if 'x' in data and 'angle_x' in data:
+        lag = BALL_FILTER_LAG
+        for axis in ('x', 'y'):
+            data['sin_angle_' + axis] = np.sin(data['angle_' + axis] * np.pi / 180.)
+            data['smoothed_' + axis] = data[axis].ewm(span=lag).mean()
+            data['d_smoothed_' + axis] = data['smoothed_' + axis].ewm(span=lag).mean()
+            data['dema_' + axis] = (2. * data['d_smoothed_' + axis]) - data['d_smoothed_' + axis]
+            data['d_' + axis] = ((data['dema_' + axis] - data['dema_' + axis].shift(1)) / DT).rolling(
+                window=lag).mean().shift(-lag)
+            data['d_target_' + axis] = data['d_' + axis].shift(-1) - data['d_' + axis]
+        data['tl'] = np.where((data['x'] < 0.) & (data['y'] > 0.), 1., 0.)
+        data['br'] = np.where((data['x'] > 0.) & (data['y'] < 0.), 1., 0.)
+        data['bl'] = np.where((data['x'] < 0.) & (data['y'] < 0.), 1., 0.)
+        data['tr'] = np.where((data['x'] > 0.) & (data['y'] > 0.), 1., 0.)
+    if 'ball_x' in data and 'target_x' in data:
+        data['x_error'] = data['ball_x'] - data['target_x']
+        data['y_error'] = data['ball_y'] - data['target_y']
+    return data
+
+
+class RecordingCache:
+    """
+    Recordings of data_dir as dicts of float64 columns, read from the cache when their CSV did not change
+    """
+
+    def __init__(self, data_dir: str = 'src/data', cache_dir: str = None):
+        """
+        :param data_dir: Root of the recordings, the paths are relative to it
+        :param cache_dir: Directory of the .npz and of the manifest, default_cache_dir(data_dir) by default
+        """
+        self.data_dir: str = data_dir
+        self.cache_dir: str = cache_dir or default_cache_dir(data_dir)
+        self.manifest_path: str = os.path.join(self.cache_dir, 'manifest.json')
+        self.manifest: Dict[str, dict] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as json_file:
+                self.manifest = json.load(json_file)
+
+        # Statistics
+        self.n_parsed: int = 0
+        self.n_cached: int = 0
+
+    def cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name.replace('/', '__').replace('\\', '__') + '.npz')
+
+    def save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.manifest_path + '.tmp', 'w') as json_file:
+            json.dump(self.manifest, json_file, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def is_valid(self, name: str, path: str) -> bool:
+        """
+        Cache entry up to date: same modification time and size, or same hash (the mtime is then refreshed)
+        """
+        entry = self.manifest.get(name)
+        if entry is None or entry['version'] != DERIVED_VERSION or not os.path.exists(self.cache_path(name)):
+            return False
+        stat = os.stat(path)
+        if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return True
+        if entry['size'] == stat.st_size and entry['sha1'] == file_hash(path):
+            entry['mtime'] = stat.st_mtime
+            self.save_manifest()
+            return True
+        return False
+
+    def load(self, name: str) -> Dict[str, np.ndarray]:
+        """
+        :param name: Path of the CSV relative to data_dir, 'train/ball1.csv'
+        :return: Raw and derived columns, (n_rows,) float64 arrays
+        """
+        path = os.path.join(self.data_dir, name)
+        if self.is_valid(name, path):
+            self.n_cached += 1
+            with np.load(self.cache_path(name)) as data:
+                return {column: data[column] for column in data.files}
+
+        self.n_parsed += 1
+        data = derive_columns(pd.read_csv(path, dtype=np.float64))
+        columns = {column: data[column].to_numpy(dtype=np.float64) for column in data.columns}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(self.cache_path(name), **columns)
+        stat = os.stat(path)
+        self.manifest[name] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': file_hash(path),
+                               'version': DERIVED_VERSION, 'rows': len(data), 'columns': list(columns)}
+        self.save_manifest()
+        return columns
+
+    def names(self, pattern: str) -> List[str]:
+        """
+        :param pattern: Glob relative to data_dir, 'train/ball*.csv'
+        :return: Sorted relative paths
+        """
+        paths = glob.glob(os.path.join(self.data_dir, pattern))
+        return sorted(os.path.relpath(path, self.data_dir).replace(os.sep, '/') for path in paths)
+
+    def load_all(self, pattern: str) -> Dict[str, Dict[str, np.ndarray]]:
+        return {name: self.load(name) for name in self.names(pattern)}
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """
+        Cached recording as a DataFrame, for the notebooks
+        """
+        return pd.DataFrame(self.load(name))
+
+
+def valid_rows(recording: Dict[str, np.ndarray], columns: List[str]) -> np.ndarray:
+    """
+    :return: Mask of the rows where all the columns are defined (dropna of the notebooks)
+    """
+    return np.all([np.isfinite(recording[column]) for column in columns], axis=0)
+
+
+def plateau_training_data(recordings: List[Dict[str, np.ndarray]]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Inputs ([input, scaled speed]) and targets (next speed) of train_plateau_model, x and y axes stacked
+    """
+    x, y = [], []
+    for recording in recordings:
+        columns = ['input_x', 'd_angle_x', 'next_d_angle_x', 'input_y', 'd_angle_y', 'next_d_angle_y']
+        mask = valid_rows(recording, columns)
+        for axis in ('x', 'y'):
+            x.append(np.stack([recording['input_' + axis][mask],
+                               recording['d_angle_' + axis][mask] / MOTOR_SPEED_SCALING], axis=1))
+            y.append(recording['next_d_angle_' + axis][mask, None])
+    return torch.as_tensor(np.concatenate(x), dtype=torch.float32), torch.as_tensor(np.concatenate(y),
+                                                                                    dtype=torch.float32)
+
+
+def ball_training_data(recordings: List[Dict[str, np.ndarray]]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Inputs ([tr, tl, br, bl, d_x, d_y, scaled sin angles]) and targets (next speed changes) of train_ball_model
+    """
+    inputs = ['tr', 'tl', 'br', 'bl', 'd_x', 'd_y', 'sin_angle_x', 'sin_angle_y']
+    targets = ['d_target_x', 'd_target_y']
+    x, y = [], []
+    for recording in recordings:
+        mask = valid_rows(recording, inputs + targets)
+        x.append(np.stack([recording[column][mask] for column in inputs], axis=1))
+        y.append(np.stack([recording[column][mask] for column in targets], axis=1))
+    x = np.concatenate(x)
+    x[:, 6:8] *= SIN_ANGLE_SCALING
+    return torch.as_tensor(x, dtype=torch.float32), torch.as_tensor(np.concatenate(y), dtype=torch.float32)
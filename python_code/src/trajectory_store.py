@@ -0,0 +1,119 @@
+"""
+Binary storage of simulated / measured runs (t, target, trajectory, error, u, angle, pid gains...) replacing the
+nested JSON lists of src/data/*_trajectory.json. A run is a dict of arrays and a metadata dict, stored as:
+    - a compressed .npz, the metadata being a JSON header inside the archive
+    - a bundle directory, one .npy per array (memory mappable) and a meta.json header
+The JSON files can still be read and written (load_json, export_json).
+"""
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+FORMAT_VERSION: int = 1
+METADATA_KEY: str = '__metadata__'
+
+
+def header(arrays: Dict[str, np.ndarray], metadata: dict = None) -> dict:
+    """
+    Metadata completed with the format version and the shape and dtype of every array
+    """
+    return dict(metadata or {}, format_version=FORMAT_VERSION,
+                arrays={name: {'shape': list(array.shape), 'dtype': str(array.dtype)} for name, array in arrays.items()})
+
+
+def as_arrays(arrays: Dict[str, object], dtype=None) -> Dict[str, np.ndarray]:
+    """
+    :param dtype: Cast of the floating point arrays (np.float32 halves the files), unchanged if None
+    """
+    arrays = {name: np.asarray(value) for name, value in arrays.items()}
+    if dtype is not None:
+        arrays = {name: array.astype(dtype) if np.issubdtype(array.dtype, np.floating) else array
+                  for name, array in arrays.items()}
+    return arrays
+
+
+# npz
+def save_npz(path: str, arrays: Dict[str, object], metadata: dict = None, dtype=None):
+    arrays = as_arrays(arrays, dtype)
+    if METADATA_KEY in arrays:
+        raise ValueError('{} is reserved for the metadata'.format(METADATA_KEY))
+    np.savez_compressed(path, **arrays, **{METADATA_KEY: np.array(json.dumps(header(arrays, metadata)))})
+
+
+def load_npz(path: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    :return: Arrays and metadata
+    """
+    with np.load(path) as data:
+        metadata = json.loads(str(data[METADATA_KEY])) if METADATA_KEY in data else {}
+        return {name: data[name] for name in data.files if name != METADATA_KEY}, metadata
+
+
+# Bundle of .npy
+def save_bundle(directory: str, arrays: Dict[str, object], metadata: dict = None, dtype=None):
+    arrays = as_arrays(arrays, dtype)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+    # Header written last, a bundle with a meta.json is complete
+    with open(os.path.join(directory, 'meta.json'), 'w') as json_file:
+        json.dump(header(arrays, metadata), json_file)
+
+
+def load_bundle(directory: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    :param mmap: Memory map the arrays (read only) instead of reading them
+    :return: Arrays and metadata
+    """
+    with open(os.path.join(directory, 'meta.json')) as json_file:
+        metadata = json.load(json_file)
+    arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None)
+              for name in metadata['arrays']}
+    return arrays, metadata
+
+
+# JSON compatibility
+def load_json(path: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Legacy JSON run, the keys are stripped (' trajectory' of the final_*_trajectory.json files)
+    :return: Arrays and an empty metadata
+    """
+    with open(path) as json_file:
+        data = json.load(json_file)
+    return {name.strip(): np.array(value) for name, value in data.items()}, {}
+
+
+def export_json(path: str, arrays: Dict[str, object]):
+    """
+    Run written as nested JSON lists, as the legacy files
+    """
+    with open(path, 'w') as json_file:
+        json.dump({name: np.asarray(value).tolist() for name, value in arrays.items()}, json_file)
+
+
+def load_run(path: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Run of a .npz, a bundle directory or a legacy .json
+    """
+    if os.path.isdir(path):
+        return load_bundle(path, mmap)
+    if path.endswith('.json'):
+        return load_json(path)
+    return load_npz(path)
+
+
+def load_runs(paths: List[str], mmap: bool = True) -> List[Tuple[Dict[str, np.ndarray], dict]]:
+    return [load_run(path, mmap) for path in paths]
+
+
+def convert_json(path: str, output_path: str = None, metadata: dict = None, dtype=None) -> str:
+    """
+    Convert a legacy JSON run to a .npz next to it
+    :return: Path of the .npz
+    """
+    output_path = output_path or os.path.splitext(path)[0] + '.npz'
+    arrays, _ = load_json(path)
+    save_npz(output_path, arrays, dict(metadata or {}, source=os.path.basename(path)), dtype)
+    return output_path
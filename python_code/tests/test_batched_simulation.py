@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.ball_balancer import BatchedBbSimulation, BbSimulation
+from src.constants import MAX_ANGLE
+
+N_ENVS = 5
+N_STEPS = 300
+
+
+def test_batched_simulation_matches_scalar_simulations():
+    rng = np.random.default_rng(0)
+    batched = BatchedBbSimulation(N_ENVS)
+    simulations = [BbSimulation() for _ in range(N_ENVS)]
+    x_0 = rng.uniform(-0.05, 0.05, (N_ENVS, 2))
+    batched.ball_x[:] = x_0
+    for simulation, x in zip(simulations, x_0):
+        simulation.ball.x = x.copy()
+
+    for _ in range(N_STEPS):
+        targets = rng.uniform(-MAX_ANGLE, MAX_ANGLE, (N_ENVS, 2))
+        batched.step_bb(targets)
+        for simulation, target in zip(simulations, targets):
+            simulation.step_bb(target)
+        # Same operations in the same order: bit for bit
+        np.testing.assert_array_equal(batched.ball_x, [simulation.ball.x for simulation in simulations])
+        np.testing.assert_array_equal(batched.ball_d_x, [simulation.ball.d_x for simulation in simulations])
+        np.testing.assert_array_equal(batched.motor_angle, [[simulation.motor_x.angle, simulation.motor_y.angle]
+                                                            for simulation in simulations])
+        np.testing.assert_array_equal(batched.i_error, [simulation.i_error for simulation in simulations])
+
+
+def test_reset_mask_only_resets_the_selected_systems():
+    batched = BatchedBbSimulation(N_ENVS)
+    for _ in range(10):
+        batched.step_bb(np.array([MAX_ANGLE, -MAX_ANGLE]))
+    mask = np.arange(N_ENVS) % 2 == 0
+    batched.reset_bb(mask)
+    assert not batched.motor_angle[mask].any() and not batched.ball_x[mask].any()
+    assert batched.motor_angle[~mask].all()
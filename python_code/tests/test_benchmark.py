@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import torch
+
+from src.DDPG.benchmark import run_benchmark
+from src.DDPG.controllers import BlackBoxActor
+from src.constants import DT
+
+N_STEPS = 50
+
+
+def save_actor(root, name: str, gain: float):
+    torch.manual_seed(0)
+    actor = BlackBoxActor(6, 2, (4,), torch.nn.ReLU, gain)
+    path = root / 'black_box_controller' / 'e_r' / name / 'pyt_save'
+    path.mkdir(parents=True)
+    torch.save(actor, str(path / 'model.pt'))
+
+
+def test_benchmark_table(tmp_path):
+    root = tmp_path / 'data'
+    save_actor(root, 'still', 0.)
+    save_actor(root, 'moving', 1.)
+    broken = root / 'black_box_controller' / 'e_r' / 'broken' / 'pyt_save'
+    broken.mkdir(parents=True)
+    (broken / 'model.pt').write_text('not a model')
+    # Not a controller directory
+    save_actor(root / 'other', 'ignored', 1.)
+    t = np.arange(N_STEPS) * DT
+    trajectories = 0.02 * np.array([[np.sin(t), np.cos(t)], [np.cos(t), np.sin(2. * t)]])
+    output_path = str(tmp_path / 'results' / 'benchmark.csv')
+
+    table = run_benchmark(str(root), trajectories=trajectories, output_path=output_path)
+    assert len(table) == 3 and os.path.exists(output_path)
+    assert table['path'].str.contains('ignored').sum() == 0
+    # Ranked by loss, the run that could not be loaded last with its error
+    assert table['loss'].iloc[0] >= table['loss'].iloc[1]
+    assert table['error'].notna().tolist() == [False, False, True]
+    assert (table['group'] == 'black_box_controller/e_r').all()
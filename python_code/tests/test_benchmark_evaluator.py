@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import torch
+
+from src.ball_balancer import BenchmarkEvaluator
+from src.ball_balancer.environement import BATCHED_REWARDS, benchmark_rewards
+from src.DDPG import PidController
+from src.constants import DT, MAX_X
+
+SEEDS = (0, 1, 2)
+
+
+def target_trajectory(length: int = 300) -> np.ndarray:
+    t = np.arange(length) * DT
+    return 0.5 * MAX_X * np.array([np.sin(0.5 * t), np.cos(0.3 * t)])
+
+
+def pid_controller(gains) -> PidController:
+    model = PidController(3, 1)
+    model.predict.weight.data = torch.tensor([gains], dtype=torch.float32)
+    # Numpy scalar steps of the GA fitness functions
+    model.inference_mode()
+    return model
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_simulate_linear_matches_simulate(seed):
+    evaluator = BenchmarkEvaluator(target_trajectory())
+    model = pid_controller([-0.8, -0.3, -0.1])
+
+    evaluator.seed(seed)
+    reference = evaluator.simulate(model)
+    evaluator.seed(seed)
+    fast = evaluator.simulate_linear(model.predict.weight.detach().numpy()[0])
+
+    for name, expected, value in zip(('trajectory', 'error', 'u', 'angle', 'loss'), reference, fast):
+        np.testing.assert_allclose(value, expected, rtol=1e-9, atol=1e-12, err_msg=name)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_fast_path_evaluate_matches_reference(seed):
+    model = pid_controller([-0.5, -0.2, -0.05])
+    losses = []
+    for fast_path in (False, True):
+        evaluator = BenchmarkEvaluator(target_trajectory(), fast_path)
+        evaluator.seed(seed)
+        losses.append(evaluator.evaluate(model))
+    assert losses[1] == pytest.approx(losses[0], rel=1e-9)
+
+
+def test_simulate_linear_population_matches_single():
+    evaluator = BenchmarkEvaluator(target_trajectory())
+    gains = np.random.default_rng(0).uniform(-1., 0., (4, 3))
+    evaluator.seed(0)
+    batched = evaluator.simulate_linear(gains)[4]
+    singles = []
+    for row in gains:
+        evaluator.seed(0)
+        singles.append(evaluator.simulate_linear(row)[4])
+    np.testing.assert_allclose(batched, singles, rtol=1e-12)
+
+
+def test_benchmark_rewards_batched_agree():
+    results = benchmark_rewards(1000)
+    assert set(results) == {reward_fn.__name__ for reward_fn in BATCHED_REWARDS}
+    for result in results.values():
+        assert result['max_error'] < 1e-9
+
+
+def test_simulate_linear_uses_the_gains_of_each_axis():
+    evaluator = BenchmarkEvaluator(target_trajectory())
+    evaluator.motor_pid_y.w = evaluator.motor_pid_y.w * 0.5
+    evaluator.motor_pid_y.b = evaluator.motor_pid_x.b + 0.1
+    model = pid_controller([-0.8, -0.3, -0.1])
+
+    evaluator.seed(0)
+    reference = evaluator.simulate(model)
+    evaluator.seed(0)
+    fast = evaluator.simulate_linear(model.predict.weight.detach().numpy()[0])
+    for name, expected, value in zip(('trajectory', 'error', 'u', 'angle', 'loss'), reference, fast):
+        np.testing.assert_allclose(value, expected, rtol=1e-9, atol=1e-12, err_msg=name)
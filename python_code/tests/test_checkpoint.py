@@ -0,0 +1,110 @@
+import random
+
+import numpy as np
+import pygad
+import pytest
+
+from src.ball_simulation import train_ball_controller_genetic
+from src.ball_balancer.environement import linear_e_reward
+from src.checkpoint import GACheckpointer, load_checkpoint
+from src.fitness import FitnessCache
+
+N_GENES = 6
+POPULATION = 8
+
+
+def fitness_func(solution, sol_idx) -> float:
+    return -float(np.sum((np.asarray(solution) - 0.5) ** 2))
+
+
+def run_ga(num_generations: int, initial_population: np.ndarray, checkpointer: GACheckpointer) -> pygad.GA:
+    ga_instance = pygad.GA(num_generations=num_generations,
+                           num_parents_mating=4,
+                           initial_population=initial_population,
+                           fitness_func=checkpointer.fitness_cache.wrap(fitness_func),
+                           parent_selection_type='sss',
+                           crossover_type='single_point',
+                           mutation_type='random',
+                           mutation_percent_genes=50,
+                           keep_parents=2,
+                           on_generation=checkpointer.on_generation,
+                           random_seed=0)
+    checkpointer.restore(ga_instance)
+    ga_instance.run()
+    return ga_instance
+
+
+def seed_everything():
+    np.random.seed(0)
+    random.seed(0)
+
+
+@pytest.fixture
+def initial_population() -> np.ndarray:
+    return np.random.default_rng(0).uniform(-2., 2., (POPULATION, N_GENES))
+
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path, initial_population):
+    seed_everything()
+    uninterrupted = run_ga(6, initial_population, GACheckpointer(str(tmp_path / 'full.pt'), 100, None,
+                                                                 FitnessCache(1024)))
+
+    path = str(tmp_path / 'run.pt')
+    seed_everything()
+    run_ga(3, initial_population, GACheckpointer(path, 3, None, FitnessCache(1024)))
+
+    checkpointer = GACheckpointer(path, 3, None, FitnessCache(1024))
+    checkpoint = checkpointer.resume()
+    assert checkpoint['generations_completed'] == 3
+    assert len(checkpointer.fitness_cache) > 0
+    resumed = run_ga(3, checkpoint['population'], checkpointer)
+
+    np.testing.assert_array_equal(resumed.population, uninterrupted.population)
+    # The restored history holds the generations before the interruption
+    np.testing.assert_array_equal(resumed.best_solutions_fitness, uninterrupted.best_solutions_fitness)
+    assert len(resumed.best_solutions_fitness) == 7
+
+
+def test_resumed_run_starts_from_the_cache(tmp_path, initial_population):
+    path = str(tmp_path / 'run.pt')
+    seed_everything()
+    run_ga(2, initial_population, GACheckpointer(path, 2, None, FitnessCache(1024)))
+
+    checkpointer = GACheckpointer(path, 2, None, FitnessCache(1024))
+    checkpoint = checkpointer.resume()
+    run_ga(1, checkpoint['population'], checkpointer)
+    # The checkpointed population is not evaluated again
+    assert checkpointer.fitness_cache.hits >= POPULATION
+
+
+def test_checkpointed_cache_is_bounded(tmp_path, initial_population):
+    path = str(tmp_path / 'run.pt')
+    seed_everything()
+    checkpointer = GACheckpointer(path, 1, None, FitnessCache(4))
+    run_ga(3, initial_population, checkpointer)
+    assert len(load_checkpoint(path)['fitness_cache']) == 4
+
+
+@pytest.mark.parametrize('seed', [None, 0])
+def test_genetic_trainer_only_caches_with_a_seed(tmp_path, seed):
+    path = str(tmp_path / 'genetic.pt')
+    train_ball_controller_genetic(2, linear_e_reward, 1., 1, 4, 2, 'sss', 'single_point', 'random', 10, 1, seed=seed,
+                                  population_batched=True, checkpoint_path=path)
+    fitness_cache = load_checkpoint(path)['fitness_cache']
+    if seed is None:
+        assert fitness_cache is None
+    else:
+        assert len(fitness_cache) > 0
+
+
+def test_resume_drops_the_cache_of_another_context(tmp_path, initial_population):
+    path = str(tmp_path / 'run.pt')
+    seed_everything()
+    run_ga(2, initial_population, GACheckpointer(path, 2, None, FitnessCache(1024, b'reward a')))
+
+    same = GACheckpointer(path, 2, None, FitnessCache(1024, b'reward a'))
+    same.resume()
+    assert len(same.fitness_cache) > 0
+    other = GACheckpointer(path, 2, None, FitnessCache(1024, b'reward b'))
+    assert other.resume()['generations_completed'] == 2
+    assert len(other.fitness_cache) == 0
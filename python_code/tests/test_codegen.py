@@ -0,0 +1,31 @@
+import os
+import shutil
+
+import pytest
+import torch
+
+from src.DDPG import check_actor, export_actor
+from src.DDPG.controllers import BlackBoxActor
+
+
+def actor() -> BlackBoxActor:
+    torch.manual_seed(0)
+    return BlackBoxActor(6, 2, (8, 8), torch.nn.ReLU, 1.)
+
+
+def test_export_actor_writes_the_header_and_kernels(tmp_path):
+    paths = export_actor(actor(), str(tmp_path))
+    assert set(paths) == {'header', 'reference', 'float32'}
+    assert all(os.path.exists(path) for path in paths.values())
+    with open(paths['reference']) as source_file:
+        assert 'pi_nn.h' in source_file.read()
+
+
+@pytest.mark.skipif(shutil.which('g++') is None, reason='no C++ compiler')
+def test_check_actor_returns_the_report_without_printing(tmp_path, capsys):
+    report = check_actor(actor(), str(tmp_path), n_samples=50)
+    assert capsys.readouterr().out == ''
+    assert set(report) == {'reference', 'float32'}
+    for variant in report.values():
+        assert {'max_abs_error', 'max_rel_error', 'kernel_us', 'call_us', 'budget_fraction'} <= set(variant)
+        assert variant['max_abs_error'] < 1e-5
@@ -0,0 +1,88 @@
+import numpy as np
+
+from src.fitness import FitnessCache, fitness_context
+from src.ball_balancer.environement import linear_e_reward, quadratic_e_reward
+from src.ball_simulation.ball_position_control_benchmark import fitness_fn_generator
+from src.constants import DT
+from src.DDPG import PidController
+
+
+class CountingFitness:
+    def __init__(self):
+        self.calls: int = 0
+        self.evaluated: int = 0
+
+    def __call__(self, solution, sol_idx) -> float:
+        self.calls += 1
+        self.evaluated += 1
+        return float(np.sum(solution))
+
+    def batch(self, solutions, solutions_indices):
+        self.calls += 1
+        self.evaluated += len(solutions)
+        return [float(np.sum(solution)) for solution in solutions]
+
+
+def test_lru_bound_and_evictions():
+    cache = FitnessCache(2)
+    a, b, c = (cache.key(np.full(3, value)) for value in (1., 2., 3.))
+    cache.put(a, 1.)
+    cache.put(b, 2.)
+    assert cache.get(a) == 1.
+    # b is the least recently used
+    cache.put(c, 3.)
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.get(b) is None
+    assert cache.get(a) == 1. and cache.get(c) == 3.
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'hit_rate': 0.75}
+
+
+def test_wrap_evaluates_a_solution_once():
+    fitness = CountingFitness()
+    cache = FitnessCache(16)
+    cached = cache.wrap(fitness)
+    solutions = np.random.default_rng(0).uniform(-1., 1., (4, 3))
+    for _ in range(3):
+        assert [cached(solution, i) for i, solution in enumerate(solutions)] == \
+               [float(np.sum(solution)) for solution in solutions]
+    assert fitness.evaluated == 4
+    assert cache.hits == 8
+
+
+def test_batched_wrap_only_sends_the_missing_solutions():
+    fitness = CountingFitness()
+    cache = FitnessCache(16)
+    cached = cache.wrap(fitness.batch, batched=True)
+    solutions = np.random.default_rng(0).uniform(-1., 1., (6, 3))
+    cached(solutions[:4], list(range(4)))
+    result = cached(solutions, list(range(6)))
+    assert result == [float(np.sum(solution)) for solution in solutions]
+    assert fitness.evaluated == 6
+    cached(solutions, list(range(6)))
+    assert fitness.calls == 2
+
+
+def test_contexts_do_not_share_values():
+    solution = np.ones(3)
+    assert FitnessCache(16, fitness_context(np.zeros(10))).key(solution) != \
+        FitnessCache(16, fitness_context(np.ones(10))).key(solution)
+    assert fitness_context(None, 1.) != fitness_context(0, 1.)
+    # Functions are hashed by name
+    assert fitness_context(linear_e_reward, 1.) == fitness_context(linear_e_reward, 1.)
+    assert fitness_context(linear_e_reward, 1.) != fitness_context(quadratic_e_reward, 1.)
+
+
+def test_cached_fitness_matches_uncached_fitness():
+    rng = np.random.default_rng(0)
+    target_trajectory = 0.03 * np.array([np.sin(np.arange(300) * DT), np.cos(np.arange(300) * DT)])
+    model = PidController(3, 1)
+    solutions = rng.uniform(-1., 0., (5, 3))
+    # Kept parents and duplicate genomes come back in the next generations
+    solutions = np.concatenate([solutions, solutions[:3]])
+
+    fitness_func = fitness_fn_generator(model, target_trajectory, seed=0)
+    reference = [fitness_func(solution, i) for i, solution in enumerate(solutions)]
+    cache = FitnessCache(16)
+    cached = cache.wrap(fitness_fn_generator(model, target_trajectory, seed=0))
+    assert [cached(solution, i) for i, solution in enumerate(solutions)] == reference
+    assert cache.hits == 3
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from src.ball_balancer import BBEnv, BBEnvPid
+
+N_STEPS = 400
+
+
+def rollout(env_class, in_place: bool, seed: int, y_gain_scale: float = 1.):
+    env = env_class(in_place=in_place)
+    env.motor_pid_y.w = env.motor_pid_y.w * y_gain_scale
+    actions = np.random.default_rng(seed).uniform(-1., 1., (N_STEPS,) + env.action_space.shape)
+    if env_class is BBEnvPid:
+        actions = - np.abs(actions)
+    env.seed(seed)
+    observations = [env.reset().copy()]
+    rewards, infos = [], []
+    for action in actions:
+        observation, reward, done, info = env.step(action)
+        observations.append(observation.copy())
+        rewards.append(reward)
+        infos.append(info['observation'].copy())
+        if done:
+            break
+    return np.array(observations), np.array(rewards), np.array(infos)
+
+
+@pytest.mark.parametrize('env_class', [BBEnv, BBEnvPid])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_in_place_step_matches_default(env_class, seed):
+    reference = rollout(env_class, False, seed)
+    in_place = rollout(env_class, True, seed)
+    for name, expected, value in zip(('observation', 'reward', 'info observation'), reference, in_place):
+        assert value.shape == expected.shape, name
+        assert value.dtype == expected.dtype, name
+        # The default path keeps the observation in float32
+        np.testing.assert_allclose(value, expected, rtol=1e-4, atol=1e-5, err_msg=name)
+
+
+@pytest.mark.parametrize('env_class', [BBEnv, BBEnvPid])
+def test_in_place_step_uses_the_gains_of_each_axis(env_class):
+    reference = rollout(env_class, False, 0, y_gain_scale=0.5)
+    in_place = rollout(env_class, True, 0, y_gain_scale=0.5)
+    np.testing.assert_allclose(in_place[0], reference[0], rtol=1e-4, atol=1e-5)
+    # The y gains matter, the rollouts may even end at different steps
+    unchanged = rollout(env_class, False, 0)[0]
+    assert unchanged.shape != reference[0].shape or not np.allclose(unchanged, reference[0], rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('env_class', [BBEnv, BBEnvPid])
+def test_in_place_step_returns_buffer_views(env_class):
+    env = env_class(in_place=True)
+    env.seed(0)
+    env.reset()
+    action = - np.full(env.action_space.shape, 0.5)
+    observation, _, _, info = env.step(action)
+    previous = observation.copy(), info['observation'].copy()
+    next_observation, _, _, next_info = env.step(action)
+    for value in (observation, info['observation'], next_observation, next_info['observation']):
+        assert value.dtype == np.float32
+        assert np.shares_memory(value, env.buffer.scaled) or np.shares_memory(value, env.buffer.info_observation)
+    # The values returned by the previous step are kept one more step
+    np.testing.assert_array_equal(observation, previous[0])
+    np.testing.assert_array_equal(info['observation'], previous[1])
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import torch
+
+from src.ball_simulation import BallNet1Hidden, BallNet2Hidden
+from src.DDPG import GeneticController, PidController
+from src.fitness import population_weights_as_dict
+from src.inference import population_linear
+from src.motor_simulation import PlateauNet1Hidden, PlateauNet2Hidden
+from src.motor_simulation.neural_net_controller import NnController, PidController as MotorPidController
+
+# Exported weights are float64, the torch path float32
+RTOL = 1e-5
+ATOL = 1e-5
+
+
+def seeded(model: torch.nn.Module) -> torch.nn.Module:
+    torch.manual_seed(0)
+    for parameter in model.parameters():
+        torch.nn.init.uniform_(parameter, -1., 1.)
+    return model
+
+
+@pytest.mark.parametrize('model', [PidController(3, 1), MotorPidController(3, 1), NnController(3, 8, 1)])
+def test_controller_step_matches_torch(model):
+    seeded(model)
+    rng = np.random.default_rng(0)
+    for error, d_error, integral_error in rng.uniform(-0.1, 0.1, (20, 3)).tolist():
+        model.inference_mode(False)
+        reference = model.step(error, d_error, integral_error)
+        model.inference_mode()
+        result = model.step(error, d_error, integral_error)
+        assert isinstance(result, float)
+        np.testing.assert_allclose(result, reference, rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize('model', [PlateauNet1Hidden(2, 8, 1), PlateauNet2Hidden(2, 8, 8, 1)])
+def test_plateau_step_keeps_the_tensor_return(model):
+    seeded(model)
+    rng = np.random.default_rng(0)
+    for u, s in rng.uniform(-1., 1., (20, 2)).tolist():
+        model.inference_mode(False)
+        reference = model.step(u, s)
+        model.inference_mode()
+        result = model.step(u, s)
+        assert isinstance(result, torch.Tensor)
+        assert result.shape == reference.shape and result.dtype == reference.dtype
+        np.testing.assert_allclose(result.numpy(), reference.detach().numpy(), rtol=RTOL, atol=ATOL)
+        np.testing.assert_allclose(model.step_many(np.array([u]), np.array([s])), reference.detach().numpy(),
+                                   rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize('model', [BallNet1Hidden(8, 8, 2), BallNet2Hidden(8, 8, 8, 2)])
+def test_ball_step_keeps_the_tensor_return(model):
+    seeded(model)
+    rng = np.random.default_rng(0)
+    for x, y, d_x, d_y, angle_x, angle_y in rng.uniform(-0.1, 0.1, (20, 6)).tolist():
+        model.inference_mode(False)
+        reference = model.step(x, y, d_x, d_y, angle_x, angle_y)
+        model.inference_mode()
+        result = model.step(x, y, d_x, d_y, angle_x, angle_y)
+        assert isinstance(result, torch.Tensor)
+        assert result.shape == reference.shape and result.dtype == reference.dtype
+        np.testing.assert_allclose(result.numpy(), reference.detach().numpy(), rtol=RTOL, atol=ATOL)
+
+
+def test_ball_recurcive_predict_many_matches_recurcive_predict():
+    model = seeded(BallNet1Hidden(8, 8, 2))
+    rng = np.random.default_rng(0)
+    x_0 = rng.uniform(-0.05, 0.05, (3, 2))
+    d_x_0 = rng.uniform(-0.01, 0.01, (3, 2))
+    inputs = rng.uniform(-0.1, 0.1, (3, 50, 2))
+    model.inference_mode()
+    reference = np.stack([model.recurcive_predict(*x_0[b].tolist(), *d_x_0[b].tolist(), inputs[b]) for b in range(3)])
+    model.inference_mode(False)
+    # The scalar step rounds its output to float32, step_many stays in float64
+    np.testing.assert_allclose(model.recurcive_predict_many(x_0, d_x_0, inputs), reference, rtol=1e-4, atol=1e-6)
+    assert model.inference_weights() is None
+
+
+def test_load_state_dict_refreshes_the_export():
+    model = seeded(PlateauNet1Hidden(2, 8, 1))
+    model.inference_mode()
+    other = PlateauNet1Hidden(2, 8, 1)
+    model.load_state_dict(other.state_dict())
+    np.testing.assert_array_equal(model.inference_weights()['predict.bias'],
+                                  other.predict.bias.detach().numpy().astype(np.float64))
+
+
+def test_population_linear_matches_per_solution_forward():
+    model = GeneticController(3, 4, 1)
+    solutions = np.random.default_rng(0).uniform(-1., 1., (5, sum(p.numel() for p in model.parameters())))
+    weights = population_weights_as_dict(model, solutions)
+    x = torch.as_tensor(np.random.default_rng(1).uniform(-1., 1., (5, 3)), dtype=torch.float32)
+    result = population_linear(x, weights['h1.weight'], weights['h1.bias'])
+    for p in range(5):
+        reference = torch.nn.functional.linear(x[p], weights['h1.weight'][p], weights['h1.bias'][p])
+        np.testing.assert_allclose(result[p].numpy(), reference.numpy(), rtol=1e-6, atol=1e-6)
@@ -0,0 +1,53 @@
+import threading
+
+import numpy as np
+import torch
+
+from src.ball_balancer import BBEnv
+from src.DDPG import ActorInferenceServer, parallel_rollouts
+
+N_WORKERS = 4
+N_STEPS = 20
+
+
+def actor() -> torch.nn.Module:
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(6, 8), torch.nn.Tanh(), torch.nn.Linear(8, 2), torch.nn.Tanh())
+
+
+def forward(model: torch.nn.Module, observations: np.ndarray) -> np.ndarray:
+    with torch.no_grad():
+        return model(torch.as_tensor(observations, dtype=torch.float32)).numpy()
+
+
+def test_clients_get_the_actions_of_their_observations():
+    model = actor()
+    server = ActorInferenceServer(model, max_batch=N_WORKERS, max_latency=0.01)
+    clients = [server.client() for _ in range(N_WORKERS)]
+    observations = np.random.default_rng(0).uniform(-1., 1., (N_WORKERS, N_STEPS, 6)).astype(np.float32)
+    actions = np.zeros((N_WORKERS, N_STEPS, 2), dtype=np.float32)
+
+    def work(i: int):
+        for t in range(N_STEPS):
+            actions[i, t] = clients[i].act(observations[i, t])
+
+    with server:
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(N_WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    np.testing.assert_allclose(actions, forward(model, observations), rtol=1e-6, atol=1e-6)
+    assert server.n_requests == N_WORKERS * N_STEPS
+    assert 1. <= server.mean_batch_size() <= N_WORKERS
+
+
+def test_parallel_rollouts():
+    model = actor()
+    transitions = parallel_rollouts(model, BBEnv, N_WORKERS, N_STEPS, max_latency=0.01)
+    assert len(transitions) == N_WORKERS
+    for worker_transitions in transitions:
+        assert worker_transitions['obs'].shape == (N_STEPS, 6) and worker_transitions['act'].shape == (N_STEPS, 2)
+        np.testing.assert_allclose(worker_transitions['act'], forward(model, worker_transitions['obs']), rtol=1e-6,
+                                   atol=1e-6)
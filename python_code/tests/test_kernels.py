@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import torch
+
+from src.ball_balancer import BBEnv, BbSimulation, BenchmarkEvaluator
+from src.ball_balancer.kernels import IDENTITY, RELU, TANH, mlp_forward, pack_mlp, plant_coefficients, plant_state, \
+    plant_step, rollout_mlp, rollout_pid
+from src.constants import DT, MAX_ANGLE
+from src.DDPG import GeneticController, PidController
+
+N_STEPS = 1000
+
+
+def trajectory(n_steps: int = N_STEPS) -> np.ndarray:
+    return 0.03 * np.array([np.sin(np.arange(n_steps) * DT), np.cos(np.arange(n_steps) * DT)])
+
+
+@pytest.mark.parametrize('y_gain_scale', [1., 0.5])
+def test_plant_step_is_bit_exact(y_gain_scale):
+    rng = np.random.default_rng(0)
+    sim = BbSimulation()
+    sim.motor_pid_y.w = sim.motor_pid_y.w * y_gain_scale
+    sim.motor_pid_y.b = sim.motor_pid_y.b * y_gain_scale
+    sim.ball.x = rng.uniform(-0.05, 0.05, 2)
+    coefs = plant_coefficients(sim)
+    state = plant_state(sim)
+    for _ in range(N_STEPS):
+        target = rng.uniform(-MAX_ANGLE, MAX_ANGLE, 2)
+        sim.step_bb(target)
+        plant_step(state, target[0], target[1], coefs)
+        np.testing.assert_array_equal(plant_state(sim), state)
+
+
+@pytest.mark.parametrize('y_gain_scale', [1., 0.5])
+def test_rollout_pid_matches_simulate(y_gain_scale):
+    evaluator = BenchmarkEvaluator(trajectory())
+    evaluator.motor_pid_y.w = evaluator.motor_pid_y.w * y_gain_scale
+    model = PidController(3, 1)
+    model.predict.weight.data = torch.tensor([[-0.8, -0.3, -0.1]])
+    model.inference_mode()
+    reference = evaluator.simulate(model, test=True)
+    evaluator.test_reset()
+    result = rollout_pid(plant_state(evaluator), plant_coefficients(evaluator),
+                         model.predict.weight.detach().numpy()[0].astype(np.float64), trajectory())
+    # simulate goes through step(u / MAX_ANGLE) * MAX_ANGLE and np.tanh, the kernel uses u and math.tanh: a few ulp
+    for expected, value in zip(reference[:4], result):
+        np.testing.assert_allclose(value, expected, rtol=1e-12, atol=1e-14)
+
+
+def test_rollout_mlp_matches_simulate():
+    torch.manual_seed(0)
+    env = BBEnv()
+    actor = GeneticController(6, 8, 2)
+    reference = env.simulate(actor, trajectory())
+    env.test_reset()
+    flat, layout = pack_mlp(actor)
+    result = rollout_mlp(plant_state(env), plant_coefficients(env), flat, layout, 1., trajectory())
+    # The torch actor runs in float32, the kernel in float64
+    for expected, value in zip(reference[:4], result):
+        np.testing.assert_allclose(value, expected, rtol=0., atol=1e-3 * max(1., np.abs(expected).max()))
+
+
+def test_pack_mlp_activations():
+    _, layout = pack_mlp(GeneticController(6, 8, 2))
+    assert layout[:, 3].tolist() == [TANH, TANH]
+    _, layout = pack_mlp(torch.nn.Sequential(torch.nn.Linear(6, 8), torch.nn.Linear(8, 2)))
+    assert layout[:, 3].tolist() == [IDENTITY, IDENTITY]
+    _, layout = pack_mlp(torch.nn.Sequential(torch.nn.Linear(6, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2)), TANH)
+    assert layout[:, 3].tolist() == [RELU, TANH]
+
+
+@pytest.mark.parametrize('model', [torch.nn.Sequential(torch.nn.Linear(6, 8), torch.nn.Tanh(), torch.nn.Linear(8, 2)),
+                                   GeneticController(6, 8, 2)])
+def test_pack_mlp_forward(model):
+    x = np.random.default_rng(0).uniform(-1., 1., 6)
+    flat, layout = pack_mlp(model)
+    with torch.no_grad():
+        expected = model(torch.as_tensor(x, dtype=torch.float32)).numpy()
+    np.testing.assert_allclose(mlp_forward(x, flat, layout), expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+from src.checkpoint import load_checkpoint
+from src.model_training import best_model, evaluate_loss, split_validation, train_model, train_models
+
+
+def data(n: int = 512):
+    rng = np.random.default_rng(0)
+    x = torch.as_tensor(rng.uniform(-1., 1., (n, 3)), dtype=torch.float32)
+    y = x @ torch.tensor([[0.5], [-1.], [2.]]) + 0.1
+    return x, y
+
+
+def test_split_validation_is_a_seeded_partition():
+    x, y = data()
+    x_train, y_train, x_val, y_val = split_validation(x, y, 0.25, seed=0)
+    assert len(x_val) == 128 and len(x_train) == 384
+    np.testing.assert_array_equal(split_validation(x, y, 0.25, seed=0)[2], x_val)
+    assert len(torch.unique(torch.cat([x_train, x_val]), dim=0)) == len(x)
+
+
+def test_train_model_keeps_the_best_epoch(tmp_path):
+    x, y = data()
+    path = str(tmp_path / 'best.pt')
+    model, history = train_model(torch.nn.Linear(3, 1), x, y, n_epoch=200, batch_size=64, lr=1e-2, patience=5,
+                                 checkpoint_path=path, seed=0, verbose=False)
+    assert history['val_r2'] > 0.99
+    assert history['best_val_loss'] == min(history['val_loss'])
+    # The returned model has the weights of the best validation epoch, saved in the checkpoint
+    x_train, y_train, x_val, y_val = split_validation(x, y, 0.2, 0)
+    assert evaluate_loss(model, x_val, y_val) == history['best_val_loss']
+    assert load_checkpoint(path)['epoch'] == history['best_epoch']
+
+
+def test_early_stopping():
+    x, y = data()
+    # Nothing left to learn: the validation loss stops improving right away
+    _, history = train_model(torch.nn.Linear(3, 1), x, torch.zeros_like(y), n_epoch=1000, lr=0., patience=3, seed=0,
+                             verbose=False)
+    assert len(history['val_loss']) == history['best_epoch'] + 4
+
+
+def test_seeded_training_is_reproducible():
+    x, y = data()
+    histories = []
+    for _ in range(2):
+        # The model is initialized by its constructor
+        torch.manual_seed(1)
+        histories.append(train_model(torch.nn.Linear(3, 1), x, y, n_epoch=5, seed=0, verbose=False)[1])
+    assert histories[0]['val_loss'] == histories[1]['val_loss']
+
+
+def test_train_models_picks_the_lowest_validation_loss():
+    x, y = data()
+    models, histories = train_models([torch.nn.Linear(3, 1), torch.nn.Sequential(torch.nn.Linear(3, 1))], x, y,
+                                     n_epoch=20, seed=0, verbose=False, lr=1e-2)
+    index, model = best_model(models, histories)
+    assert model is models[index]
+    assert histories[index]['best_val_loss'] == min(history['best_val_loss'] for history in histories)
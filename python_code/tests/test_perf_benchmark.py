@@ -0,0 +1,18 @@
+import os
+
+from src import perf_benchmark
+from src.perf_benchmark import compare, load_results, save_results
+
+
+def test_results_are_not_written_in_the_data_directory():
+    assert os.path.dirname(perf_benchmark.RESULTS_PATH) == 'src/data/results'
+
+
+def test_save_results_creates_the_results_directory(tmp_path):
+    path = str(tmp_path / 'results' / 'perf_results.json')
+    save_results({'bb_env': {'rate': 100., 'scale': 1.}}, 'abc', path)
+    save_results({'bb_env': {'rate': 80., 'scale': 1.}}, 'def', path)
+    history = load_results(path)
+    assert list(history) == ['abc', 'def']
+    assert compare(history['def']['results'], history['abc']['results'], 0.1) == \
+        ['bb_env rate: 100 -> 80 (-20.0%)']
@@ -0,0 +1,25 @@
+import numpy as np
+import torch
+
+from src.ball_balancer.environement import linear_e_reward
+from src.ball_simulation.ball_position_control_genetic import fitness_fn_generator_blackbox, \
+    population_fitness_fn_generator_blackbox
+from src.DDPG import GeneticController
+
+POPULATION = 4
+
+
+def test_batched_fitness_matches_serial_fitness():
+    torch.manual_seed(0)
+    actor = GeneticController(6, 4, 2)
+    n_weights = sum(p.numel() for p in actor.parameters())
+    solutions = np.random.default_rng(0).uniform(-2., 2., (POPULATION, n_weights))
+
+    serial = fitness_fn_generator_blackbox(actor, linear_e_reward, 1., seed=0)
+    reference = [serial(solution, i) for i, solution in enumerate(solutions)]
+    batched = population_fitness_fn_generator_blackbox(actor, linear_e_reward, 1., POPULATION, seed=0)
+    # The fitness of a candidate does not depend on its row in the batch, nor on the batch size
+    for order in ([0, 1, 2, 3], [3, 1, 0, 2], [2, 0]):
+        result = batched(solutions[order], order)
+        # The batched forward rounds differently in float32
+        np.testing.assert_allclose(result, np.array(reference)[order], rtol=1e-5)
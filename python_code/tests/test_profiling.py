@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from src.ball_balancer import BBEnv
+from src.ball_balancer.environement import linear_e_reward
+from src.ball_simulation import train_ball_controller_genetic
+from src.profiling import ENV_PHASES, Profiler
+
+
+class Counter:
+    def __init__(self):
+        self.value: int = 0
+
+    def increment(self) -> int:
+        self.value += 1
+        return self.value
+
+    def fail(self):
+        raise RuntimeError('fail')
+
+
+PHASES = {'increment': 'increment', 'fail': 'fail', 'missing': 'missing'}
+
+
+def test_instrumented_only_wraps_the_instance():
+    profiler = Profiler()
+    counter, other = Counter(), Counter()
+    with profiler.instrumented(counter, PHASES):
+        assert 'increment' in counter.__dict__
+        counter.increment()
+        other.increment()
+        assert 'increment' not in other.__dict__
+    assert 'increment' not in counter.__dict__ and 'missing' not in counter.__dict__
+    assert Counter.increment.__qualname__ == 'Counter.increment'
+    assert profiler.calls['increment'] == 1
+
+
+def test_instrumented_restores_on_exception():
+    profiler = Profiler()
+    counter = Counter()
+    with pytest.raises(RuntimeError):
+        with profiler, profiler.instrumented(counter, PHASES):
+            counter.fail()
+    assert not counter.__dict__.keys() & PHASES.keys()
+    assert profiler.calls['fail'] == 1 and profiler._depth == 0 and not profiler._stack
+
+
+def test_nested_instrumentations_restore_the_outer_one():
+    outer, inner = Profiler(), Profiler()
+    counter = Counter()
+    with outer.instrumented(counter, PHASES):
+        outer_increment = counter.increment
+        with inner.instrumented(counter, PHASES):
+            counter.increment()
+        assert counter.increment is outer_increment
+        counter.increment()
+    assert 'increment' not in counter.__dict__
+    # Two profilers are independent
+    assert outer.calls['increment'] == 2 and inner.calls['increment'] == 1
+
+
+def test_nested_enables_count_the_wall_time_once():
+    profiler = Profiler()
+    with profiler:
+        with profiler:
+            pass
+        assert profiler._enabled_at is not None
+    assert profiler._enabled_at is None
+    wall_ns = profiler.wall_ns
+    profiler.disable()
+    assert profiler.wall_ns == wall_ns
+
+
+def test_environement_phases():
+    profiler = Profiler()
+    env = BBEnv()
+    env.reset()
+    with profiler, profiler.instrumented(env, ENV_PHASES):
+        for _ in range(10):
+            env.step(np.array([0.1, -0.1]))
+    assert profiler.calls['env_step'] == 10
+    assert profiler.calls['physics'] == 10 and profiler.calls['observe'] == 10 and profiler.calls['reward'] == 10
+    assert profiler.stacks_ns[('env_step', 'physics')] > 0
+    assert not env.__dict__.keys() & {'step', 'step_bb', 'observe'}
+
+
+def test_genetic_trainer_phases(tmp_path):
+    profiler = Profiler()
+    train_ball_controller_genetic(2, linear_e_reward, 1., 2, 4, 2, 'sss', 'single_point', 'random', 10, 1, seed=0,
+                                  population_batched=True, checkpoint_path=str(tmp_path / 'genetic.pt'),
+                                  profiler=profiler)
+    assert {'ga_run', 'ga_fitness', 'fitness'} <= set(profiler.calls)
+    assert profiler.calls['ga_run'] == 1 and profiler.wall_ns > 0
+    assert ('ga_run', 'ga_fitness', 'fitness') in profiler.stacks_ns
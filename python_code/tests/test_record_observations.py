@@ -0,0 +1,49 @@
+import numpy as np
+
+from src.ball_balancer import BBEnv
+from src.constants import BALL_D_ERROR_SCALING, BALL_ERROR_SCALING, BALL_INTEGRAL_ERROR_SCALING, BALL_MAX_INTEGRAL, \
+    DT, FILTERING_PERIOD
+from src.DDPG.quantization import record_observations
+
+
+def record(seed: int = 0, length: int = 500) -> dict:
+    rng = np.random.default_rng(seed)
+    target = np.cumsum(rng.normal(0., 0.002, (2, length)), axis=1)
+    ball = target + rng.normal(0., 0.01, (2, length))
+    return {'target_x': target[0], 'target_y': target[1], 'ball_x': ball[0], 'ball_y': ball[1]}
+
+
+def test_record_observations_matches_the_former_filter():
+    data = record()
+    alpha = 2. / (1. + FILTERING_PERIOD)
+    target = np.stack([data['target_x'], data['target_y']])
+    ball = np.stack([data['ball_x'], data['ball_y']])
+    previous_error = target[:, 0]
+    integral = previous_error * DT
+    ema = ema_ema = np.zeros(2)
+    reference = []
+    for i in range(1, target.shape[1]):
+        ema = alpha * ball[:, i] + (1 - alpha) * ema
+        ema_ema = alpha * ema + (1 - alpha) * ema_ema
+        error = (2. * ema) - ema_ema - target[:, i]
+        d_error = (error - previous_error) / DT
+        integral = np.clip(integral + error * DT, -BALL_MAX_INTEGRAL, BALL_MAX_INTEGRAL)
+        previous_error = error
+        reference.append(np.concatenate([error * BALL_ERROR_SCALING, d_error * BALL_D_ERROR_SCALING,
+                                         integral * BALL_INTEGRAL_ERROR_SCALING]))
+    np.testing.assert_array_equal(record_observations(data), np.array(reference))
+
+
+def test_record_observations_filter_is_the_one_of_the_environement():
+    data = record(1)
+    env = BBEnv()
+    env.ema = np.zeros(2)
+    env.ema_ema = np.zeros(2)
+    errors = []
+    for i in range(1, len(data['ball_x'])):
+        env.state = (np.array([data['target_x'][i], data['target_y'][i]]),
+                     np.array([data['ball_x'][i], data['ball_y'][i]]), env.state[2])
+        env.observe()
+        errors.append(env.observation[0:2].copy())
+    np.testing.assert_allclose(record_observations(data)[:, 0:2], np.array(errors) * BALL_ERROR_SCALING,
+                               rtol=1e-6, atol=1e-9)
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from src.recordings import RecordingCache, default_cache_dir
+
+
+def write_recording(data_dir) -> str:
+    os.makedirs(os.path.join(data_dir, 'real_system_test'))
+    with open(os.path.join(data_dir, 'real_system_test', 'record.csv'), 'w') as csv_file:
+        csv_file.write('target_x,target_y,ball_x,ball_y\n0.,0.,0.01,-0.02\n0.,0.01,0.02,-0.01\n')
+    return 'real_system_test/record.csv'
+
+
+def test_default_cache_is_out_of_the_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'user_cache'))
+    data_dir = str(tmp_path / 'data')
+    name = write_recording(data_dir)
+
+    cache = RecordingCache(data_dir)
+    assert cache.cache_dir == default_cache_dir(data_dir)
+    assert cache.cache_dir.startswith(str(tmp_path / 'user_cache'))
+    recording = cache.load(name)
+    np.testing.assert_array_equal(recording['x_error'], [0.01, 0.02])
+    assert sorted(os.listdir(data_dir)) == ['real_system_test']
+
+    cached = RecordingCache(data_dir)
+    np.testing.assert_array_equal(cached.load(name)['x_error'], recording['x_error'])
+    assert cached.n_cached == 1 and cached.n_parsed == 0
+
+
+def test_data_dirs_have_their_own_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'user_cache'))
+    assert default_cache_dir(str(tmp_path / 'a')) != default_cache_dir(str(tmp_path / 'b'))
@@ -0,0 +1,53 @@
+import numpy as np
+
+from src.DDPG import MemmapReplayBuffer
+
+OBS_DIM = 6
+ACT_DIM = 2
+SIZE = 8
+
+
+def transitions(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-1., 1., (n, OBS_DIM)), rng.uniform(-1., 1., (n, ACT_DIM)), rng.uniform(-1., 1., n),
+            rng.uniform(-1., 1., (n, OBS_DIM)), rng.integers(0, 2, n).astype(float))
+
+
+def test_ring_keeps_the_last_transitions(tmp_path):
+    buffer = MemmapReplayBuffer(OBS_DIM, ACT_DIM, SIZE, str(tmp_path))
+    obs, act, rew, next_obs, done = transitions(SIZE + 3)
+    for transition in zip(obs, act, rew, next_obs, done):
+        buffer.store(*transition)
+    assert len(buffer) == SIZE and buffer.ptr == 3
+    # The 3 oldest transitions were overwritten
+    np.testing.assert_array_equal(buffer.columns['rew'][:3], rew[SIZE:].astype(np.float32))
+    np.testing.assert_array_equal(buffer.columns['obs'][3:], obs[3:SIZE].astype(np.float32))
+
+
+def test_store_batch_matches_store(tmp_path):
+    one_by_one = MemmapReplayBuffer(OBS_DIM, ACT_DIM, SIZE, str(tmp_path / 'store'))
+    batched = MemmapReplayBuffer(OBS_DIM, ACT_DIM, SIZE, str(tmp_path / 'batch'))
+    data = transitions(SIZE + 3)
+    for transition in zip(*data):
+        one_by_one.store(*transition)
+    batched.store_batch(*(column[:5] for column in data))
+    batched.store_batch(*(column[5:] for column in data))
+    assert (batched.ptr, batched.size) == (one_by_one.ptr, one_by_one.size)
+    for column in MemmapReplayBuffer.COLUMNS:
+        np.testing.assert_array_equal(batched.columns[column], one_by_one.columns[column])
+
+
+def test_reopen_continues_the_buffer(tmp_path):
+    path = str(tmp_path)
+    buffer = MemmapReplayBuffer(OBS_DIM, ACT_DIM, SIZE, path, flush_every=1)
+    obs, act, rew, next_obs, done = transitions(5)
+    buffer.store_batch(obs, act, rew, next_obs, done)
+    del buffer
+
+    reopened = MemmapReplayBuffer.open(path, seed=0)
+    assert (reopened.ptr, len(reopened)) == (5, 5)
+    np.testing.assert_array_equal(reopened.columns['next_obs'][:5], next_obs.astype(np.float32))
+    batch = reopened.sample_batch(16)
+    assert batch['obs'].shape == (16, OBS_DIM) and batch['act'].shape == (16, ACT_DIM)
+    # Only the stored transitions are sampled
+    assert set(batch['rew'].tolist()) <= set(rew.astype(np.float32).tolist())
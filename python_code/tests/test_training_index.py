@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from src.DDPG import training_index
+from src.DDPG.training_index import TrainingLogIndex, default_index_path
+
+
+def write_run(root) -> str:
+    run_dir = os.path.join(root, 'black_box_controller', 'le0.3_[100]_relu')
+    os.makedirs(run_dir)
+    with open(os.path.join(run_dir, 'progress.txt'), 'w') as progress_file:
+        progress_file.write('Epoch\tAverageTestEpRet\n0\t1.5\n1\t2.5\n')
+    return run_dir
+
+
+def test_index_is_written_out_of_the_data_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(training_index, 'RESULTS_DIR', str(tmp_path / 'results'))
+    root = str(tmp_path / 'data')
+    write_run(root)
+
+    index = TrainingLogIndex(root)
+    assert index.path == default_index_path(root)
+    assert os.path.exists(index.path) and index.path.startswith(str(tmp_path / 'results'))
+    assert sorted(os.listdir(root)) == ['black_box_controller']
+    np.testing.assert_array_equal(TrainingLogIndex(root, update=False).progress()['AverageTestEpRet'], [1.5, 2.5])
+
+
+def test_explicit_index_path(tmp_path):
+    root = str(tmp_path / 'data')
+    write_run(root)
+    path = str(tmp_path / 'index' / 'runs.npz')
+    TrainingLogIndex(root, path)
+    assert os.path.exists(path)
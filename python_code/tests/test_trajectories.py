@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.ball_balancer import ScenarioBank
+from src.ball_balancer.environement import trajectory_gen
+from src.constants import MAX_X
+
+# random_walks filters target * (1 - 1 / 2000), the loops computed target - target / 2000: rounding only, the
+# differences stay below 1e-13 on targets of about MAX_X
+RTOL = 1e-9
+ATOL = 1e-12
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_trajectory_gen_keeps_the_target_gen_stream(seed):
+    # target_gen loop, with scalar draws
+    np.random.seed(seed)
+    target = np.zeros(2)
+    reference = np.empty((2, 5000))
+    for i in range(5000):
+        for axis in range(2):
+            target[axis] += np.random.normal(-target[axis] / 2000, MAX_X / 25.)
+        reference[:, i] = target
+    reference_state = np.random.get_state()
+
+    np.random.seed(seed)
+    np.testing.assert_allclose(trajectory_gen(5000), reference, rtol=RTOL, atol=ATOL)
+    # The global generator is left where target_gen leaves it
+    state = np.random.get_state()
+    assert np.array_equal(state[1], reference_state[1]) and state[2:] == reference_state[2:]
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_scenario_bank_keeps_its_seeded_trajectories(seed):
+    n_scenarios, length = 4, 3000
+    bank = ScenarioBank.generate(n_scenarios, seed, trajectory_length=length)
+
+    # Former per step loop of ScenarioBank.generate
+    rng = np.random.default_rng(seed)
+    rng.uniform(size=(n_scenarios, 2, 2))
+    rng.uniform(size=(n_scenarios, 2))
+    rng.uniform(size=(n_scenarios, 2))
+    reference = np.empty((n_scenarios, 2, length))
+    target = np.zeros((n_scenarios, 2))
+    noise = rng.standard_normal((length, n_scenarios, 2)) * (MAX_X / 25.)
+    for i in range(length):
+        target = target - target / 2000 + noise[i]
+        reference[:, :, i] = target
+
+    np.testing.assert_allclose(bank.trajectories, reference.astype(np.float32), rtol=1e-6)
+    np.testing.assert_array_equal(bank.initial_states[:, 0], reference[:, :, 0].astype(np.float32))
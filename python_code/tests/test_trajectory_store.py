@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.trajectory_store import FORMAT_VERSION, METADATA_KEY, convert_json, export_json, load_run, save_bundle, \
+    save_npz
+
+
+def run() -> dict:
+    rng = np.random.default_rng(0)
+    return {'t': np.arange(50) * 0.01, 'target': rng.uniform(-1., 1., (2, 50)), 'u': rng.uniform(-1., 1., (2, 50)),
+            'iterations': np.arange(50)}
+
+
+@pytest.mark.parametrize('save, name', [(save_npz, 'run.npz'), (save_bundle, 'run')])
+def test_round_trip(tmp_path, save, name):
+    path = str(tmp_path / name)
+    save(path, run(), {'controller': 'pid'})
+    arrays, metadata = load_run(path)
+    assert arrays.keys() == run().keys()
+    for key, value in run().items():
+        np.testing.assert_array_equal(arrays[key], value)
+        assert arrays[key].dtype == value.dtype
+    assert metadata['controller'] == 'pid' and metadata['format_version'] == FORMAT_VERSION
+    assert metadata['arrays']['target'] == {'shape': [2, 50], 'dtype': 'float64'}
+
+
+def test_float32_cast_keeps_the_integer_arrays(tmp_path):
+    path = str(tmp_path / 'run.npz')
+    save_npz(path, run(), dtype=np.float32)
+    arrays, _ = load_run(path)
+    assert arrays['u'].dtype == np.float32 and arrays['iterations'].dtype == run()['iterations'].dtype
+
+
+def test_reserved_metadata_key(tmp_path):
+    with pytest.raises(ValueError):
+        save_npz(str(tmp_path / 'run.npz'), {METADATA_KEY: np.zeros(2)})
+
+
+def test_json_compatibility(tmp_path):
+    json_path = str(tmp_path / 'final_trajectory.json')
+    # Legacy files may have padded keys
+    with open(json_path, 'w') as json_file:
+        json.dump({' trajectory': run()['target'].tolist(), 't': run()['t'].tolist()}, json_file)
+    arrays, metadata = load_run(convert_json(json_path))
+    np.testing.assert_array_equal(arrays['trajectory'], run()['target'])
+    assert metadata['source'] == 'final_trajectory.json'
+
+    export_path = str(tmp_path / 'export.json')
+    export_json(export_path, arrays)
+    exported, _ = load_run(export_path)
+    np.testing.assert_array_equal(exported['trajectory'], arrays['trajectory'])
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.ball_balancer import BBEnv, BBEnvPid, BBVecEnv, BBVecEnvPid
+
+N_ENVS = 3
+
+
+@pytest.mark.parametrize('env_class, vec_env_class', [(BBEnv, BBVecEnv), (BBEnvPid, BBVecEnvPid)])
+def test_vec_env_matches_scalar_envs(env_class, vec_env_class):
+    rng = np.random.default_rng(0)
+    vec_env = vec_env_class(N_ENVS)
+    envs = [env_class() for _ in range(N_ENVS)]
+    vec_env.seed(0)
+    vec_env.genetic_initial_state = vec_env.state_space.sample()
+    vec_env.genetic_reset()
+    for env in envs:
+        env.genetic_initial_state = vec_env.genetic_initial_state
+        env.genetic_reset()
+
+    # Before the first target jump
+    for _ in range(vec_env.target_jump_iters[0] - 1):
+        actions = rng.uniform(vec_env.action_space.low, vec_env.action_space.high, (N_ENVS,) +
+                              vec_env.action_space.shape)
+        observations, rewards, dones, _ = vec_env.step(actions)
+        for i, env in enumerate(envs):
+            observation, reward, done, _ = env.step(actions[i])
+            # Both keep the observation in float32, the differenced terms carry its rounding
+            np.testing.assert_allclose(observations[i], observation, rtol=1e-5, atol=1e-4)
+            np.testing.assert_allclose(rewards[i], reward, rtol=1e-5, atol=1e-6)
+            assert dones[i] == done
+
+
+def test_finished_environements_are_reset():
+    vec_env = BBVecEnv(N_ENVS)
+    vec_env.seed(0)
+    vec_env.reset()
+    vec_env.iter[1] = vec_env.max_iter - 1
+    observations, _, dones, info = vec_env.step(np.zeros((N_ENVS, 2)))
+    assert dones.tolist() == [False, True, False]
+    assert vec_env.iter.tolist() == [1, 0, 1]
+    # The last observation of the finished episode is kept, the returned one is the first of the next episode
+    assert not np.array_equal(info['terminal_observation'][1], observations[1])
+    np.testing.assert_array_equal(info['terminal_observation'][[0, 2]], observations[[0, 2]])
+
+
+def test_reset_mask():
+    vec_env = BBVecEnv(N_ENVS)
+    vec_env.seed(0)
+    vec_env.reset()
+    for _ in range(5):
+        vec_env.step(np.full((N_ENVS, 2), 0.5))
+    ball_x = vec_env.ball_x.copy()
+    vec_env.reset(np.array([True, False, False]))
+    assert vec_env.iter.tolist() == [0, 5, 5]
+    np.testing.assert_array_equal(vec_env.ball_x[1:], ball_x[1:])
+    assert not vec_env.motor_angle[0].any() and vec_env.motor_angle[1:].all()
@@ -0,0 +1,64 @@
+import numpy as np
+
+from src.ball_balancer import BBEnv, BBVecEnv
+
+N_ENVS = 4
+N_STEPS = 350
+
+
+def rollout(env: BBVecEnv, seed: int) -> np.ndarray:
+    env.seed(seed)
+    observations = [env.reset()]
+    actions = np.full((env.n_envs, 2), 0.1)
+    for _ in range(N_STEPS):
+        observations.append(env.step(actions)[0])
+    return np.array(observations)
+
+
+def test_seeded_rollouts_are_reproducible():
+    env = BBVecEnv(N_ENVS)
+    reference = rollout(env, 0)
+    # The second episode starts from a filter left by the first one
+    np.testing.assert_array_equal(rollout(env, 0), reference)
+    np.testing.assert_array_equal(rollout(BBVecEnv(N_ENVS), 0), reference)
+
+
+def test_seed_leaves_the_global_generator_alone():
+    np.random.seed(1)
+    state = np.random.get_state()
+    rollout(BBVecEnv(N_ENVS), 0)
+    after = np.random.get_state()
+    assert state[0] == after[0] and np.array_equal(state[1], after[1]) and state[2:] == after[2:]
+
+
+def test_target_jumps_of_an_environement_do_not_depend_on_the_others():
+    env = BBVecEnv(N_ENVS)
+    env.seed(0)
+    env.genetic_reset()
+    env.iter[:] = 100
+    env.iter[2] = env.target_jump_iters[0]
+    env.jump_targets()
+    alone = env.target[2, 0]
+
+    env.seed(0)
+    env.genetic_reset()
+    env.iter[:] = env.target_jump_iters[0]
+    env.jump_targets()
+    assert env.target[2, 0] == alone
+    assert len(np.unique(env.target[:, 0])) == N_ENVS
+
+
+def test_shared_seed_gives_every_environement_the_scalar_jumps():
+    env = BBVecEnv(N_ENVS)
+    env.seed(0, shared=True)
+    env.genetic_reset()
+    scalar_env = BBEnv()
+    scalar_env.seed(0)
+    scalar_env.genetic_initial_state = env.genetic_initial_state
+    scalar_env.genetic_reset()
+    for _ in range(max(env.target_jump_iters) + 1):
+        env.step(np.zeros((N_ENVS, 2)))
+        scalar_env.step(np.zeros(2))
+    # Both targets jumped, to the same positions in every environement
+    assert not np.array_equal(env.target[0], env.genetic_initial_state[0])
+    np.testing.assert_array_equal(env.target, np.tile(scalar_env.state[0], (N_ENVS, 1)))